@@ -1,7 +1,23 @@
 """Node 7: CICDMonitorAgent — Poll GitHub Actions and record CI/CD results."""
 
+import os
 from datetime import datetime, timezone
-from tools.github_api_tools import poll_workflow_status
+from tools.github_api_tools import default_poll_schedule, parse_poll_schedule, poll_workflow_status
+from tools.run_tokens import get_run_token
+
+# Seconds one monitor_cicd call keeps polling before recording PENDING. The poll
+# schedule only spaces the polls inside this budget; HEALOPS_POLL_TIMEOUT raises it
+# for runs that should wait for CI to finish (pair it with HEALOPS_POLL_SCHEDULE).
+DEFAULT_POLL_TIMEOUT = 10.0
+
+
+def _poll_timeout() -> float:
+    """HEALOPS_POLL_TIMEOUT in seconds; DEFAULT_POLL_TIMEOUT when unset or invalid."""
+    try:
+        timeout = float(os.environ.get("HEALOPS_POLL_TIMEOUT", ""))
+    except ValueError:
+        return DEFAULT_POLL_TIMEOUT
+    return timeout if timeout > 0 else DEFAULT_POLL_TIMEOUT
 
 
 def cicd_monitor_node(state: dict) -> dict:
@@ -12,34 +28,44 @@ def cicd_monitor_node(state: dict) -> dict:
     # Use effective_repo_url (fork if forked, otherwise original)
     github_url = state.get("effective_repo_url") or state["github_url"]
     branch_name = state["branch_name"]
-    github_token = state.get("github_token", "")
+    github_token = get_run_token(state["run_id"])  # kept out of checkpointed state
     iteration = state.get("iteration", 1)
-    ci_cd_timeline = list(state.get("ci_cd_timeline", []))
+    ci_cd_cache = dict(state.get("ci_cd_cache", {}))
+
+    # HEALOPS_POLL_SCHEDULE="3,5,8,13,20,30" overrides the adaptive back-off
+    poll_schedule = parse_poll_schedule(os.environ.get("HEALOPS_POLL_SCHEDULE", "")) or default_poll_schedule()
 
     print(f"[AGENT] monitoring CI/CD for iteration {iteration}...")
 
-    result = poll_workflow_status(github_url, branch_name, github_token=github_token, timeout=10, poll_interval=5)
+    result = poll_workflow_status(
+        github_url,
+        branch_name,
+        github_token=github_token,
+        timeout=_poll_timeout(),
+        poll_schedule=poll_schedule,
+        cache=ci_cd_cache,
+    )
 
     ci_status = result["status"]  # PASSED | FAILED | TIMEOUT | SKIPPED
     if ci_status == "TIMEOUT":
         ci_status = "PENDING"
     # SKIPPED = repo has no GitHub Actions — record as-is (not FAILED)
 
-    ci_cd_timeline.append({
+    # Delta only — the ci_cd_timeline reducer appends it
+    ci_cd_timeline = [{
         "iteration": iteration,
         "status": ci_status,
         "timestamp": datetime.now(timezone.utc).isoformat(),
-    })
+    }]
 
     print(f"[AGENT] CI/CD iteration {iteration}: {ci_status}")
 
-    logs = list(state.get("logs", []))
-    logs.append(f"CI/CD pipeline check {iteration}: {ci_status}")
+    logs = [f"CI/CD pipeline check {iteration}: {ci_status}"]
 
     return {
-        **state,
         "ci_cd_status": ci_status,
         "ci_cd_timeline": ci_cd_timeline,
+        "ci_cd_cache": ci_cd_cache,
         "current_step": "Monitoring CI/CD...",
         "logs": logs,
     }
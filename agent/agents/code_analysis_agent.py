@@ -1,8 +1,16 @@
 """Node 4: CodeAnalysisAgent — Parse failures and identify files, lines, and bug types."""
 
+import asyncio
+import functools
+import hashlib
 import os
 import re
-from tools.openrouter_tools import analyze_error
+import subprocess
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from agents.fix_generator_agent import read_text, seed_fix_cache
+from tools.openrouter_tools import FOCUS_CONTEXT_LINES, analyze_and_fix, analyze_error_async, analyze_errors_batch
 
 # Files that are typically config/environment — Gemini can't fix these
 UNFIXABLE_PATTERNS = {
@@ -20,9 +28,57 @@ UNFIXABLE_PATTERNS = {
     "tsconfig.json", "tsconfig.node.json",
 }
 
+# Upper bound on concurrent analyze_error calls — keeps us under provider rate limits
+MAX_CONCURRENT_ANALYSES = 5
+
+# Files at most this long get one fused analyze+fix call instead of analysis now
+# and a fix call later — the fix prompt would carry the whole file anyway
+FUSED_FIX_MAX_LINES = 2 * FOCUS_CONTEXT_LINES + 1
+
 # Substrings in file paths that indicate config/env files
 UNFIXABLE_PATH_HINTS = ["migrations/", "apps.py", "admin.py"]
 
+# Hot-path forms of the above: frozenset membership and one regex pass over the path
+_UNFIXABLE_PATTERNS = frozenset(UNFIXABLE_PATTERNS)
+_HINT_RE = re.compile(r"migrations/|(?:^|/)apps\.py$|(?:^|/)admin\.py$")
+
+# File references in tracebacks, matched in a single pass:
+#   py — "File 'path/to/file.py', line X" (Python)
+#   js — "at ... (path/to/file.js:line:col)" (JS/TS)
+_FILE_RE = re.compile(
+    r"File ['\"](?P<py>[^'\"]+?)['\"],\s*line\s*\d+"
+    r"|at\s+.*?\((?P<js>[^)]+?):\d+:\d+\)"
+)
+
+# Generic source-path detection. A regex like [\w/.-]+\.(?:py|js) backtracks
+# quadratically on long dotted/slashed runs with no extension, so instead the
+# output is split into path-character tokens (linear) and each token is checked
+# by suffix.
+_PATH_TOKEN_SPLIT = re.compile(r"[^\w/\\.-]+")
+SOURCE_EXTENSIONS = (".py", ".js", ".ts", ".jsx", ".tsx")
+
+# Test files by path, case-insensitively and without lowercased copies:
+# a basename starting with "test", a test/spec suffix, or a test(s)/ directory
+_TEST_PATH_RE = re.compile(
+    r"(?:^|[/\\])test[^/\\]*$"
+    r"|(?:_test\.py|\.test\.js|\.spec\.js|\.test\.ts|\.spec\.ts)$"
+    r"|tests?/",
+    re.IGNORECASE,
+)
+
+# Tracebacks rarely need more than this to locate the failing files
+MAX_SCANNED_OUTPUT = 8192
+
+# Source read cap per failing file — analysis prompts use far less than this
+MAX_SOURCE_CHARS = 65536
+
+# Fallback source-file guesses, keyed on (repo_path, HEAD sha), least recently used
+# first. Every run clones into a fresh path, so the cap keeps a long-lived server
+# from holding one entry per run ever served; finalize also drops its run's entries.
+WALK_CACHE_MAX_ENTRIES = 256
+_WALK_CACHE: OrderedDict[tuple[str, str], list[str]] = OrderedDict()
+_walk_cache_lock = threading.Lock()
+
 # Signals that indicate a pytest COLLECTION or CONFIG failure where pytest itself
 # crashed before running ANY tests. When any are present AND exit class is
 # COLLECTION_ERROR/NO_TESTS_COLLECTED, route to config fix instead of code fix.
@@ -37,19 +93,19 @@ CONFIG_FAULT_SIGNALS = [
     "collected 0 items",
 ]
 
+# All signals in one case-insensitive alternation — one pass, no lowercased copy of the output
+_CONFIG_FAULT_RE = re.compile("|".join(map(re.escape, CONFIG_FAULT_SIGNALS)), re.IGNORECASE)
+
 
 def _is_config_fault(error_output: str) -> bool:
     """Return True when stderr/stdout indicates a config/import issue rather than a code bug."""
-    return any(sig.lower() in error_output.lower() for sig in CONFIG_FAULT_SIGNALS)
+    return _CONFIG_FAULT_RE.search(error_output) is not None
 
 
 def _is_unfixable(file_path: str) -> bool:
     """Return True if a file is likely a config/environment file that Gemini can't fix."""
-    basename = os.path.basename(file_path)
-    if basename in UNFIXABLE_PATTERNS:
-        return True
     normalized = file_path.replace("\\", "/")
-    return any(hint in normalized for hint in UNFIXABLE_PATH_HINTS)
+    return os.path.basename(normalized) in _UNFIXABLE_PATTERNS or bool(_HINT_RE.search(normalized))
 
 
 def code_analysis_node(state: dict) -> dict:
@@ -69,11 +125,10 @@ def code_analysis_node(state: dict) -> dict:
     # — any ImportError/ModuleNotFoundError in stderr is from test code (fixable
     #   by Gemini), NOT from missing config.  Do NOT skip analysis in that case.
     if exit_class in ("COLLECTION_ERROR", "NO_TESTS_COLLECTED"):
-        logs = list(state.get("logs", []))
+        logs = []
         logs.append(f"Config issue detected — skipping code analysis (cause: {exit_class})")
         print(f"[AGENT] analyzing failures — config fault ({exit_class}), returning 0 failures")
         return {
-            **state,
             "failures": [],
             "current_step": "Config/collection fault detected — no code fix possible",
             "logs": logs,
@@ -81,25 +136,28 @@ def code_analysis_node(state: dict) -> dict:
     # ────────────────────────────────────────────────────────────────────────
 
 
-    failures = []
+    pending = []  # (file_path, full_path, error_output) — analyzed concurrently below
     skipped_count = 0
 
+    # Deduplicate across ALL results: the same file with an identical traceback is
+    # analyzed once, while distinct errors on the same file are still analyzed
+    seen_files = set()
+
     for result in test_results:
         if result["passed"]:
             continue
 
         # Combine stdout and stderr for analysis
         error_output = f"{result.get('stdout', '')}\\n{result.get('stderr', '')}"
+        error_signature = hashlib.blake2b(error_output.encode(errors="replace"), digest_size=8).hexdigest()
 
         # Try to extract failing files from the error output
-        failing_files = _extract_failing_files(error_output, repo_path)
+        failing_files = _extract_failing_files(error_output[:MAX_SCANNED_OUTPUT], repo_path)
 
-        # Deduplicate: track files already processed in this iteration
-        seen_files = set()
         for file_path in failing_files:
-            if file_path in seen_files:
+            if (file_path, error_signature) in seen_files:
                 continue
-            seen_files.add(file_path)
+            seen_files.add((file_path, error_signature))
 
             # Skip unfixable config/environment files
             if _is_unfixable(file_path):
@@ -109,87 +167,234 @@ def code_analysis_node(state: dict) -> dict:
 
             full_path = os.path.join(repo_path, file_path)
             if os.path.exists(full_path):
-                with open(full_path, "r", errors="replace") as f:
-                    file_content = f.read()
-
-                analysis = analyze_error(error_output, file_content)
-                failures.append({
-                    "file": file_path,
-                    "line_number": analysis.get("line_number", 1),
-                    "bug_type": analysis.get("bug_type", "LOGIC"),
-                    "error_message": analysis.get("description", "Unknown error"),
-                    "fix_instruction": analysis.get("fix_instruction", ""),
-                    "error_output": error_output[:2000],
-                })
+                pending.append((file_path, full_path, error_output))
+
+    # is_retry of the fix each file's first failure would get (None: don't fuse) —
+    # later failures on a file are fixed against the earlier fix, not this content
+    iteration = state.get("iteration", 1)
+    no_diff_counts = state.get("no_diff_counts", {})
+    files_failed_before = set(state.get("files_failed_before", []))
+    fuse_retry = []
+    for file_path, _, _ in pending:
+        first = file_path not in files_failed_before
+        files_failed_before.add(file_path)  # local copy: marks the file as seen
+        fuse_retry.append(iteration > 1 or no_diff_counts.get(file_path, 0) > 0 if first else None)
+
+    analyses, contents, fixes = _analyze_pending(pending, fuse_retry) if pending else ([], [], [])
+
+    failures = []
+    seeded = 0
+    for (file_path, _, error_output), analysis, content, fixed, is_retry in zip(
+        pending, analyses, contents, fixes, fuse_retry
+    ):
+        if isinstance(analysis, BaseException):
+            print(f"[AGENT] analysis failed for {file_path}: {analysis}")
+            analysis = {}
+        failures.append({
+            "file": file_path,
+            "line_number": analysis.get("line_number", 1),
+            "bug_type": analysis.get("bug_type", "LOGIC"),
+            "error_message": analysis.get("description", "Unknown error"),
+            "fix_instruction": analysis.get("fix_instruction", ""),
+            "error_output": error_output[:2000],
+        })
+        if fixed and seed_fix_cache(failures[-1], content, is_retry, fixed, state.get("run_id", "")):
+            seeded += 1
 
     print(f"[AGENT] analyzing failures — {len(failures)} fixable, {skipped_count} config files skipped")
 
-    logs = list(state.get("logs", []))
+    logs = []
     if skipped_count:
         logs.append(f"Skipped {skipped_count} config file(s) — AI cannot edit these")
     logs.append(f"Found {len(failures)} issue(s) to fix")
+    if seeded:
+        print(f"[AGENT] {seeded} fix(es) generated together with their analysis")
 
     return {
-        **state,
         "failures": failures,
         "current_step": "Analyzing failures...",
         "logs": logs,
     }
 
 
+def _read_source(full_path: str) -> str:
+    """At most MAX_SOURCE_CHARS characters of a source file — prompts truncate far below that.
+
+    Decoded by the fix node's own read_text (no newline translation), so an
+    untruncated file seeds the exact fix-cache key the fix node looks up.
+    """
+    return read_text(full_path)[:MAX_SOURCE_CHARS]
+
+
+def _read_sources(pending: list) -> list[str]:
+    """Read every pending file's contents in a thread pool, in input order."""
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        return list(ex.map(lambda item: _read_source(item[1]), pending))
+
+
+def _analyze_pending(pending: list, fuse_retry: list) -> tuple[list, list[str], list[str]]:
+    """Analyze all pending failures — one batched request first, per-failure calls for the rest.
+
+    Per-failure calls on small files (fuse_retry not None) also generate the fix in
+    the same request — never for a file cut at MAX_SOURCE_CHARS, whose fix could
+    not be seeded under the fix node's key. Returns (analyses, file contents, fixed contents or "").
+    """
+    contents = _read_sources(pending)
+    analyses = [None] * len(pending)
+    fixes = [""] * len(pending)
+    if len(pending) > 1:
+        analyses = analyze_errors_batch([
+            {"file": file_path, "error": error_output, "content": content}
+            for (file_path, _, error_output), content in zip(pending, contents)
+        ])
+
+    missing = [i for i, analysis in enumerate(analyses) if analysis is None]
+    if missing:
+        if len(pending) > 1:
+            print(f"[AGENT] batch analysis missed {len(missing)} failure(s) — analyzing individually")
+        fuse = [
+            fuse_retry[i] if len(contents[i]) < MAX_SOURCE_CHARS and contents[i].count("\n") < FUSED_FIX_MAX_LINES
+            else None
+            for i in missing
+        ]
+        retried = asyncio.run(_analyze_all(
+            [pending[i] for i in missing], [contents[i] for i in missing], fuse,
+        ))
+        for i, result in zip(missing, retried):
+            if isinstance(result, tuple):
+                analyses[i], fixes[i] = result
+            else:
+                analyses[i] = result
+    return analyses, contents, fixes
+
+
+async def _analyze_all(pending: list, contents: list[str], fuse_retry: list) -> list:
+    """Run analyze_error_async for every (file_path, full_path, error_output) concurrently.
+
+    Entries with a fuse_retry flag go through analyze_and_fix instead and yield an
+    (analysis, fixed_content) tuple. Results come back in input order; a failed
+    call yields its exception instead of a dict.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+
+    async def _analyze_one(error_output: str, file_content: str, is_retry) -> dict | tuple:
+        async with semaphore:
+            if is_retry is None:
+                return await analyze_error_async(error_output, file_content)
+            return await asyncio.to_thread(analyze_and_fix, file_content, error_output, is_retry)
+
+    return await asyncio.gather(
+        *(_analyze_one(error_output, file_content, is_retry)
+          for (_, _, error_output), file_content, is_retry in zip(pending, contents, fuse_retry)),
+        return_exceptions=True,
+    )
+
+
+@functools.lru_cache(maxsize=512)
+def _is_valid_source_file(repo_path: str, rel_path: str) -> bool:
+    """Return True if rel_path exists in the repo and is not a test file.
+
+    Cached: the same paths repeat across every failing test's traceback.
+    """
+    if rel_path.startswith(".."): return False
+    if not os.path.exists(os.path.join(repo_path, rel_path)): return False
+    return _TEST_PATH_RE.search(rel_path) is None
+
+
 def _extract_failing_files(error_output: str, repo_path: str) -> list[str]:
     """Extract file paths from error output using pattern matching."""
     files = set()
 
-    def _is_valid_source_file(rel_path: str) -> bool:
-        if rel_path.startswith(".."): return False
-        if not os.path.exists(os.path.join(repo_path, rel_path)): return False
-        name = os.path.basename(rel_path).lower()
-        if name.startswith("test") or name.endswith(("_test.py", ".test.js", ".spec.js", ".test.ts", ".spec.ts")):
-            return False
-        if "tests/" in rel_path.lower() or "test/" in rel_path.lower():
-            return False
-        return True
-
-    # Common patterns: "File 'path/to/file.py', line X" (Python)
-    py_pattern = re.findall(r"File ['\"](.+?)['\"],\s*line\s*\d+", error_output)
-    for match in py_pattern:
-        rel = os.path.relpath(match, repo_path) if os.path.isabs(match) else match
-        if _is_valid_source_file(rel):
-            files.add(rel)
-
-    # JS/TS patterns: "at ... (path/to/file.js:line:col)"
-    js_pattern = re.findall(r"at\s+.*?\((.+?):\d+:\d+\)", error_output)
-    for match in js_pattern:
+    for m in _FILE_RE.finditer(error_output):
+        match = m.group("py") or m.group("js")
         rel = os.path.relpath(match, repo_path) if os.path.isabs(match) else match
-        if _is_valid_source_file(rel):
+        if _is_valid_source_file(repo_path, rel):
             files.add(rel)
 
     # Generic: look for file extensions
-    generic = re.findall(r"([\w/\\.-]+\.(?:py|js|ts|jsx|tsx))", error_output)
-    for match in generic:
-        rel = match.replace("\\", "/")
-        if _is_valid_source_file(rel):
-            files.add(rel)
+    for token in _PATH_TOKEN_SPLIT.split(error_output):
+        token = token.rstrip(".")
+        if token.endswith(SOURCE_EXTENSIONS):
+            rel = os.path.relpath(token, repo_path) if os.path.isabs(token) else token.replace("\\", "/")
+            if _is_valid_source_file(repo_path, rel):
+                files.add(rel)
 
     return list(files) if files else _guess_source_files(repo_path)
 
 
+def _git_head(repo_path: str) -> str:
+    """Return the HEAD commit sha of repo_path, or '' if it cannot be read."""
+    try:
+        return subprocess.check_output(
+            ["git", "-C", repo_path, "rev-parse", "HEAD"],
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def invalidate_walk_cache(repo_path: str) -> None:
+    """Drop cached source-file guesses for repo_path (call after committing or cleanup)."""
+    with _walk_cache_lock:
+        for key in [k for k in _WALK_CACHE if k[0] == repo_path]:
+            del _WALK_CACHE[key]
+
+
 def _guess_source_files(repo_path: str) -> list[str]:
-    """Fallback: return main source files if we can't parse the error."""
+    """Fallback: return main source files if we can't parse the error.
+
+    The result is memoized per (repo_path, HEAD) — the tree rarely changes
+    between code-analysis calls of the same healing loop.
+    """
+    head = _git_head(repo_path)
+    cache_key = (repo_path, head)
+    if head:
+        with _walk_cache_lock:
+            cached = _WALK_CACHE.get(cache_key)
+            if cached is not None:
+                _WALK_CACHE.move_to_end(cache_key)
+                return list(cached)
+
+    src_files = _scan_source_files(repo_path)
+    if head:
+        with _walk_cache_lock:
+            _WALK_CACHE[cache_key] = src_files
+            while len(_WALK_CACHE) > WALK_CACHE_MAX_ENTRIES:
+                _WALK_CACHE.popitem(last=False)
+    return list(src_files)
+
+
+def _scan_source_files(repo_path: str, limit: int = 5) -> list[str]:
+    """Collect up to `limit` non-test, non-config source files, breadth-first via os.scandir.
+
+    Shallow files are found first and test directories are never entered, so the
+    scan usually stops after a handful of directory listings.
+    """
     src_files = []
     skip_dirs = {"node_modules", ".git", "__pycache__", ".venv", "venv", "dist", "build", ".next"}
-    for root, dirs, files in os.walk(repo_path):
-        dirs[:] = [d for d in dirs if d not in skip_dirs]
-        for f in files:
+    pending = deque([repo_path])
+    while pending:
+        current = pending.popleft()
+        try:
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        for entry in entries:
+            # DirEntry caches the d_type from the directory listing — no extra stat
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in skip_dirs and "test" not in entry.name.lower():
+                    pending.append(entry.path)
+                continue
+            f = entry.name
             # Skip test files, declaration files, and all known config files
             if f.startswith("test") or f.endswith(".d.ts"):
                 continue
-            if f in UNFIXABLE_PATTERNS:
+            if f in _UNFIXABLE_PATTERNS:
                 continue
-            if f.endswith((".py", ".js", ".ts", ".jsx", ".tsx")):
-                rel = os.path.relpath(os.path.join(root, f), repo_path)
-                src_files.append(rel)
-                if len(src_files) >= 5:
+            if f.endswith(SOURCE_EXTENSIONS):
+                src_files.append(os.path.relpath(entry.path, repo_path))
+                if len(src_files) >= limit:
                     return src_files
     return src_files
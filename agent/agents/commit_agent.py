@@ -1,5 +1,6 @@
 """Node 6: CommitAgent — Commit fixes and push to the branch."""
 
+from agents.code_analysis_agent import invalidate_walk_cache
 from tools.git_tools import commit_and_push
 
 
@@ -24,6 +25,18 @@ def commit_node(state: dict) -> dict:
     if not base_message:
         base_message = "[AI-AGENT] chore: Add Tests and Fixes"
 
+    # Nothing was fixed or generated — skip the git subprocesses entirely
+    if fix_count == 0 and gen_count == 0 and not state.get("config_fix_changed"):
+        print(f"[AGENT] nothing to commit — no fixes applied")
+        logs = []
+        logs.append("Nothing new to commit")
+        return {
+            "commit_count": commit_count,
+            "push_succeeded": False,
+            "current_step": "No changes to commit",
+            "logs": logs,
+        }
+
     commit_message = f"{base_message} - Locally verified ({gen_count} tests generated, {fix_count} fixes applied)"
 
     try:
@@ -32,16 +45,16 @@ def commit_node(state: dict) -> dict:
 
         if pushed:
             commit_count += 1
+            invalidate_walk_cache(repo_path)
             print(f"[AGENT] pushed successfully")
-            logs = list(state.get("logs", []))
+            logs = []
             logs.append(f"Changes pushed to GitHub ({gen_count} test(s), {fix_count} fix(es) applied)")
         else:
             print(f"[AGENT] nothing to commit")
-            logs = list(state.get("logs", []))
+            logs = []
             logs.append("Nothing new to commit")
 
         return {
-            **state,
             "commit_count": commit_count,
             "push_succeeded": pushed,
             "current_step": "Pushing verified fixes to GitHub...",
@@ -52,11 +65,10 @@ def commit_node(state: dict) -> dict:
         error_str = str(e)
         print(f"[AGENT] push failed: {error_str}")
 
-        logs = list(state.get("logs", []))
+        logs = []
         logs.append(f"✗ Push failed: {error_str.splitlines()[0][:100]}")
 
         return {
-            **state,
             "commit_count": commit_count,
             "push_succeeded": False,
             "current_step": "Push failed (auth/network error)",
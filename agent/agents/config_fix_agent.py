@@ -12,8 +12,7 @@ The node marks all written paths in fixes_applied so commit_agent picks them up.
 """
 
 import os
-import subprocess
-import sys
+from dataclasses import dataclass
 
 
 # ─── Templates ────────────────────────────────────────────────────────────────
@@ -65,32 +64,51 @@ TEST_DEPS = ["pytest>=7.0", "pytest-django>=4.5"]
 
 # ─── Helpers ──────────────────────────────────────────────────────────────────
 
-def _find_settings_module(repo_path: str) -> str:
-    """Infer the DJANGO_SETTINGS_MODULE from the repo layout.
+@dataclass(slots=True)
+class RepoLayout:
+    """Top-level repo facts needed by config_fix_node, gathered in one scan."""
+    settings_module: str = "config.settings"  # fallback guess when no settings.py is found
+    django_app: str = "app"
+    django_module: str = "app"
+    has_requirements: bool = False
 
-    Looks for a settings.py one level deep (e.g. HostelPal/settings.py)
-    and converts the path to dotted notation (HostelPal.settings).
-    Falls back to 'config.settings' then 'settings' if nothing found.
+
+def _scan_repo_layout(repo_path: str) -> RepoLayout:
+    """Single os.scandir pass over the repo root.
+
+    Finds the DJANGO_SETTINGS_MODULE (a settings.py one level deep, e.g.
+    HostelPal/settings.py -> HostelPal.settings), the first Django app (a
+    directory containing both __init__.py and models.py), and whether
+    requirements.txt exists.
     """
-    for entry in os.listdir(repo_path):
-        pkg_dir = os.path.join(repo_path, entry)
-        if not os.path.isdir(pkg_dir):
-            continue
-        if os.path.exists(os.path.join(pkg_dir, "settings.py")):
-            return f"{entry}.settings"
-    # Fallback guesses
-    for fallback in ("config.settings", "settings"):
-        return fallback
-    return "settings"
-
-
-def _patch_requirements(repo_path: str) -> bool:
+    layout = RepoLayout()
+    found_settings = found_app = False
+    with os.scandir(repo_path) as it:
+        for entry in it:
+            # DirEntry caches the type from the listing — no extra stat per entry
+            if entry.is_dir(follow_symlinks=False):
+                if not found_settings and os.path.exists(os.path.join(entry.path, "settings.py")):
+                    layout.settings_module = f"{entry.name}.settings"
+                    found_settings = True
+                if (
+                    not found_app
+                    and os.path.exists(os.path.join(entry.path, "__init__.py"))
+                    and os.path.exists(os.path.join(entry.path, "models.py"))
+                ):
+                    layout.django_app = layout.django_module = entry.name
+                    found_app = True
+            elif entry.name == "requirements.txt":
+                layout.has_requirements = True
+    return layout
+
+
+def _patch_requirements(repo_path: str, layout: RepoLayout) -> bool:
     """Add pytest and pytest-django to requirements.txt if missing.
 
     Returns True if the file was modified.
     """
     req_path = os.path.join(repo_path, "requirements.txt")
-    if not os.path.exists(req_path):
+    if not layout.has_requirements:
         with open(req_path, "w", encoding="utf-8") as f:
             f.write("\n".join(TEST_DEPS) + "\n")
         return True
@@ -108,36 +126,6 @@ def _patch_requirements(repo_path: str) -> bool:
     return True
 
 
-def _find_django_app(repo_path: str) -> tuple[str, str]:
-    """Return (app_name, dotted_module) for the first Django app found.
-
-    A Django app is a directory containing both __init__.py and models.py.
-    Returns ('Home', 'Home') for a typical flat-layout project.
-    """
-    for entry in os.listdir(repo_path):
-        app_dir = os.path.join(repo_path, entry)
-        if (
-            os.path.isdir(app_dir)
-            and os.path.exists(os.path.join(app_dir, "__init__.py"))
-            and os.path.exists(os.path.join(app_dir, "models.py"))
-        ):
-            return entry, entry
-    return "app", "app"
-
-
-def _install_test_deps(repo_path: str) -> None:
-    """pip-install the test deps right now so the next pytest run succeeds."""
-    try:
-        subprocess.run(
-            [sys.executable, "-m", "pip", "install"] + TEST_DEPS,
-            cwd=repo_path,
-            capture_output=True,
-            timeout=120,
-        )
-    except Exception:
-        pass  # Non-fatal; requirements.txt patch will handle it in the next dep-install step
-
-
 # ─── Main node ────────────────────────────────────────────────────────────────
 
 def config_fix_node(state: dict) -> dict:
@@ -151,12 +139,13 @@ def config_fix_node(state: dict) -> dict:
     repo_path = state["repo_local_path"]
     exit_class = state.get("test_exit_class", "")
     fixes_applied = list(state.get("fixes_applied", []))
-    logs = list(state.get("logs", []))
+    logs = []
 
     created_files = []
+    layout = _scan_repo_layout(repo_path)
 
     # ── 1. Detect Django settings module ─────────────────────────────────────
-    settings_module = _find_settings_module(repo_path)
+    settings_module = layout.settings_module
     print(f"[AGENT] detected settings module: {settings_module}")
 
     # ── 2. Write pytest.ini ───────────────────────────────────────────────────
@@ -180,7 +169,7 @@ def config_fix_node(state: dict) -> dict:
         print(f"[AGENT] ℹ pytest.ini already exists")
 
     # ── 3. Patch requirements.txt ─────────────────────────────────────────────
-    if _patch_requirements(repo_path):
+    if _patch_requirements(repo_path, layout):
         created_files.append("requirements.txt")
         fixes_applied.append({
             "file": "requirements.txt",
@@ -194,7 +183,7 @@ def config_fix_node(state: dict) -> dict:
 
     # ── 4. Scaffold a minimal test file if NO_TESTS_COLLECTED ─────────────────
     if exit_class == "NO_TESTS_COLLECTED":
-        app_name, app_module = _find_django_app(repo_path)
+        app_name, app_module = layout.django_app, layout.django_module
         tests_path = os.path.join(repo_path, app_name, "tests.py")
         # Only write if the file is empty / stub (< 200 bytes)
         needs_scaffold = (
@@ -222,9 +211,6 @@ def config_fix_node(state: dict) -> dict:
         else:
             logs.append(f"Tests already exist in {app_name}/tests.py")
 
-    # ── 5. pip-install the new deps immediately (best-effort) ─────────────────
-    _install_test_deps(repo_path)
-
     # ── Summary ───────────────────────────────────────────────────────────────
     changed = len(created_files) > 0
     if changed:
@@ -235,9 +221,8 @@ def config_fix_node(state: dict) -> dict:
         print(f"[AGENT] ⚠ nothing new to write — will finalize")
 
     return {
-        **state,
         "fixes_applied": fixes_applied,
-        "config_fix_changed": changed,  # consumed by _after_config_fix in agent_graph
+        "config_fix_changed": changed,  # lets commit_node push config-only changes
         "current_step": "Applying config fix...",
         "logs": logs,
     }
@@ -23,14 +23,13 @@ def dep_install_node(state: dict) -> dict:
     else:
         print(f"[AGENT] ✗ Install failed: {message}")
 
-    logs = list(state.get("logs", []))
+    logs = []
     if installed:
         logs.append(f"Dependencies installed ({result['framework']})")
     elif result["framework"] != "none":
         logs.append(f"Dependency install failed — check requirements file")
 
     return {
-        **state,
         "current_step": "Installing dependencies...",
         "logs": logs,
     }
@@ -1,20 +1,37 @@
 """Node 5: FixGeneratorAgent — Use Gemini to generate targeted code fixes."""
 
+import asyncio
 import os
-from tools.openrouter_tools import generate_fix, generate_targeted_fix
+import stat
+import tempfile
+from pathlib import Path
+from typing import Optional
+from tools.llm_cache import cache_key, get_cached, save_cached, take_stats
+from tools.openrouter_tools import RateLimited, generate_batch_fixes, generate_one_step_fix
+
+# Upper bound on fix requests in flight — keeps us under provider rate limits
+MAX_CONCURRENT_FIXES = 8
+
+# Failures on distinct files sent together in one multi-file fix request
+BATCH_SIZE = 5
+
+# Above this many failures, batches are partitioned by directory so each request
+# carries related files (shared imports/conventions) instead of an arbitrary mix
+PARTITION_THRESHOLD = 30
 
 
 def fix_generator_node(state: dict) -> dict:
     """
-    For each identified failure, generate a TARGETED fix using Gemini AI
-    and apply it to the file. Uses targeted patching first (±10 lines around
-    the error), falling back to full-file fix if targeted fix produces no diff.
+    For each identified failure, generate a fix using Gemini AI and apply it
+    to the file. A single one-step prompt both localizes and repairs the bug,
+    so there is no second full-file round-trip when a targeted patch misses.
 
     Uses a retry counter per file — only blacklists after 2 consecutive
     no-diff attempts.
     """
     repo_path = state["repo_local_path"]
     failures = state.get("failures", [])
+    failure_files = {f["file"] for f in failures}  # built once; reused for the skip count
     fixes_applied = list(state.get("fixes_applied", []))
     files_failed_before = set(state.get("files_failed_before", []))
     iteration = state.get("iteration", 1)
@@ -27,7 +44,10 @@ def fix_generator_node(state: dict) -> dict:
     new_fix_count = 0
     new_failed_files = set()
 
-    for failure in failures:
+    # ── Pass 1: skip/blacklist checks, group the remaining failures per file ──
+    groups: dict[str, list[tuple[int, dict]]] = {}  # file_path → (index, failure), in input order
+    exists: dict[str, bool] = {}  # one stat() per distinct file, however many failures it has
+    for index, failure in enumerate(failures):
         file_path = failure["file"]
 
         # Skip files that are permanently blacklisted
@@ -37,7 +57,9 @@ def fix_generator_node(state: dict) -> dict:
 
         full_path = os.path.join(repo_path, file_path)
 
-        if not os.path.exists(full_path):
+        if file_path not in exists:
+            exists[file_path] = _is_regular_file(full_path)
+        if not exists[file_path]:
             print(f"[AGENT] File not found: {full_path}")
             fixes_applied.append({
                 "file": file_path,
@@ -50,85 +72,36 @@ def fix_generator_node(state: dict) -> dict:
             files_failed_before.add(file_path)
             continue
 
-        # Read the current file content
-        with open(full_path, "r", errors="replace") as f:
-            file_content = f.read()
+        groups.setdefault(file_path, []).append((index, failure))
 
-        # Determine if this is a retry (previous fix was attempted)
+    # ── Pass 2: generate fixes for all files concurrently ─────────────────────
+    # file_path → _fix_cache_key of its last no-diff request; updated by _generate_all
+    file_content_hashes: dict = dict(state.get("file_content_hashes", {}))
+    outcomes = asyncio.run(_generate_all(
+        repo_path, groups, no_diff_counts, iteration, state.get("run_id", ""), file_content_hashes,
+    )) if groups else []
+
+    # ── Pass 3: apply writes and update bookkeeping serially, in input order ──
+    rate_limited_count = 0
+    debug_buf: list[str] = []  # flushed to llm_debug_output.txt once, after the loop
+    for file_path, failure, file_content, fixed_content in outcomes:
+        # An earlier failure on the same file may have just blacklisted it
+        if file_path in files_failed_before:
+            print(f"[AGENT] ⏭ Skipping {file_path} (blacklisted after {MAX_NO_DIFF_RETRIES} failed attempts)")
+            continue
+
+        full_path = os.path.join(repo_path, file_path)
         prior_attempts = no_diff_counts.get(file_path, 0)
-        is_retry = prior_attempts > 0 or iteration > 1
+        line_number = failure.get("line_number", 1)
 
-        # Generate fix using Gemini — try targeted patch first, then full-file fallback
-        try:
-            fixed_content = None
-            line_number = failure.get("line_number", 1)
-            fix_instruction = failure.get("fix_instruction", "")
-
-            # Step 1: Try targeted fix (patch only the failing region)
-            if line_number > 0:
-                print(f"[AGENT] generating targeted fix for {file_path} line {line_number}")
-                fixed_content = generate_targeted_fix(
-                    file_content=file_content,
-                    error_output=failure.get("error_output", ""),
-                    bug_type=failure["bug_type"],
-                    line_number=line_number,
-                    fix_instruction=fix_instruction,
-                )
-
-            # Step 2: Fall back to full-file fix if targeted produced no diff
-            if not fixed_content or fixed_content.strip() == file_content.strip():
-                print(f"[AGENT] targeted fix had no diff, trying full-file fix for {file_path}")
-                fixed_content = generate_fix(
-                    file_content=file_content,
-                    error_output=failure.get("error_output", ""),
-                    bug_type=failure["bug_type"],
-                    line_number=line_number,
-                    is_retry=is_retry,
-                )
-                
-            print("=== LLM OUTPUT ===")
-            print(fixed_content)
-            
-            with open(os.path.join(os.getcwd(), "llm_debug_output.txt"), "a", encoding="utf-8") as debug_file:
-                debug_file.write(f"\n--- TARGET: {file_path} ---\n{fixed_content}\n")
-
-            # Apply the fix
-            if fixed_content and fixed_content.strip() != file_content.strip():
-                with open(full_path, "w", encoding="utf-8") as f:
-                    f.write(fixed_content)
-
-                commit_msg = f"fix: {failure['bug_type'].lower()} issue in {file_path} line {line_number}"
-                fixes_applied.append({
-                    "file": file_path,
-                    "bug_type": failure["bug_type"],
-                    "line_number": line_number,
-                    "commit_message": f"[AI-AGENT] {commit_msg}",
-                    "status": "Fixed",
-                })
-                new_fix_count += 1
-                no_diff_counts[file_path] = 0  # reset on success
-                print(f"[AGENT] ✓ Fixed {file_path} ({failure['bug_type']})")
-            else:
-                # No diff produced — increment retry counter
-                no_diff_counts[file_path] = prior_attempts + 1
-                current_count = no_diff_counts[file_path]
-
-                if current_count >= MAX_NO_DIFF_RETRIES:
-                    # Permanently blacklist after MAX_NO_DIFF_RETRIES
-                    fixes_applied.append({
-                        "file": file_path,
-                        "bug_type": failure["bug_type"],
-                        "line_number": line_number,
-                        "commit_message": f"fix: no change generated for {file_path} after {current_count} attempts",
-                        "status": "Failed",
-                    })
-                    new_failed_files.add(file_path)
-                    files_failed_before.add(file_path)
-                    print(f"[AGENT] ✗ No change for {file_path} after {current_count} attempts — blacklisted")
-                else:
-                    print(f"[AGENT] ⚠ No diff for {file_path} (attempt {current_count}/{MAX_NO_DIFF_RETRIES}) — will retry next iteration")
-
-        except Exception as e:
+        if isinstance(fixed_content, RateLimited):
+            # Provider throttling is not the model's fault — defer without a record or a no-diff strike
+            print(f"[AGENT] ⏸ Deferred {file_path} to the next iteration: {fixed_content}")
+            rate_limited_count += 1
+            continue
+
+        if isinstance(fixed_content, BaseException):
+            e = fixed_content
             fixes_applied.append({
                 "file": file_path,
                 "bug_type": failure["bug_type"],
@@ -138,23 +111,334 @@ def fix_generator_node(state: dict) -> dict:
             })
             # Do NOT blacklist on transient errors (API downtime, bad model ID, etc.)
             print(f"[AGENT] ✗ Transient error for {file_path} (will retry): {e}")
+            continue
+
+        print("=== LLM OUTPUT ===")
+        print(fixed_content)
+
+        debug_buf.append(f"\n--- TARGET: {file_path} ---\n{fixed_content}\n")
+
+        # Apply the fix
+        if fixed_content and fixed_content.strip() != file_content.strip():
+            _write_atomic(full_path, fixed_content)
+
+            commit_msg = f"fix: {failure['bug_type'].lower()} issue in {file_path} line {line_number}"
+            fixes_applied.append({
+                "file": file_path,
+                "bug_type": failure["bug_type"],
+                "line_number": line_number,
+                "commit_message": f"[AI-AGENT] {commit_msg}",
+                "status": "Fixed",
+            })
+            new_fix_count += 1
+            no_diff_counts[file_path] = 0  # reset on success
+            print(f"[AGENT] ✓ Fixed {file_path} ({failure['bug_type']})")
+        else:
+            # No diff produced — increment retry counter
+            no_diff_counts[file_path] = prior_attempts + 1
+            current_count = no_diff_counts[file_path]
+
+            if current_count >= MAX_NO_DIFF_RETRIES:
+                # Permanently blacklist after MAX_NO_DIFF_RETRIES
+                fixes_applied.append({
+                    "file": file_path,
+                    "bug_type": failure["bug_type"],
+                    "line_number": line_number,
+                    "commit_message": f"fix: no change generated for {file_path} after {current_count} attempts",
+                    "status": "Failed",
+                })
+                new_failed_files.add(file_path)
+                files_failed_before.add(file_path)
+                print(f"[AGENT] ✗ No change for {file_path} after {current_count} attempts — blacklisted")
+            else:
+                print(f"[AGENT] ⚠ No diff for {file_path} (attempt {current_count}/{MAX_NO_DIFF_RETRIES}) — will retry next iteration")
 
     # Build log entries
-    logs = list(state.get("logs", []))
-    skipped = len(files_failed_before & {f["file"] for f in failures})
+    logs = []
+    skipped = len(files_failed_before & failure_files)
     if skipped:
         logs.append(f"Skipped {skipped} file(s) — could not be auto-fixed")
     logs.append(f"Fix attempt {iteration}: applied {new_fix_count} patch(es), {len(new_failed_files)} failed")
+    cache_hits, cache_misses = take_stats(state.get("run_id", ""))
+    if cache_hits:
+        logs.append(f"LLM cache: {cache_hits} hit(s), {cache_misses} miss(es)")
+
+    if debug_buf:
+        with open(os.path.join(os.getcwd(), "llm_debug_output.txt"), "a", encoding="utf-8") as debug_file:
+            debug_file.write("".join(debug_buf))
 
     # Merge failed files for future iterations
     all_failed = files_failed_before | new_failed_files
 
     return {
-        **state,
-        "fixes_applied": fixes_applied,
+        "fixes_applied": _compact_failed(fixes_applied),
         "new_fix_count": new_fix_count,
+        "rate_limited_count": rate_limited_count,
         "files_failed_before": list(all_failed),
         "no_diff_counts": no_diff_counts,
+        "file_content_hashes": file_content_hashes,
         "current_step": "Generating fixes...",
         "logs": logs,
     }
+
+
+def _compact_failed(fixes_applied: list) -> list:
+    """Collapse repeated "Failed" records to the latest one per file.
+
+    Each iteration re-records a failed attempt for every stuck file, so the list
+    (carried through every node transition) grows by files × iterations. The
+    latest record keeps its full shape plus an "attempts" count; Fixed/Generated
+    records are real changes and are all kept.
+    """
+    attempts: dict[str, int] = {}
+    last_failed: dict[str, int] = {}
+    for i, entry in enumerate(fixes_applied):
+        if entry.get("status") == "Failed":
+            attempts[entry["file"]] = attempts.get(entry["file"], 0) + entry.get("attempts", 1)
+            last_failed[entry["file"]] = i
+
+    compacted = []
+    for i, entry in enumerate(fixes_applied):
+        if entry.get("status") != "Failed":
+            compacted.append(entry)
+        elif last_failed[entry["file"]] == i:
+            compacted.append(entry | {"attempts": attempts[entry["file"]]})
+    return compacted
+
+
+def _is_regular_file(full_path: str) -> bool:
+    """Single stat(): True only for an existing regular file (a directory can't be fixed or read)."""
+    try:
+        return stat.S_ISREG(os.stat(full_path).st_mode)
+    except OSError:
+        return False
+
+
+def read_text(full_path: str) -> str:
+    """Read a source file as UTF-8; the replacement-char decode runs only for invalid bytes."""
+    raw = Path(full_path).read_bytes()
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("utf-8", errors="replace")
+
+
+def _write_atomic(full_path: str, content: str) -> None:
+    """Write via a temp file in the same directory + os.replace, keeping the file mode —
+    a crash mid-write never leaves a truncated source file behind."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full_path) or ".", suffix=".healops.tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        try:
+            os.chmod(tmp_path, os.stat(full_path).st_mode & 0o7777)
+        except OSError:
+            pass
+        os.replace(tmp_path, full_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _fix_cache_key(failure: dict, file_content: str, is_retry: bool) -> str:
+    """Cache key over every input that shapes a generated fix."""
+    return cache_key(
+        "fix",
+        bug=failure["bug_type"],
+        line=failure.get("line_number", 1),
+        err=failure.get("error_output", ""),
+        instruction=failure.get("fix_instruction", ""),
+        retry=is_retry,
+        content=file_content,
+    )
+
+
+def _generate_fixed_content(failure: dict, file_content: str, is_retry: bool, run_id: str = "") -> str:
+    """One-step localize+repair fix for a single failure.
+
+    Fixes are cached on a hash of every input, so an identical failure on identical
+    content is answered without an API call. Only real changes are cached — a
+    no-diff answer is re-asked next time, since retries rely on a fresh attempt.
+    """
+    file_path = failure["file"]
+    line_number = failure.get("line_number", 1)
+    fix_instruction = failure.get("fix_instruction", "")
+
+    key = _fix_cache_key(failure, file_content, is_retry)
+    cached = get_cached(key, run_id)
+    if cached is not None:
+        print(f"[AGENT] reusing cached fix for {file_path} line {line_number}")
+        return cached
+
+    print(f"[AGENT] generating fix for {file_path} line {line_number}")
+    fixed_content = generate_one_step_fix(
+        file_content=file_content,
+        error_output=failure.get("error_output", ""),
+        bug_type=failure["bug_type"],
+        line_number=line_number,
+        fix_instruction=fix_instruction,
+        is_retry=is_retry,
+    )
+
+    if fixed_content and fixed_content.strip() != file_content.strip():
+        save_cached(key, fixed_content, run_id)
+    return fixed_content
+
+
+def seed_fix_cache(failure: dict, file_content: str, is_retry: bool, fixed_content: str, run_id: str = "") -> bool:
+    """Store a fix produced outside this node (e.g. by a fused analyze+fix call).
+
+    Keyed exactly like _generate_fixed_content, so the fix node picks it up as a
+    cache hit instead of asking again. No-diff answers are not stored.
+    """
+    if not fixed_content.strip() or fixed_content.strip() == file_content.strip():
+        return False
+    save_cached(_fix_cache_key(failure, file_content, is_retry), fixed_content, run_id)
+    return True
+
+
+def _generate_batch(jobs: list, run_id: str = "") -> list:
+    """One multi-file request for jobs of (failure, file_content, is_retry).
+
+    Returns fixed contents aligned with jobs; None where the model gave no usable
+    change, so the caller can fall back to the per-file path for those.
+    """
+    results = [None] * len(jobs)
+    keys = [_fix_cache_key(failure, content, is_retry) for failure, content, is_retry in jobs]
+    uncached = []
+    for i, key in enumerate(keys):
+        results[i] = get_cached(key, run_id)
+        if results[i] is None:
+            uncached.append(i)
+    if not uncached:
+        return results
+
+    print(f"[AGENT] generating batched fix for {len(uncached)} file(s)")
+    fixed = generate_batch_fixes([
+        {
+            "file": jobs[i][0]["file"],
+            "content": jobs[i][1],
+            "error_output": jobs[i][0].get("error_output", ""),
+            "bug_type": jobs[i][0]["bug_type"],
+            "line": jobs[i][0].get("line_number", 1),
+            "fix_instruction": jobs[i][0].get("fix_instruction", ""),
+            "is_retry": jobs[i][2],
+        }
+        for i in uncached
+    ])
+    for i, content in zip(uncached, fixed):
+        # A no-diff answer is as useless as a missing one — let the per-file path retry it
+        if content and content.strip() != jobs[i][1].strip():
+            results[i] = content
+            save_cached(keys[i], content, run_id)
+    return results
+
+
+def _chunk_jobs(jobs: list, partition: bool) -> list:
+    """Split a round's jobs into index lists of at most BATCH_SIZE.
+
+    With partition=True, jobs are first grouped by their file's directory and no
+    chunk spans two directories.
+    """
+    if not partition:
+        return [list(range(i, min(i + BATCH_SIZE, len(jobs)))) for i in range(0, len(jobs), BATCH_SIZE)]
+
+    by_dir: dict[str, list[int]] = {}
+    for j, job in enumerate(jobs):
+        by_dir.setdefault(os.path.dirname(job[0]), []).append(j)
+    return [
+        members[i:i + BATCH_SIZE]
+        for members in by_dir.values()
+        for i in range(0, len(members), BATCH_SIZE)
+    ]
+
+
+async def _generate_all(
+    repo_path: str,
+    groups: dict,
+    no_diff_counts: dict,
+    iteration: int,
+    run_id: str = "",
+    content_hashes: Optional[dict] = None,
+) -> list:
+    """Generate fixes for every file, batching independent files into shared requests.
+
+    Work proceeds in rounds: each round takes the next failure of every file, so
+    all failures in a round touch distinct files and can share one request
+    (BATCH_SIZE per request, MAX_CONCURRENT_FIXES requests in flight). Entries a
+    batch could not fix fall back to the per-file one-step fix.
+    Failures on the SAME file land in successive rounds — each one is generated
+    against the previous fix's output, exactly as the serial loop would see it
+    on disk. Returns (file_path, failure, content_before, fixed_content) tuples
+    in input order; fixed_content is the exception if generation raised.
+    groups maps file_path → [(index in failures, failure), ...].
+    content_hashes (file_path → _fix_cache_key of its last no-diff request) is
+    updated in place: a request identical to one that already produced no diff —
+    same content, analysis and retry prompt — is answered as no-diff without
+    another API call.
+    """
+    if content_hashes is None:
+        content_hashes = {}
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_FIXES)
+    total_failures = sum(len(file_failures) for file_failures in groups.values())
+    queues = {file_path: list(file_failures) for file_path, file_failures in groups.items()}
+    contents = {}
+    for file_path in queues:
+        contents[file_path] = read_text(os.path.join(repo_path, file_path))
+    attempts = {file_path: no_diff_counts.get(file_path, 0) for file_path in queues}
+
+    async def _in_thread(fn, *args):
+        async with semaphore:
+            return await asyncio.to_thread(fn, *args)
+
+    outcomes = []
+    while any(queues.values()):
+        jobs = []  # (file_path, index, failure, content_before, is_retry)
+        for file_path, queue in queues.items():
+            if queue:
+                index, failure = queue.pop(0)
+                # Determine if this is a retry (previous fix was attempted)
+                is_retry = attempts[file_path] > 0 or iteration > 1
+                if content_hashes.get(file_path) == _fix_cache_key(failure, contents[file_path], is_retry):
+                    # Same request as the last no-diff attempt — the answer would be the same
+                    print(f"[AGENT] ⏭ {file_path} unchanged since its last no-diff attempt — skipping LLM call")
+                    outcomes.append((index, (file_path, failure, contents[file_path], contents[file_path])))
+                    attempts[file_path] += 1
+                    continue
+                jobs.append((file_path, index, failure, contents[file_path], is_retry))
+
+        fixed = [None] * len(jobs)
+        if len(jobs) > 1:
+            chunks = _chunk_jobs(jobs, partition=total_failures > PARTITION_THRESHOLD)
+            batch_results = await asyncio.gather(
+                *(_in_thread(_generate_batch, [jobs[j][2:] for j in chunk], run_id) for chunk in chunks),
+                return_exceptions=True,
+            )
+            for chunk, result in zip(chunks, batch_results):
+                if not isinstance(result, BaseException):
+                    for j, content in zip(chunk, result):
+                        fixed[j] = content
+
+        missing = [j for j, content in enumerate(fixed) if content is None]
+        per_file = await asyncio.gather(
+            *(_in_thread(_generate_fixed_content, *jobs[j][2:], run_id) for j in missing),
+            return_exceptions=True,
+        )
+        for j, content in zip(missing, per_file):
+            fixed[j] = content
+
+        for (file_path, index, failure, content_before, is_retry), content in zip(jobs, fixed):
+            outcomes.append((index, (file_path, failure, content_before, content)))
+            if isinstance(content, BaseException):
+                attempts[file_path] += 1  # transient — the same request is worth asking again
+            elif content and content.strip() != content_before.strip():
+                contents[file_path] = content
+                attempts[file_path] = 0
+                content_hashes.pop(file_path, None)
+            else:
+                attempts[file_path] += 1
+                content_hashes[file_path] = _fix_cache_key(failure, content_before, is_retry)
+
+    # Restore the original failure order across files
+    return [outcome for _, outcome in sorted(outcomes, key=lambda r: r[0])]
@@ -7,8 +7,18 @@ Fork Fallback:
 """
 
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from tools.git_tools import clone_repo, create_branch_and_checkout, generate_branch_name
 from tools.github_api_tools import check_write_access, fork_repo
+from tools.run_tokens import get_run_token
+
+
+def _prepare_workspace(run_id: str) -> str:
+    """Return /tmp/<run_id>/repo, creating its parent (clone needs the leaf absent)."""
+    repo_path = os.path.join("/tmp", run_id, "repo")
+    os.makedirs(os.path.dirname(repo_path), exist_ok=True)
+    return repo_path
 
 
 def repo_clone_node(state: dict) -> dict:
@@ -25,25 +35,34 @@ def repo_clone_node(state: dict) -> dict:
     run_id = state["run_id"]
     github_url = state["github_url"]
     commit_message = state["commit_message"]
-    github_token = state.get("github_token", "")
+    github_token = get_run_token(state["run_id"])  # kept out of checkpointed state
 
-    # Set up local path
-    repo_path = os.path.join("/tmp", run_id, "repo")
-    os.makedirs(os.path.dirname(repo_path), exist_ok=True)
+    repo_path = _prepare_workspace(run_id)
 
-    logs = list(state.get("logs", []))
+    logs = []
     forked_from = None
     effective_repo_url = github_url  # URL we actually clone/push to
 
     # ── Step 1: Check write access ──────────────────────────────────────────
+    # The direct clone is what we need whenever access is confirmed, so it starts
+    # speculatively alongside the access probe instead of waiting for it.
+    direct_clone_error = None
     if github_token:
-        has_access = check_write_access(github_url, github_token)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            access_future = pool.submit(check_write_access, github_url, github_token)
+            clone_future = pool.submit(clone_repo, github_url, repo_path, github_token)
+            has_access = access_future.result()
+            try:
+                clone_future.result()
+            except Exception as e:
+                direct_clone_error = e
     else:
         has_access = False  # No token → assume no access
 
     if not has_access and github_token:
         # ── Step 2b: Fork → clone from fork ─────────────────────────────────
         print(f"[AGENT] No write access to {github_url} — forking to user's account...")
+        shutil.rmtree(repo_path, ignore_errors=True)  # drop the speculative direct clone
         try:
             fork_clone_url, fork_html_url = fork_repo(github_url, github_token)
             effective_repo_url = fork_html_url
@@ -57,9 +76,14 @@ def repo_clone_node(state: dict) -> dict:
             print(f"[AGENT] Fork failed ({e}), falling back to direct clone (read-only)")
             logs.append(f"Fork failed — cloning read-only")
             clone_repo(github_url, repo_path, github_token)
+    elif github_token:
+        # ── Step 2a: Direct clone (already done in parallel with the probe) ──
+        if direct_clone_error:
+            raise direct_clone_error
+        print(f"[AGENT] Write access confirmed — cloned {github_url} directly")
+        logs.append(f"Repository cloned")
     else:
-        # ── Step 2a: Direct clone ────────────────────────────────────────────
-        print(f"[AGENT] Write access confirmed — cloning {github_url} directly")
+        print(f"[AGENT] No token — cloning {github_url} directly")
         clone_repo(github_url, repo_path, github_token)
         logs.append(f"Repository cloned")
 
@@ -70,7 +94,6 @@ def repo_clone_node(state: dict) -> dict:
     print(f"[AGENT] cloned repo, created branch: {branch_name}")
 
     return {
-        **state,
         "repo_local_path": repo_path,
         "branch_name": branch_name,
         "effective_repo_url": effective_repo_url,   # URL used for CI/CD monitoring + branch link
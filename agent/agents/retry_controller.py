@@ -3,8 +3,12 @@
 import json
 import os
 import time
+from agents.code_analysis_agent import invalidate_walk_cache
 from schemas.results_schema import AgentResults, ScoreBreakdown, FixEntry, CICDEntry
 from tools.git_tools import cleanup_repo
+from tools.github_api_tools import release_github_token
+from tools.llm_cache import drop_run
+from tools.run_tokens import get_run_token
 
 MAX_ITERATIONS = 5
 
@@ -30,7 +34,8 @@ def should_retry(state: dict) -> str:
     # Instead of finalizing and losing all work, route to commit so we save
     # what was generated (tests, partial fixes, etc.).
     new_fix_count = state.get("new_fix_count", -1)
-    if iteration > 1 and new_fix_count == 0:
+    # Failures deferred by provider throttling still deserve another iteration
+    if iteration > 1 and new_fix_count == 0 and not state.get("rate_limited_count"):
         print("[AGENT] 0 new fixes generated -- breaking loop and committing partial progress.")
         return "commit_and_push" if auto_commit else "wait_for_approval"
 
@@ -46,7 +51,6 @@ def retry_increment_node(state: dict) -> dict:
     new_iter = state.get("iteration", 1) + 1
     print(f"[AGENT] retrying — iteration {new_iter}/{MAX_ITERATIONS}")
     return {
-        **state,
         "iteration": new_iter,
         "config_fix_changed": False,       # reset so next iter re-evaluates
         "current_step": f"Retrying (iteration {new_iter}/{MAX_ITERATIONS})...",
@@ -69,8 +73,7 @@ def finalize_node(state: dict) -> dict:
     error_message = state.get("error_message", "")
 
     # Calculate score
-    score = ScoreBreakdown()
-    score.calculate(time_taken, commit_count)
+    score = ScoreBreakdown.compute(time_taken, commit_count)
 
     total_failures = len(state.get("failures", []))
     total_fixes = sum(1 for f in fixes if f.get("status") == "Fixed")
@@ -118,6 +121,12 @@ def finalize_node(state: dict) -> dict:
     # Clean up the cloned repo directory
     repo_path = state.get("repo_local_path", "")
     repo_cleaned = cleanup_repo(repo_path) if repo_path else False
+    if repo_path:
+        invalidate_walk_cache(repo_path)
+    # ...and the run's LLM cache next to it (/tmp/<run_id>/llm_cache)
+    drop_run(state.get("run_id", ""))
+    # The run is over — its GitHub client and Repository objects hold the raw token
+    release_github_token(get_run_token(state.get("run_id", "")))
 
     # Set current_step to a user-friendly message
     step_msg = "Completed — local repo cleaned up" if repo_cleaned else "Completed"
@@ -127,7 +136,6 @@ def finalize_node(state: dict) -> dict:
     print(f"[AGENT] finalizing results — status: {ci_cd_status}, fixes: {total_fixes}/{total_failures}")
 
     return {
-        **state,
         "end_time": end_time,
         "results": results_dict,
         "repo_cleaned": repo_cleaned,
@@ -154,15 +162,18 @@ def _write_results_json(state: dict, full_results: dict, total_failures: int,
     }
 
     try:
+        # Serialize once, write the same bytes to both locations
+        payload = json.dumps(simplified, indent=2, ensure_ascii=False).encode("utf-8")
+
         results_path = os.path.join(repo_path, "results.json")
-        with open(results_path, "w", encoding="utf-8") as f:
-            json.dump(simplified, f, indent=2, ensure_ascii=False)
-            
+        with open(results_path, "wb") as f:
+            f.write(payload)
+
         # Also write safely to the agent root directory so it survives cleanup
         root_results_path = os.path.join(os.getcwd(), "results.json")
-        with open(root_results_path, "w", encoding="utf-8") as f:
-            json.dump(simplified, f, indent=2, ensure_ascii=False)
-            
+        with open(root_results_path, "wb") as f:
+            f.write(payload)
+
         print(f"[AGENT] ✓ Written results.json to {results_path} and {root_results_path}")
     except Exception as e:
         print(f"[AGENT] ✗ Failed to write results.json: {e}")
@@ -1,6 +1,7 @@
 """Node 2: TestDiscoveryAgent — Auto-detect test framework and discover test files."""
 
-from tools.test_runner_tools import detect_test_framework, discover_test_files
+from agents.test_generator_agent import test_generator_node
+from tools.test_runner_tools import detect_test_framework, discover_test_files, scan_repo
 
 
 def test_discovery_node(state: dict) -> dict:
@@ -12,28 +13,31 @@ def test_discovery_node(state: dict) -> dict:
     "unknown" gracefully — returning structured errors and skipping generation.
     """
     repo_path = state["repo_local_path"]
+    generated = {}  # test_generator_node's state update, if it ran
 
-    framework = detect_test_framework(repo_path)
+    # One walk feeds both detection and discovery
+    scan = scan_repo(repo_path)
+    framework = detect_test_framework(repo_path, scan)
     if not framework:
         print("[AGENT] ⚠ no supported test framework detected — generating bootstrap tests...")
-        from agents.test_generator_agent import test_generator_node
-        state = test_generator_node(state)
-        
-        # Rerun framework detection after generation
-        framework = detect_test_framework(repo_path)
+        generated = test_generator_node(state)
+
+        # Rerun framework detection after generation (new files → fresh walk)
+        scan = scan_repo(repo_path)
+        framework = detect_test_framework(repo_path, scan)
         if not framework:
             framework = "unknown"
 
-    test_files = discover_test_files(repo_path, framework)
+    test_files = discover_test_files(repo_path, framework, scan)
     print(f"[AGENT] framework: {framework}, found {len(test_files)} test files")
 
-    logs = list(state.get("logs", []))
+    logs = list(generated.get("logs", []))
     if framework == "unknown":
         logs.append("No test framework detected")
     logs.append(f"Test framework: {framework} | {len(test_files)} test file(s) found")
 
     return {
-        **state,
+        **generated,
         "test_framework": framework,
         "test_files": test_files,
         "current_step": "Discovering tests...",
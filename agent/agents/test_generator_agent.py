@@ -29,10 +29,12 @@ failures reference generated test files. If so, it re-generates only those
 failing test files. Otherwise, it skips generation as before.
 """
 
+import asyncio
+import functools
 import os
-import re
 
-from tools.openrouter_tools import generate_tests
+from tools.llm_cache import cache_key, get_cached, save_cached, take_stats
+from tools.openrouter_tools import RateLimited, generate_tests, generate_tests_batch
 from tools.test_runner_tools import detect_js_test_framework
 
 
@@ -42,26 +44,37 @@ from tools.test_runner_tools import detect_js_test_framework
 # Keeps API costs predictable — raise or lower as needed.
 MAX_FILES_TO_GENERATE = 5
 
+# Test-generation requests in flight at once — each is a multi-second round-trip
+MAX_CONCURRENT_GENERATIONS = 5
+
+# Tries per generation request when the provider throttles (429 / 5xx). The wait
+# between tries is the provider cooldown — jittered exponential back-off.
+MAX_GENERATION_ATTEMPTS = 3
+
 # Source files that are never testable by design.
-SKIP_SOURCE_PATTERNS = {
+SKIP_SOURCE_PATTERNS = frozenset({
     "manage.py", "wsgi.py", "asgi.py", "settings.py",
     "conftest.py", "setup.py", "apps.py", "admin.py",
     "__init__.py", "migrations",
-}
+})
 
 # Minimum source-file size to bother generating tests for (bytes).
 # Very small files (truly empty stubs, zero-byte files) are skipped.
 # Small but meaningful files (e.g. calculator.py with 1-2 functions) ARE included.
 MIN_SOURCE_BYTES = 10
 
+# Larger files (vendored bundles, generated code) are skipped before any API call:
+# the prompt only carries the first 4000 chars, so tests for them would be guesses.
+MAX_SOURCE_BYTES = 40_000
+
 # ALL extensions we ever look at — we collect both Python and JS in every repo.
 ALL_SOURCE_EXTENSIONS = (".py", ".js", ".ts", ".jsx", ".tsx")
 
-JS_EXTENSIONS = {".js", ".ts", ".jsx", ".tsx"}
-PY_EXTENSIONS = {".py"}
+JS_EXTENSIONS = frozenset({".js", ".ts", ".jsx", ".tsx"})
+PY_EXTENSIONS = frozenset({".py"})
 
 # JS files that are config / bundler artefacts — not logic worth testing.
-SKIP_JS_PATTERNS = {
+SKIP_JS_PATTERNS = frozenset({
     "vite.config.js", "vite.config.ts",
     "webpack.config.js", "rollup.config.js",
     "babel.config.js", "jest.config.js", "jest.config.ts",
@@ -69,17 +82,29 @@ SKIP_JS_PATTERNS = {
     "next.config.js", "next.config.ts",
     ".eslintrc.js", ".prettierrc.js",
     "index.js",  # usually just re-exports
-}
+})
+
+# Directories never searched for source files.
+SOURCE_SKIP_DIRS = frozenset((
+    "node_modules", ".git", "__pycache__", ".venv", "venv", ".tox", "dist", "build",
+    "static", "templates", "migrations", "media",
+))
+
+# File-name endings that mark a file as a test, not a source to generate tests for.
+_TEST_FILE_SUFFIXES = ("_test.py", ".test.js", ".spec.js", ".test.ts", ".spec.ts")
 
 # JS frameworks that we can generate tests for.
-SUPPORTED_JS_FRAMEWORKS = {"jest", "vitest"}
+SUPPORTED_JS_FRAMEWORKS = frozenset({"jest", "vitest"})
+
+# Windows → forward-slash path normalization via C-level str.translate
+_SLASH_TRANS = str.maketrans("\\", "/")
 
 
 # ─── Helpers ──────────────────────────────────────────────────────────────────
 
 def _is_skippable(rel_path: str) -> bool:
     """Return True for config/boilerplate files that shouldn't be tested."""
-    parts = rel_path.replace("\\", "/").split("/")
+    parts = rel_path.translate(_SLASH_TRANS).split("/")
     for part in parts:
         if part in SKIP_SOURCE_PATTERNS or part.startswith("migration"):
             return True
@@ -112,34 +137,73 @@ def _file_framework(
     return "pytest", is_django
 
 
-def _find_source_files(repo_path: str, extensions: tuple) -> list[str]:
-    """Walk the repo and collect source files with the given extensions."""
+def _find_source_files(repo_path: str, extensions: tuple) -> tuple[list[str], set[str]]:
+    """Walk the repo once: collect source files with the given extensions, plus
+    every file seen (forward-slash relative paths) so existence checks need no stat().
+
+    Hand-rolled os.scandir walk in os.walk's top-down order: DirEntry caches the
+    file type from the directory listing and stat() is only issued for candidate
+    sources (the size check).
+    """
     sources = []
-    for dirpath, dirnames, filenames in os.walk(repo_path):
-        # Prune non-source directories
-        dirnames[:] = [
-            d for d in dirnames
-            if d not in ("node_modules", ".git", "__pycache__", ".venv",
-                         "venv", ".tox", "dist", "build", "static", "templates",
-                         "migrations", "media")
-        ]
-        for fname in filenames:
-            if fname.endswith(extensions):
-                full = os.path.join(dirpath, fname)
-                rel = os.path.relpath(full, repo_path)
-                # Skip test files — we don't generate tests for test files
-                basename = os.path.basename(rel)
-                if basename.startswith("test_") or basename.endswith(("_test.py", ".test.js", ".spec.js", ".test.ts", ".spec.ts")):
-                    continue
-                if "tests/" in rel.replace("\\", "/") or "test/" in rel.replace("\\", "/") or "__tests__" in rel:
-                    continue
-                if not _is_skippable(rel) and os.path.getsize(full) >= MIN_SOURCE_BYTES:
-                    sources.append(rel)
-    return sources
-
-
-def _already_has_test(rel_source: str, existing_test_files: set[str], repo_path: str) -> bool:
-    """Return True if a test file already exists for this source file."""
+    all_files: set[str] = set()
+    stack = [(repo_path, "")]  # (absolute dir, relative prefix ending in "/")
+    while stack:
+        current, prefix = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            rel = prefix + entry.name
+            if entry.is_dir():
+                # Prune non-source directories; like os.walk, never descend into symlinks
+                if entry.name not in SOURCE_SKIP_DIRS and not entry.is_symlink():
+                    subdirs.append((entry.path, rel + "/"))
+                continue
+            all_files.add(rel)
+            if not entry.name.endswith(extensions):
+                continue
+            # Skip test files — we don't generate tests for test files
+            if entry.name.startswith("test_") or entry.name.endswith(_TEST_FILE_SUFFIXES):
+                continue
+            if "tests/" in rel or "test/" in rel or "__tests__" in rel:
+                continue
+            if _is_skippable(rel):
+                continue
+            try:
+                size = entry.stat().st_size
+            except OSError:
+                continue
+            if size > MAX_SOURCE_BYTES:
+                print(f"[AGENT] ⏭ skipping {rel} for test generation ({size} bytes > {MAX_SOURCE_BYTES})")
+            elif size >= MIN_SOURCE_BYTES:
+                sources.append(rel)
+        stack.extend(reversed(subdirs))
+    return sources, all_files
+
+
+def _path_suffixes(paths) -> set[str]:
+    """Every trailing path suffix of each path ("a/b/c.py" → c.py, b/c.py, a/b/c.py).
+
+    Lets "is candidate the tail of some known test file" be a set lookup.
+    """
+    suffixes = set()
+    for path in paths:
+        parts = path.translate(_SLASH_TRANS).split("/")
+        for i in range(len(parts)):
+            suffixes.add("/".join(parts[i:]))
+    return suffixes
+
+
+def _already_has_test(rel_source: str, existing_test_suffixes: set[str], all_files: set[str]) -> bool:
+    """Return True if a test file already exists for this source file.
+
+    existing_test_suffixes: _path_suffixes() of the discovered test files.
+    all_files: every repo file from _find_source_files' walk.
+    """
     dirname = os.path.dirname(rel_source)
     basename = os.path.basename(rel_source)
     stem, ext = os.path.splitext(basename)
@@ -158,10 +222,8 @@ def _already_has_test(rel_source: str, existing_test_files: set[str], repo_path:
         candidates += _js_test_candidates(rel_source)
 
     for candidate in candidates:
-        norm = candidate.replace("\\", "/")
-        if any(norm in tf.replace("\\", "/") for tf in existing_test_files):
-            return True
-        if os.path.exists(os.path.join(repo_path, candidate)):
+        norm = os.path.normpath(candidate).translate(_SLASH_TRANS)
+        if norm in existing_test_suffixes or norm in all_files:
             return True
     return False
 
@@ -182,8 +244,13 @@ def _target_test_path(rel_source: str) -> str:
     return os.path.join(dirname, f"test_{stem}.py")
 
 
+@functools.lru_cache(maxsize=8)
 def _detect_django(repo_path: str) -> tuple[bool, str]:
-    """Return (is_django, settings_module) by checking for manage.py."""
+    """Return (is_django, settings_module) by checking for manage.py.
+
+    Fallback for repairs without the iteration-1 answer in state; cached per
+    repo_path (each run clones to its own /tmp/<run_id>/repo).
+    """
     if not os.path.exists(os.path.join(repo_path, "manage.py")):
         return False, ""
     # Try to infer the settings package (same logic as config_fix_agent)
@@ -197,6 +264,17 @@ def _detect_django(repo_path: str) -> tuple[bool, str]:
     return True, "settings"
 
 
+def _django_from_files(all_files: set[str]) -> tuple[bool, str]:
+    """_detect_django answered from an existing walk's file set — no extra listdir/stat."""
+    if "manage.py" not in all_files:
+        return False, ""
+    settings_pkgs = sorted(
+        f[: -len("/settings.py")] for f in all_files
+        if f.endswith("/settings.py") and f.count("/") == 1
+    )
+    return True, f"{settings_pkgs[0]}.settings" if settings_pkgs else "settings"
+
+
 def _js_test_candidates(rel_source: str) -> list[str]:
     """Additional test-file naming patterns for JS/TS files."""
     dirname = os.path.dirname(rel_source)
@@ -211,23 +289,31 @@ def _js_test_candidates(rel_source: str) -> list[str]:
 
 
 def _find_failing_generated_tests(state: dict) -> list[str]:
-    """Return generated test file paths that appear in current failures."""
-    generated = set(state.get("generated_test_files", []))
+    """Return generated test file paths that appear in current failures.
+
+    A failure matches a generated test when its path equals the test path or
+    contains it (e.g. an absolute path ending in it). Generated tests are indexed
+    by basename, so each failure costs one dict lookup instead of a scan over
+    every generated file. Each test is returned once, in order of first failure.
+    """
+    generated = state.get("generated_test_files", [])
     if not generated:
         return []
 
-    failures = state.get("failures", [])
-    failing_generated = []
-    for f in failures:
-        fpath = f.get("file", "")
-        # Normalize to forward-slash for comparison
-        fpath_norm = fpath.replace("\\", "/")
-        for gen in generated:
-            gen_norm = gen.replace("\\", "/")
+    # basename → [(original path, forward-slash path)], built once
+    by_basename: dict[str, list[tuple[str, str]]] = {}
+    for gen in set(generated):
+        gen_norm = gen.translate(_SLASH_TRANS)
+        by_basename.setdefault(gen_norm.rsplit("/", 1)[-1], []).append((gen, gen_norm))
+
+    hits: dict[str, None] = {}  # ordered set
+    for f in state.get("failures", []):
+        fpath_norm = f.get("file", "").translate(_SLASH_TRANS)
+        for gen, gen_norm in by_basename.get(fpath_norm.rsplit("/", 1)[-1], ()):
             if gen_norm == fpath_norm or gen_norm in fpath_norm:
-                failing_generated.append(gen)
+                hits[gen] = None
                 break
-    return failing_generated
+    return list(hits)
 
 
 # ─── Main node ────────────────────────────────────────────────────────────────
@@ -250,17 +336,19 @@ def test_generator_node(state: dict) -> dict:
     """
     repo_path = state["repo_local_path"]
     framework = state.get("test_framework", "pytest")
-    existing_tests = set(state.get("test_files", []))
-    fixes_applied = list(state.get("fixes_applied", []))
-    logs = list(state.get("logs", []))
+    existing_tests = state.get("test_files", [])
+    logs = []
     iteration = state.get("iteration", 1)
 
     # ── Repair-on-retry path ──────────────────────────────────────────────────
     if iteration > 1:
-        return _repair_generated_tests(state, repo_path, fixes_applied, logs)
+        return _repair_generated_tests(state, repo_path, logs)
+
+    # ── One walk: source files + every file path (feeds Django + coverage checks) ─
+    source_files, all_files = _find_source_files(repo_path, ALL_SOURCE_EXTENSIONS)
 
     # ── Detect Django ──────────────────────────────────────────────────────────
-    is_django, settings_module = _detect_django(repo_path)
+    is_django, settings_module = _django_from_files(all_files)
     if is_django:
         logs.append(f"Django detected: {settings_module}")
         print(f"[AGENT] Django project: {settings_module}")
@@ -273,13 +361,13 @@ def test_generator_node(state: dict) -> dict:
         print("[AGENT] no JS test framework detected — JS test generation will be skipped")
 
     # ── Find ALL source files (Python + JS/TS) without tests ──────────────────
-    source_files = _find_source_files(repo_path, ALL_SOURCE_EXTENSIONS)
+    existing_test_suffixes = _path_suffixes(existing_tests)
 
     # Check each source file individually and log coverage status
     covered = []
     uncovered = []
     for src in source_files:
-        if _already_has_test(src, existing_tests, repo_path):
+        if _already_has_test(src, existing_test_suffixes, all_files):
             covered.append(src)
             print(f"[AGENT] ✓ test exists for {src} — skipping generation")
         else:
@@ -295,27 +383,29 @@ def test_generator_node(state: dict) -> dict:
 
     if not uncovered:
         logs.append("All source files already have tests — skipping generation")
-        return {**state, "logs": logs, "tests_generated": True}
+        return {"logs": logs, "tests_generated": True, "django_settings_module": settings_module}
 
     logs.append(f"Generating tests for {min(len(uncovered), MAX_FILES_TO_GENERATE)} file(s)")
 
-    generated_test_files = list(state.get("generated_test_files", []))
     new_test_paths = []
+    new_fixes = []
     success_count = 0
     fail_count = 0
     js_skipped = 0
 
-    for rel_source in uncovered[:MAX_FILES_TO_GENERATE]:
-        full_source = os.path.join(repo_path, rel_source)
-
+    # Cap README context to avoid token bloat; read once for every file
+    readme_content = ""
+    readme_path = os.path.join(repo_path, "README.md")
+    if os.path.exists(readme_path):
         try:
-            with open(full_source, "r", errors="replace") as fh:
-                source_code = fh.read()
-        except OSError as e:
-            print(f"[AGENT] cannot read {rel_source}: {e}")
-            fail_count += 1
-            continue
+            with open(readme_path, "r", errors="replace") as rh:
+                readme_content = rh.read()[:5000]
+        except OSError:
+            pass
 
+    # ── Pass 1: gate each file by framework, read the survivors concurrently ──
+    targets = []  # (rel_source, file_fw, file_is_django)
+    for rel_source in uncovered[:MAX_FILES_TO_GENERATE]:
         # Determine the correct framework per file extension (gated for JS)
         file_fw, file_is_django = _file_framework(rel_source, framework, is_django, js_framework)
 
@@ -325,28 +415,50 @@ def test_generator_node(state: dict) -> dict:
             print(f"[AGENT] ⏭ skipping JS test generation for {rel_source} (no jest/vitest detected)")
             logs.append(f"Skipped {rel_source} (no JS test framework)")
             continue
+        targets.append((rel_source, file_fw, file_is_django))
 
-        # Ensure README is read (to inform test case generation as requested)
-        readme_content = ""
-        readme_path = os.path.join(repo_path, "README.md")
-        if os.path.exists(readme_path):
-            try:
-                with open(readme_path, "r", errors="replace") as rh:
-                    # Cap readme context to avoid token bloat
-                    readme_content = rh.read()[:5000]
-            except OSError:
-                pass
+    sources = asyncio.run(_read_sources(repo_path, [t[0] for t in targets])) if targets else []
 
-        print(f"[AGENT] generating {file_fw} tests for: {rel_source}")
+    jobs = []  # (rel_source, generate_tests kwargs)
+    for (rel_source, file_fw, file_is_django), source_code in zip(targets, sources):
+        if isinstance(source_code, OSError):
+            print(f"[AGENT] cannot read {rel_source}: {source_code}")
+            fail_count += 1
+            continue
 
-        # Call Gemini with per-file framework and readme context
-        test_code = generate_tests(
-            source_code=f"/* README CONTEXT:\n{readme_content}\n*/\n\n{source_code}" if readme_content else source_code,
-            file_path=rel_source,
-            framework=file_fw,
-            is_django=file_is_django,
-            settings_module=settings_module if file_is_django else "",
-        )
+        print(f"[AGENT] generating {file_fw} tests for: {rel_source}")
+        jobs.append((rel_source, {
+            "source_code": source_code,
+            "file_path": rel_source,
+            "framework": file_fw,
+            "is_django": file_is_django,
+            "settings_module": settings_module if file_is_django else "",
+        }))
+
+    # ── Pass 2: call Gemini for all files (batched per framework, concurrently) ─
+    # Identical (source, framework, README) inputs reuse the run's cached answer —
+    # e.g. when a crashed run is resumed and this node runs again
+    run_id = state.get("run_id", "")
+    keys = [_tests_cache_key(kwargs, readme_content) for _, kwargs in jobs]
+    results = [get_cached(key, run_id) for key in keys]
+    pending = [i for i, test_code in enumerate(results) if test_code is None]
+    generated = asyncio.run(_generate_tests_concurrently([jobs[i][1] for i in pending], readme_content)) if pending else []
+    for i, test_code in zip(pending, generated):
+        results[i] = test_code
+        if isinstance(test_code, str) and len(test_code.strip()) >= 50:
+            save_cached(keys[i], test_code, run_id)
+    cache_hits, cache_misses = take_stats(run_id)
+    if cache_hits:
+        logs.append(f"LLM cache: {cache_hits} hit(s), {cache_misses} miss(es)")
+
+    # ── Pass 3: write results in input order ─────────────────────────────────
+    created_dirs: set[str] = set()
+    for (rel_source, _), test_code in zip(jobs, results):
+        if isinstance(test_code, BaseException):
+            print(f"[AGENT] ✗ test generation failed for {rel_source}: {test_code}")
+            logs.append(f"Skipped {rel_source} (generation error)")
+            fail_count += 1
+            continue
 
         if not test_code or len(test_code.strip()) < 50:
             print(f"[AGENT] ✗ empty/too-short response for {rel_source}")
@@ -357,18 +469,13 @@ def test_generator_node(state: dict) -> dict:
         # Determine output path and write
         rel_test_path = _target_test_path(rel_source)
         full_test_path = os.path.join(repo_path, rel_test_path)
-        os.makedirs(os.path.dirname(full_test_path), exist_ok=True)
-
-        with open(full_test_path, "w", encoding="utf-8") as fh:
-            fh.write(test_code)
+        _write_test_file(full_test_path, test_code, created_dirs)
 
         print(f"[AGENT] ✓ written: {rel_test_path}")
         logs.append(f"Generated {rel_test_path}")
 
         new_test_paths.append(rel_test_path)
-        generated_test_files.append(rel_test_path)
-
-        fixes_applied.append({
+        new_fixes.append({
             "file": rel_test_path,
             "bug_type": "GENERATED_TEST",
             "line_number": 0,
@@ -386,19 +493,22 @@ def test_generator_node(state: dict) -> dict:
     logs.append(summary)
     print(f"[AGENT] {summary}")
 
-    return {
-        **state,
-        "test_files": list(existing_tests) + new_test_paths,
-        "generated_test_files": generated_test_files,
-        "fixes_applied": fixes_applied,
+    # Delta only: logs go through the append reducer, and the list fields are
+    # rebuilt (one concatenation each) only when something was actually written
+    delta = {
         "tests_generated": True,
+        "django_settings_module": settings_module,  # reused by repairs on later iterations
         "current_step": "Generating test cases…",
         "logs": logs,
     }
+    if new_test_paths:
+        delta["test_files"] = existing_tests + new_test_paths
+        delta["generated_test_files"] = state.get("generated_test_files", []) + new_test_paths
+        delta["fixes_applied"] = state.get("fixes_applied", []) + new_fixes
+    return delta
 
 
-def _repair_generated_tests(state: dict, repo_path: str,
-                             fixes_applied: list, logs: list) -> dict:
+def _repair_generated_tests(state: dict, repo_path: str, logs: list) -> dict:
     """Repair AI-generated test files that are failing on iteration > 1.
 
     Only re-generates tests that:
@@ -411,53 +521,58 @@ def _repair_generated_tests(state: dict, repo_path: str,
 
     if not failing_gen:
         logs.append("Test generation skipped (no failing tests to repair)")
-        return {**state, "logs": logs}
+        return {"logs": logs}
 
     logs.append(f"Repairing {len(failing_gen)} failing test file(s)")
     print(f"[AGENT] repairing {len(failing_gen)} failing generated test(s)")
 
-    generated_test_files = list(state.get("generated_test_files", []))
-    repaired = 0
+    new_fixes = []
 
-    for rel_test in failing_gen:
-        full_test = os.path.join(repo_path, rel_test)
-        if not os.path.exists(full_test):
-            continue
+    # Django detection comes from iteration 1 via state, the JS framework from
+    # detect_js_test_framework's package.json cache — no repo re-scan per file
+    settings_module = state.get("django_settings_module")
+    if settings_module is None:  # e.g. a checkpoint from before the key existed
+        is_django, settings_module = _detect_django(repo_path)
+    else:
+        is_django = bool(settings_module)
+    js_framework = detect_js_test_framework(repo_path)
+
+    pairs = [
+        (rel_test, _infer_source_from_test(rel_test))
+        for rel_test in failing_gen
+        if os.path.exists(os.path.join(repo_path, rel_test))
+    ]
+    sources = asyncio.run(_read_sources(repo_path, [src for _, src in pairs])) if pairs else []
 
-        # Find the original source file for this test
-        rel_source = _infer_source_from_test(rel_test)
-        full_source = os.path.join(repo_path, rel_source)
-        if not os.path.exists(full_source):
+    jobs = []  # (rel_test, rel_source, generate_tests kwargs)
+    for (rel_test, rel_source), source_code in zip(pairs, sources):
+        if isinstance(source_code, FileNotFoundError):
             logs.append(f"Skipped repair for {rel_test} (source not found)")
             continue
-
-        try:
-            with open(full_source, "r", errors="replace") as fh:
-                source_code = fh.read()
-        except OSError:
+        if isinstance(source_code, OSError):
             continue
 
-        # Determine framework from extension
-        _, ext = os.path.splitext(rel_source)
-        file_fw = "jest" if ext in JS_EXTENSIONS else "pytest"
-
-        is_django, settings_module = _detect_django(repo_path)
-        file_is_django = is_django and ext == ".py"
+        # Same framework gating as the first generation (jest or vitest, not a guess)
+        file_fw, file_is_django = _file_framework(rel_source, "pytest", is_django, js_framework)
+        if file_fw is None:
+            logs.append(f"Skipped repair for {rel_test} (no JS test framework)")
+            continue
 
         print(f"[AGENT] re-generating {file_fw} tests for: {rel_source}")
-        test_code = generate_tests(
-            source_code=source_code,
-            file_path=rel_source,
-            framework=file_fw,
-            is_django=file_is_django,
-            settings_module=settings_module if file_is_django else "",
-        )
-
-        if test_code and len(test_code.strip()) >= 50:
-            with open(full_test, "w", encoding="utf-8") as fh:
-                fh.write(test_code)
-            repaired += 1
-            fixes_applied.append({
+        jobs.append((rel_test, rel_source, {
+            "source_code": source_code,
+            "file_path": rel_source,
+            "framework": file_fw,
+            "is_django": file_is_django,
+            "settings_module": settings_module if file_is_django else "",
+        }))
+
+    results = asyncio.run(_generate_tests_concurrently([kwargs for _, _, kwargs in jobs])) if jobs else []
+
+    for (rel_test, rel_source, _), test_code in zip(jobs, results):
+        if not isinstance(test_code, BaseException) and test_code and len(test_code.strip()) >= 50:
+            _write_test_file(os.path.join(repo_path, rel_test), test_code)
+            new_fixes.append({
                 "file": rel_test,
                 "bug_type": "GENERATED_TEST",
                 "line_number": 0,
@@ -469,19 +584,124 @@ def _repair_generated_tests(state: dict, repo_path: str,
         else:
             logs.append(f"Repair failed for {rel_test}")
 
-    logs.append(f"Repair done: {repaired}/{len(failing_gen)} test(s) fixed")
-    return {
-        **state,
-        "fixes_applied": fixes_applied,
-        "generated_test_files": generated_test_files,
-        "current_step": "Repairing generated tests…",
-        "logs": logs,
-    }
+    logs.append(f"Repair done: {len(new_fixes)}/{len(failing_gen)} test(s) fixed")
+    # Repairs rewrite files in place — test_files / generated_test_files are unchanged
+    delta = {"current_step": "Repairing generated tests…", "logs": logs}
+    if new_fixes:
+        delta["fixes_applied"] = state.get("fixes_applied", []) + new_fixes
+    return delta
+
 
+def _tests_cache_key(job: dict, readme: str) -> str:
+    """Cache key over every input that shapes a generated test file.
 
+    First generation only: a repair prompt is the same prompt, and replaying the
+    cached answer would just rewrite the test that is failing.
+    """
+    return cache_key("tests", readme=readme, **job)
+
+
+def _write_test_file(full_path: str, test_code: str, created_dirs: set | None = None) -> None:
+    """Write a generated test as UTF-8 bytes, creating its directory at most once per
+    node run (created_dirs remembers the directories already made)."""
+    dirname = os.path.dirname(full_path)
+    if created_dirs is None or dirname not in created_dirs:
+        os.makedirs(dirname, exist_ok=True)
+        if created_dirs is not None:
+            created_dirs.add(dirname)
+    with open(full_path, "wb") as fh:
+        fh.write(test_code.encode("utf-8"))
+
+
+def _read_source(full_path: str) -> str:
+    with open(full_path, "r", errors="replace") as fh:
+        return fh.read()
+
+
+async def _read_sources(repo_path: str, rel_paths: list[str]) -> list:
+    """Read every source file on worker threads at once.
+
+    Returns contents aligned with rel_paths; an entry is the OSError raised if
+    that file could not be read.
+    """
+    return await asyncio.gather(
+        *(asyncio.to_thread(_read_source, os.path.join(repo_path, rel)) for rel in rel_paths),
+        return_exceptions=True,
+    )
+
+
+async def _generate_tests_concurrently(jobs: list[dict], readme: str = "") -> list:
+    """Generate tests for every job (generate_tests kwargs), at most
+    MAX_CONCURRENT_GENERATIONS requests in flight.
+
+    Jobs sharing a framework go out together as one generate_tests_batch request
+    (the README, if any, is sent once per batch); files the batch misses fall
+    back to a per-file generate_tests call with the README prefixed as before.
+    Throttled calls are retried up to MAX_GENERATION_ATTEMPTS times after the
+    provider cooldown, instead of costing the file its generation slot.
+    Returns results aligned with jobs; an entry is the raised exception if its
+    call failed, so one bad file never sinks the rest.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_GENERATIONS)
+
+    async def _limited(fn, *args, **kwargs):
+        for attempt in range(1, MAX_GENERATION_ATTEMPTS + 1):
+            try:
+                async with semaphore:
+                    return await asyncio.to_thread(functools.partial(fn, *args, **kwargs))
+            except RateLimited as e:
+                if attempt == MAX_GENERATION_ATTEMPTS:
+                    raise
+                print(f"[AGENT] test generation throttled — retry {attempt}/{MAX_GENERATION_ATTEMPTS - 1} in {e.wait:.1f}s")
+                await asyncio.sleep(e.wait)  # outside the semaphore — don't hold a slot
+
+    results: list = [None] * len(jobs)
+    groups: dict[tuple, list[int]] = {}
+    for i, job in enumerate(jobs):
+        groups.setdefault((job["framework"], job["is_django"], job["settings_module"]), []).append(i)
+
+    batched = [(key, idxs) for key, idxs in groups.items() if len(idxs) > 1]
+    batch_results = await asyncio.gather(
+        *(
+            _limited(
+                generate_tests_batch,
+                [{"file_path": jobs[i]["file_path"], "source_code": jobs[i]["source_code"]} for i in idxs],
+                *key,
+                context=readme,
+            )
+            for key, idxs in batched
+        ),
+        return_exceptions=True,
+    )
+    for (_, idxs), batch in zip(batched, batch_results):
+        if not isinstance(batch, BaseException):
+            for i, test_code in zip(idxs, batch):
+                if test_code and len(test_code.strip()) >= 50:
+                    results[i] = test_code
+
+    missing = [i for i, test_code in enumerate(results) if test_code is None]
+
+    def _with_readme(job: dict) -> dict:
+        if not readme:
+            return job
+        return job | {"source_code": f"/* README CONTEXT:\n{readme}\n*/\n\n{job['source_code']}"}
+
+    per_file = await asyncio.gather(
+        *(_limited(generate_tests, **_with_readme(jobs[i])) for i in missing),
+        return_exceptions=True,
+    )
+    for i, test_code in zip(missing, per_file):
+        results[i] = test_code
+    return results
+
+
+@functools.lru_cache(maxsize=256)
 def _infer_source_from_test(rel_test: str) -> str:
     """Given a generated test path, infer the original source file path.
 
+    Pure on its argument, so memoized — the same failing test recurs across
+    repair iterations.
+
     test_foo.py         → foo.py
     __tests__/foo.test.js → foo.js
     """
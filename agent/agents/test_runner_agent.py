@@ -14,6 +14,9 @@ EXIT_CODE_CLASS = {
     5: "NO_TESTS_COLLECTED",  # no test files found / 0 collected
 }
 
+# Characters of stdout/stderr kept in test_results (the tail, where summaries are)
+OUTPUT_TAIL_CHARS = 3000
+
 
 def test_runner_node(state: dict) -> dict:
     """
@@ -26,18 +29,20 @@ def test_runner_node(state: dict) -> dict:
     print(f"[AGENT] running {framework} tests (iteration {state.get('iteration', 1)})...")
 
     result = run_tests(repo_path, framework)
+    stdout = result.get("stdout") or ""
+    stderr = result.get("stderr") or ""
 
     test_results = [{
         "framework": framework,
         "passed": result["passed"],
         "returncode": result["returncode"],
-        "stdout": result["stdout"][-3000:] if result["stdout"] else "",   # Truncate
-        "stderr": result["stderr"][-3000:] if result["stderr"] else "",
+        "stdout": stdout[-OUTPUT_TAIL_CHARS:],   # Truncate — the tail holds the summary
+        "stderr": stderr[-OUTPUT_TAIL_CHARS:],
     }]
 
     print(f"[AGENT] tests {'PASSED ✓' if result['passed'] else 'FAILED ✗'}")
 
-    logs = list(state.get("logs", []))
+    logs = []
     iteration = state.get("iteration", 1)
     rc = result.get("returncode", -1)
     exit_class = EXIT_CODE_CLASS.get(rc, f"UNKNOWN_EXIT_{rc}")
@@ -47,7 +52,7 @@ def test_runner_node(state: dict) -> dict:
     else:
         logs.append(f"Tests failed (run {iteration})")
         # Surface stderr immediately so the cause is visible in the Activity Log
-        stderr_excerpt = (result.get("stderr") or "")[:500].strip()
+        stderr_excerpt = stderr[:500].strip()
         if stderr_excerpt:
             logs.append(f"[stderr] {stderr_excerpt}")
         # Warn on actionable exit codes so the agent can branch correctly
@@ -57,7 +62,6 @@ def test_runner_node(state: dict) -> dict:
             logs.append("Exit 5: No tests collected — no test files matched")
 
     return {
-        **state,
         "test_results": test_results,
         "test_exit_class": exit_class,
         "current_step": "Running tests...",
@@ -2,7 +2,8 @@
 
 Flow
 ────
-  clone → install_deps → discover_tests → run_tests → analyze_failures
+  clone ─┬→ install_deps ───┬→ generate_tests → run_tests → analyze_failures
+         └→ discover_tests ─┘   (install and discovery run in parallel)
             ↓ (COLLECTION/NO_TESTS)
         apply_config_fix → reinstall_deps → generate_tests → commit → run_tests
             ↓ (TESTS_FAILED with failures)
@@ -11,7 +12,10 @@ Flow
         finalize
 """
 
-from typing import TypedDict
+import functools
+import os
+from datetime import datetime, timezone
+from typing import Annotated, TypedDict
 from langgraph.graph import StateGraph, END
 
 from agents.repo_clone_agent import repo_clone_node
@@ -20,19 +24,65 @@ from agents.test_discovery_agent import test_discovery_node
 from agents.test_runner_agent import test_runner_node
 from agents.test_generator_agent import test_generator_node
 from agents.code_analysis_agent import code_analysis_node
-from agents.config_fix_agent import config_fix_node
+from agents.config_fix_agent import TEST_DEPS, config_fix_node
 from agents.fix_generator_agent import fix_generator_node
 from agents.commit_agent import commit_node
 from agents.cicd_monitor_agent import cicd_monitor_node
 from agents.retry_controller import should_retry, retry_increment_node, finalize_node
+from tools.dep_installer import install_dependencies
+
+
+# Per-edge / per-helper-node trace lines. HEALOPS_GRAPH_TRACE=0 silences them —
+# call sites check the flag first, so nothing is formatted or written.
+GRAPH_TRACE = os.environ.get("HEALOPS_GRAPH_TRACE", "1") != "0"
+
+
+# ─── State Reducers ───
+# logs and ci_cd_timeline are append-only: nodes return just their NEW entries and
+# LangGraph appends them here, so no node copies the full history. Both are capped —
+# the UI only shows recent history and Mongo keeps the full log stream.
+MAX_LOG_ENTRIES = 1000
+MAX_TIMELINE_ENTRIES = 50
+
+
+def _append_capped(existing: list, new: list, cap: int) -> list:
+    """existing + new, keeping the last `cap` entries.
+
+    Builds exactly one new list (existing may be shared with a checkpoint, so it
+    is never mutated): no copy at all for an empty delta, and only the surviving
+    tail once the cap is reached.
+    """
+    if not new:
+        return existing
+    overflow = len(existing) + len(new) - cap
+    if overflow <= 0:
+        return existing + new
+    if overflow >= len(existing):
+        return new[-cap:]
+    return existing[overflow:] + new
+
+
+def _latest(existing: str, new: str) -> str:
+    """Last write wins — lets parallel branches both report a current_step."""
+    return new
+
+
+def _append_logs(existing: list, new: list) -> list:
+    return _append_capped(existing, new, MAX_LOG_ENTRIES)
+
+
+def _append_timeline(existing: list, new: list) -> list:
+    return _append_capped(existing, new, MAX_TIMELINE_ENTRIES)
 
 
 # ─── State Schema ───
+# Deliberately a TypedDict: LangGraph keeps one channel per key and nodes return
+# small delta dicts, so no per-node state object is allocated that slots could
+# shrink — while every node reads state with dict access (state.get / state[...]).
 class AgentState(TypedDict):
     run_id: str
     github_url: str
     commit_message: str
-    github_token: str
     branch_name: str
     repo_local_path: str
     test_framework: str
@@ -44,23 +94,27 @@ class AgentState(TypedDict):
     commit_count: int
     push_succeeded: bool
     iteration: int
-    ci_cd_timeline: list[dict]
+    ci_cd_timeline: Annotated[list[dict], _append_timeline]
     ci_cd_status: str
+    ci_cd_cache: dict                # last observed workflow run (for conditional GETs)
     start_time: float
     end_time: float
-    current_step: str
+    current_step: Annotated[str, _latest]
     results: dict
     error_message: str
     repo_cleaned: bool
-    logs: list[str]
+    logs: Annotated[list[str], _append_logs]
     test_exit_class: str             # pytest exit code class
     generated_test_files: list[str]  # paths of AI-generated test files
     config_fix_changed: bool         # True if config_fix_agent wrote ≥1 new file
     tests_generated: bool            # True once test_generator_node has run
+    django_settings_module: str      # set by test_generator on iteration 1 ("" = not Django)
     no_diff_counts: dict             # per-file no-diff retry counter
+    file_content_hashes: dict        # file → cache key of its last no-diff fix request
     effective_repo_url: str           # The actual repo URL used (fork URL if forked, else github_url)
     auto_commit: bool                 # If False, agent pauses before committing
     new_fix_count: int                # Number of new fixes generated in the last run_fixes node
+    rate_limited_count: int           # Failures deferred by LLM provider throttling in the last run_fixes node
 
 
 # ─── Conditional Helpers ───
@@ -71,63 +125,60 @@ def _has_fixable_failures(state: dict) -> str:
     - tests PASSED (exit 0)              → route to commit or wait_for_approval based on auto_commit
     - config_fault (exit 4 or 5)         → apply_config_fix
     """
-    exit_class = state.get("test_exit_class", "")
+    branch, message = _route_after_analysis(
+        state.get("test_exit_class", ""),
+        bool(state.get("failures")),
+        bool(state.get("auto_commit", False)),
+    )
+    if GRAPH_TRACE:
+        print(message)
+    return branch
+
+
+@functools.lru_cache(maxsize=64)
+def _route_after_analysis(exit_class: str, has_failures: bool, auto_commit: bool) -> tuple[str, str]:
+    """Pure routing decision for _has_fixable_failures → (branch, log line).
 
+    Retry loops hit the same few inputs over and over, so the answer is cached.
+    """
     # Immediate stop condition: if exit_code == 0, we passed locally.
     if exit_class == "PASSED":
-        if state.get("auto_commit", False):
-            print("[graph] ✅ All tests passed locally — proceeding to auto-commit")
-            return "commit_and_push"
-        else:
-            print("[graph] ✅ All tests passed locally — pausing for user approval")
-            return "wait_for_approval"
-
-    failures = state.get("failures", [])
+        if auto_commit:
+            return "commit_and_push", "[graph] ✅ All tests passed locally — proceeding to auto-commit"
+        return "wait_for_approval", "[graph] ✅ All tests passed locally — pausing for user approval"
 
-    if len(failures) == 0:
+    if not has_failures:
         if exit_class in ("COLLECTION_ERROR", "NO_TESTS_COLLECTED"):
-            print("[graph] ⚙ Config/collection fault — routing to apply_config_fix")
-            return "apply_config_fix"
-        print("[graph] ⏭ Tests failed but no parseable failures — generating fixes anyway")
-        return "generate_fixes"
+            return "apply_config_fix", "[graph] ⚙ Config/collection fault — routing to apply_config_fix"
+        return "generate_fixes", "[graph] ⏭ Tests failed but no parseable failures — generating fixes anyway"
 
-    print("[graph] 🐛 Code failures found — routing to generate_fixes")
-    return "generate_fixes"
+    return "generate_fixes", "[graph] 🐛 Code failures found — routing to generate_fixes"
 
 
-def _after_config_fix(state: dict) -> str:
-    """After apply_config_fix:
-    - reinstall deps then run tests again
-    """
-    print("[graph] ✅ Config fix applied — reinstalling deps")
-    return "reinstall_deps"
+# push_succeeded → next node, built once with the graph module
+_MONITOR_ROUTE = {True: "monitor_cicd", False: "skip_cicd"}
 
 
 def _should_monitor_cicd(state: dict) -> str:
     """Skip CI/CD monitoring if nothing was pushed."""
-    if state.get("push_succeeded", False):
-        return "monitor_cicd"
-    return "skip_cicd"
+    return _MONITOR_ROUTE[bool(state.get("push_succeeded", False))]
 
 
 def _skip_cicd_node(state: dict) -> dict:
     """Lightweight node that records a skipped CI/CD check."""
-    from datetime import datetime, timezone
-
     iteration = state.get("iteration", 1)
-    timeline = list(state.get("ci_cd_timeline", []))
-    timeline.append({
+    # Deltas only — the ci_cd_timeline / logs reducers append them
+    timeline = [{
         "iteration": iteration,
         "status": "SKIPPED",
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "message": "No push — CI/CD check skipped",
-    })
-    logs = list(state.get("logs", []))
-    logs.append("CI/CD check skipped — nothing was pushed")
-    print(f"[graph] ⏭ Skipping CI/CD monitor — nothing was pushed")
+    }]
+    logs = ["CI/CD check skipped — nothing was pushed"]
+    if GRAPH_TRACE:
+        print("[graph] ⏭ Skipping CI/CD monitor — nothing was pushed")
 
     return {
-        **state,
         "ci_cd_status": "FAILED",
         "ci_cd_timeline": timeline,
         "current_step": "Skipped CI/CD (no changes pushed)",
@@ -137,35 +188,32 @@ def _skip_cicd_node(state: dict) -> dict:
 
 def _reinstall_deps_node(state: dict) -> dict:
     """Re-run dependency installation after config_fix patches requirements.txt."""
-    from tools.dep_installer import install_dependencies
-
     repo_path = state["repo_local_path"]
-    logs = list(state.get("logs", []))
+    logs = []
 
-    print("[graph] 📦 Reinstalling deps after config fix...")
-    result = install_dependencies(repo_path)
+    if GRAPH_TRACE:
+        print("[graph] ✅ Config fix applied — 📦 reinstalling deps...")
+    # The test deps config_fix added go into the same pip run as the project's own
+    result = install_dependencies(repo_path, extra_packages=TEST_DEPS)
 
     if result["installed"]:
         logs.append(f"✓ Deps reinstalled ({result['framework']})")
-        print(f"[graph] ✓ Deps reinstalled ({result['framework']})")
     else:
         logs.append(f"ℹ Deps reinstall: {result['message'][:100]}")
-        print(f"[graph] ℹ Deps reinstall: {result['message'][:80]}")
+    if GRAPH_TRACE:
+        print(f"[graph] {logs[-1][:90]}")
 
     return {
-        **state,
         "current_step": "Reinstalling dependencies...",
         "logs": logs,
     }
 
 def _wait_for_approval_node(state: dict) -> dict:
     """A dummy node that acts as a breakpoint for user confirmation."""
-    logs = list(state.get("logs", []))
-    logs.append("⏸ Paused: Awaiting user confirmation to commit.")
+    logs = ["⏸ Paused: Awaiting user confirmation to commit."]
     # The actual pausing is handled by LangGraph's interrupt_before mechanism
     # When resumed, this node just passes state through to commit_and_push
     return {
-        **state,
         "current_step": "Resuming after approval...",
         "logs": logs,
     }
@@ -202,9 +250,12 @@ def build_agent_graph() -> StateGraph:
 
     # ── Initial linear path ──
     graph.set_entry_point("clone_repo")
+    # install_deps (network-bound) and discover_tests (filesystem scan) are
+    # independent, so they run as parallel branches of one super-step; the list
+    # edge makes generate_tests wait for both
     graph.add_edge("clone_repo",       "install_deps")
-    graph.add_edge("install_deps",     "discover_tests")
-    graph.add_edge("discover_tests",   "generate_tests")   # ALWAYS generate tests first
+    graph.add_edge("clone_repo",       "discover_tests")
+    graph.add_edge(["install_deps", "discover_tests"], "generate_tests")   # ALWAYS generate tests first
     graph.add_edge("generate_tests",   "run_tests")
 
     graph.add_edge("run_tests",        "analyze_failures")
@@ -225,13 +276,8 @@ def build_agent_graph() -> StateGraph:
     graph.add_edge("wait_for_approval", "commit_and_push")
 
     # ── Config-fix path: fix → reinstall → run tests ──
-    graph.add_conditional_edges(
-        "apply_config_fix",
-        _after_config_fix,
-        {
-            "reinstall_deps": "reinstall_deps",
-        },
-    )
+    # Unconditional, so a plain edge — no router call on every config fix
+    graph.add_edge("apply_config_fix", "reinstall_deps")
     graph.add_edge("reinstall_deps", "run_tests")
 
     # ── Code-fix path: fix → retry local verifications loop ──
@@ -263,6 +309,6 @@ def build_agent_graph() -> StateGraph:
     graph.add_edge("skip_cicd", "finalize")
     graph.add_edge("finalize", END)
 
-    # Compile with interruption set *before* wait_for_approval
-    # This ensures backend `astream` will `break` safely
+    # Returned uncompiled: main.py compiles it once, with the checkpointer and an
+    # interrupt *before* wait_for_approval so backend `astream` stops there safely
     return graph
@@ -1,5 +1,11 @@
+import functools
+import hashlib
+import hmac
+import json
+import logging
 import os
-import re
+import string
+import threading
 import time
 import uuid
 import asyncio
@@ -7,63 +13,177 @@ from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 from mangum import Mangum
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import certifi
 from pymongo import MongoClient
+from pymongo.write_concern import WriteConcern
 from langgraph.checkpoint.memory import MemorySaver
+from tools.run_tokens import drop_run_token, set_run_token
 
 load_dotenv()
 
-from graph.agent_graph import build_agent_graph
+# Agent-server events (connects, queueing, pause/cancel/errors). Pipeline nodes
+# keep their own [module]-prefixed prints. basicConfig is a no-op when the host
+# (e.g. uvicorn --log-config) has already configured logging.
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+)
+logger = logging.getLogger("healops.agent")
+
+
+# The MongoDB checkpointer is optional: with it, paused runs survive restarts and
+# can be resumed from any worker. Falls back to in-process MemorySaver without it.
+try:
+    from langgraph.checkpoint.mongodb import MongoDBSaver
+    MONGO_CHECKPOINTER_AVAILABLE = True
+except ImportError:
+    MONGO_CHECKPOINTER_AVAILABLE = False
+
+
+@functools.lru_cache(maxsize=1)
+def get_graph():
+    """The compiled agent graph — built on first use, then shared by every run.
+
+    Under Mangum the module body runs on every cold start, so the graph (and the
+    agent modules it pulls in, most of the import time) is only loaded once a
+    handler needs it. One graph serves both modes: auto_commit=True routes
+    straight to commit_and_push, so the interrupt before wait_for_approval only
+    ever fires for manual-approval runs.
+
+    Checkpoints go to MongoDB (reusing the pooled client) when the saver is
+    installed and the database is reachable; otherwise to a MemorySaver that the
+    cache keeps alive for the whole process.
+    """
+    from graph.agent_graph import build_agent_graph
+    checkpointer = None
+    if MONGO_CHECKPOINTER_AVAILABLE:
+        database = get_db()
+        if database is not None:
+            checkpointer = MongoDBSaver(mongo_client, db_name=database.name)
+            logger.info("✓ LangGraph checkpoints stored in MongoDB")
+    if checkpointer is None:
+        checkpointer = MemorySaver()
+        logger.info("ℹ LangGraph checkpoints kept in memory — paused runs are lost on restart")
+    return build_agent_graph().compile(checkpointer=checkpointer, interrupt_before=["wait_for_approval"])
+
+
+async def _get_graph_state(config: dict):
+    """get_graph().get_state on a worker thread — both may hit MongoDB."""
+    return await asyncio.to_thread(lambda: get_graph().get_state(config))
 
-# Initialize persistent memory for LangGraph
-memory = MemorySaver()
-agent_graph = build_agent_graph().compile(checkpointer=memory, interrupt_before=["wait_for_approval"])
 
 # ─── MongoDB Setup ───
+# One client per process, created on first use. Under Mangum (lifespan="off")
+# the lifespan hook never runs, so endpoints connect lazily via get_db(); warm
+# serverless invocations then reuse the same pooled client.
+MONGODB_URI = os.getenv("MONGODB_URI")  # read once, after load_dotenv()
 mongo_client = None
 db = None
+_mongo_lock = threading.Lock()
+_mongo_retry_at = 0.0
+
+# After a failed connect, calls return None without re-pinging for this long
+MONGO_RETRY_INTERVAL = 30.0
+
+# Server certificates are verified against certifi's CA bundle. The pool keeps a
+# few connections open, so status writes rarely pay for a fresh TLS handshake.
+MONGO_CA_FILE = certifi.where()
+MONGO_MAX_POOL_SIZE = 50
+MONGO_MIN_POOL_SIZE = 5
+
+
+def _ensure_indexes(database) -> None:
+    """Index runId — every endpoint and status write looks a run up by it.
+
+    Idempotent, so it simply runs on each process's first connect. A failure
+    (e.g. duplicate runIds in an old collection) is logged, never fatal.
+    """
+    try:
+        database.runresults.create_index("runId", unique=True)
+    except Exception as e:
+        logger.warning("⚠ Could not create runresults.runId index: %s", e)
+
+
+def get_db():
+    """Return the MongoDB database, connecting on first call; None if unavailable.
+
+    A failed connect is retried after MONGO_RETRY_INTERVAL rather than cached.
+    """
+    global mongo_client, db, _mongo_retry_at
+    if db is not None:
+        return db
+    if not MONGODB_URI or time.time() < _mongo_retry_at:
+        return None
+    with _mongo_lock:
+        if db is None and time.time() >= _mongo_retry_at:
+            client = MongoClient(
+                MONGODB_URI,
+                tlsCAFile=MONGO_CA_FILE,
+                serverSelectionTimeoutMS=5000,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+            )
+            try:
+                # Force connection check to catch IP Whitelist/SSL errors immediately
+                client.admin.command('ping')
+                mongo_client = client
+                db = client.get_default_database()
+                logger.info("✓ Agent connected to MongoDB")
+                _ensure_indexes(db)
+            except Exception as e:
+                client.close()
+                _mongo_retry_at = time.time() + MONGO_RETRY_INTERVAL
+                logger.error(
+                    "❌ MONGODB CONNECTION FATAL ERROR ❌ The agent failed to connect to your MongoDB Atlas cluster "
+                    "(%s). Reason: Most likely your current IP Address is NOT whitelisted. Fix: Go to MongoDB Atlas "
+                    "-> Network Access -> Add IP -> 'Allow Access from Anywhere' (0.0.0.0/0)", e,
+                )
+    return db
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Application lifespan: connect/disconnect MongoDB."""
-    global mongo_client, db
-    mongo_uri = os.getenv("MONGODB_URI")
-    if mongo_uri:
-        mongo_client = MongoClient(
-            mongo_uri, 
-            tlsCAFile=certifi.where(),
-            tlsAllowInvalidCertificates=True,
-            serverSelectionTimeoutMS=5000
-        )
-        try:
-            # Force connection check to catch IP Whitelist/SSL errors immediately
-            mongo_client.admin.command('ping')
-            db = mongo_client.get_default_database()
-            print("✓ Agent connected to MongoDB")
-        except Exception as e:
-            print("\n" + "="*70)
-            print("❌ MONGODB CONNECTION FATAL ERROR ❌")
-            print("The agent failed to connect to your MongoDB Atlas cluster.")
-            print("Reason: Most likely your current IP Address is NOT whitelisted.")
-            print("Fix: Go to MongoDB Atlas -> Network Access -> Add IP -> 'Allow Access from Anywhere' (0.0.0.0/0)")
-            print("="*70 + "\n")
-            db = None
+    """Application lifespan: connect eagerly (surfaces config errors at boot), close on exit."""
+    if MONGODB_URI:
+        await asyncio.to_thread(get_db)
     else:
-        print("⚠ MONGODB_URI not set — status updates will be skipped")
+        logger.warning("⚠ MONGODB_URI not set — status updates will be skipped")
+    # Long-lived servers build the graph up front; serverless leaves it to the first run
+    if os.getenv("VERCEL") is None:
+        await asyncio.to_thread(get_graph)
     yield
     if mongo_client:
         mongo_client.close()
 
 
+# orjson is optional: a C encoder several times faster than stdlib json for the
+# status/results payloads (long log arrays). Falls back to JSONResponse without it.
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed."""
+
+    def render(self, content) -> bytes:
+        if not ORJSON_AVAILABLE:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
 app = FastAPI(
     title="CI/CD Healing Agent",
     description="LangGraph-powered autonomous CI/CD repair agent",
     version="2.0.0",
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 app.add_middleware(
@@ -75,7 +195,6 @@ app.add_middleware(
 
 
 # ─── Global error handler — ensures CORS headers are always present ──────────
-from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 
 
@@ -114,58 +233,251 @@ class InvokeRequest(BaseModel):
 
 class ResumeRequest(BaseModel):
     approve: bool
+    github_token: str = ""  # only needed when resuming on a worker that did not start the run
 
 
 # ─── Helpers ───
-GH_PATTERN = re.compile(r"^https://github\.com/[\w.\-]+/[\w.\-]+/?$")
+GH_URL_PREFIX = "https://github.com/"
+GH_NAME_CHARS = frozenset(string.ascii_letters + string.digits + "_.-")
+
+
+def _is_valid_github_url(url: str) -> bool:
+    """https://github.com/<owner>/<repo>, optional trailing slash — checked without regex."""
+    if not url.startswith(GH_URL_PREFIX):
+        return False
+    parts = url[len(GH_URL_PREFIX):].split("/")
+    if len(parts) == 3 and not parts[2]:
+        parts.pop()  # trailing slash
+    return len(parts) == 2 and all(part and GH_NAME_CHARS.issuperset(part) for part in parts)
+
 
-# Global dictionary to track active agent tasks for cancellation
+# Global dictionary to track active agent tasks for cancellation. It also holds the
+# strong reference that keeps a background task alive — the event loop only keeps
+# weak ones — so entries leave via _track_run's done callback, never earlier.
 active_runs: dict[str, asyncio.Task] = {}
 
 
-def update_mongo_status(run_id: str, status: str, current_step: str, results=None, logs=None):
-    """Update run status in MongoDB."""
+def _track_run(run_id: str, coro) -> asyncio.Task:
+    """Start a pipeline task for run_id and register it in active_runs until it ends."""
+    task = asyncio.create_task(coro, name=f"run:{run_id}")
+    active_runs[run_id] = task
+
+    def _untrack(done: asyncio.Task) -> None:
+        # A newer task for the same run (e.g. a resume) may have replaced this one
+        if active_runs.get(run_id) is done:
+            del active_runs[run_id]
+
+    task.add_done_callback(_untrack)
+    return task
+
+# Node updates arriving within this window are merged into one MongoDB write —
+# or fewer, if MONGO_COALESCE_MAX_UPDATES of them pile up first
+MONGO_COALESCE_WINDOW = 0.1
+MONGO_COALESCE_MAX_UPDATES = 16
+
+# Pipelines executing at once — each holds a clone, a dependency install and LLM
+# calls in flight. Runs beyond this wait for a slot (status stays RUNNING with a
+# "Queued" step, which the UI already renders as in progress and stoppable).
+MAX_CONCURRENT_RUNS = int(os.getenv("MAX_CONCURRENT_RUNS", "4"))
+_run_slots = asyncio.Semaphore(MAX_CONCURRENT_RUNS)
+
+
+async def _acquire_run_slot(run_id: str) -> None:
+    """Wait for a pipeline slot, flagging the run as queued if none is free."""
+    if _run_slots.locked():
+        logger.info("All %d agent slots busy — queueing run %s", MAX_CONCURRENT_RUNS, run_id)
+        await update_mongo_status_async(run_id, "RUNNING", "Queued — waiting for a free agent slot...")
+    await _run_slots.acquire()
+
+
+# RUNNING updates are best-effort progress (step + log lines): the primary's
+# acknowledgement is enough, without waiting on replication or the journal.
+# Status changes (paused, final results, errors) keep the default concern.
+PROGRESS_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+
+def update_mongo_status(run_id: str, status: str, current_step: str, results=None, logs=None, progress=False):
+    """Update run status in MongoDB.
+
+    progress=True marks a coalesced progress write: it only applies while the run
+    is still RUNNING, so one that lands late never overwrites ABORTED or a result.
+    """
+    db = get_db()
     if db is None:
         return
+    collection = db.runresults
+    if status == "RUNNING":
+        collection = collection.with_options(write_concern=PROGRESS_WRITE_CONCERN)
     update = {"status": status, "currentStep": current_step}
     if results:
         update["results"] = results
     ops = {"$set": update}
     if logs:
         ops["$push"] = {"logs": {"$each": logs}}
-    db.runresults.update_one({"runId": run_id}, ops)
-
-
-def _process_graph_state(run_id: str, state_iter, initial_log_count: int = 0) -> dict:
-    """Helper to process the stream of graph states."""
-    last_log_count = initial_log_count
-    final_state = None
-    
-    for state in state_iter:
-        for node_name, node_state in state.items():
-            current_step = node_state.get("current_step", "Processing...")
-            all_logs = node_state.get("logs", [])
-            new_logs = all_logs[last_log_count:]
-            last_log_count = len(all_logs)
-            update_mongo_status(run_id, "RUNNING", current_step, logs=new_logs if new_logs else None)
-            final_state = node_state
-    
-    return final_state, last_log_count
+    query = {"runId": run_id, "status": "RUNNING"} if progress else {"runId": run_id}
+    collection.update_one(query, ops)
+
+
+# The coalesced progress write each run has on a worker thread right now. A status
+# change waits for it first, so the two reach MongoDB in order.
+_progress_writes: dict[str, asyncio.Future] = {}
+
+
+async def _flush_progress(run_id: str) -> None:
+    """Wait until run_id's in-flight progress write (if any) has landed or failed."""
+    pending = _progress_writes.get(run_id)
+    if pending is not None:
+        await asyncio.wait([pending])
+
+
+async def update_mongo_status_async(run_id: str, status: str, current_step: str, results=None, logs=None,
+                                    progress=False):
+    """update_mongo_status on a worker thread, so async code never blocks the event
+    loop on a MongoDB round-trip (or on get_db()'s first-connect ping).
+
+    A status change (anything but a progress write) first waits for the run's
+    in-flight progress write, so it is never overtaken by it.
+    """
+    if not progress:
+        await _flush_progress(run_id)
+    await asyncio.to_thread(update_mongo_status, run_id, status, current_step, results, logs, progress)
+
+
+async def _write_progress(run_id: str, current_step: str, logs: list) -> None:
+    """One coalesced progress write; failures are logged, never raised."""
+    try:
+        await update_mongo_status_async(run_id, "RUNNING", current_step, logs=logs or None, progress=True)
+    except Exception as e:
+        logger.error("MongoDB status update failed for %s: %s", run_id, e)
+
+
+def _forget_progress_write(run_id: str, done: asyncio.Future) -> None:
+    """Done callback: unregister the write unless a newer one replaced it."""
+    if _progress_writes.get(run_id) is done:
+        del _progress_writes[run_id]
+
+
+async def _mongo_status_writer(run_id: str, queue: asyncio.Queue) -> None:
+    """Background writer for one run's RUNNING updates.
+
+    Collects what arrives within MONGO_COALESCE_WINDOW of the first pending
+    update (at most MONGO_COALESCE_MAX_UPDATES) into a single update_one (latest
+    step, all log lines in order), run off the event loop. A None item ends the stream: it flushes at once, without
+    sitting out the rest of the window, and stops the writer.
+    """
+    loop = asyncio.get_running_loop()
+    done = False
+    while not done:
+        batch = [await queue.get()]
+        deadline = loop.time() + MONGO_COALESCE_WINDOW
+        while batch[-1] is not None and len(batch) < MONGO_COALESCE_MAX_UPDATES:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        done = batch[-1] is None
+
+        updates = [item for item in batch if item is not None]
+        if not updates:
+            continue
+        current_step = updates[-1][0]
+        logs = [line for _, new_logs in updates for line in new_logs]
+        write = asyncio.ensure_future(_write_progress(run_id, current_step, logs))
+        _progress_writes[run_id] = write
+        write.add_done_callback(functools.partial(_forget_progress_write, run_id))
+        # Shielded: cancelling the writer leaves the write registered until it lands
+        await asyncio.shield(write)
+
+
+async def _stream_graph(run_id: str, graph_input, config: dict) -> dict:
+    """Drive the graph, forwarding each node's update to MongoDB; returns the updates
+    merged into one dict (later nodes win).
+
+    Nodes return only the keys they changed, and only their NEW log lines — the
+    logs reducer does the appending in graph state — so each update's logs are
+    exactly what still needs pushing. Writes go through _mongo_status_writer, so
+    the stream never waits on a MongoDB round-trip; it is flushed before return.
+    """
+    current_step = "Processing..."
+    final_state: dict = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    writer = asyncio.create_task(_mongo_status_writer(run_id, queue))
+    cancelled = False
+
+    try:
+        # "updates": each event carries only the keys a node returned, never full state
+        graph = await asyncio.to_thread(get_graph)  # first build may connect to MongoDB
+        async for state in graph.astream(graph_input, config, stream_mode="updates"):
+            for node_name, node_state in state.items():
+                # LangGraph emits interrupt tuples (not dicts) at interrupt_before nodes.
+                # Skip these safely; callers check for the interrupt via get_state().
+                if not isinstance(node_state, dict):
+                    continue
+                current_step = node_state.get("current_step", current_step)
+                queue.put_nowait((current_step, node_state.get("logs") or []))
+                final_state.update(node_state)
+    except asyncio.CancelledError:
+        cancelled = True
+        raise
+    finally:
+        if cancelled:
+            # /api/stop already wrote the final status — drop stale RUNNING updates. A write
+            # already on its worker thread cannot be cancelled; it is a progress write, so
+            # it only matches while the run is still RUNNING and leaves ABORTED alone.
+            writer.cancel()
+        else:
+            queue.put_nowait(None)
+            await writer  # later status writes must land after these
+
+    return final_state
+
+
+async def _record_outcome(run_id: str, config: dict, final_state: dict) -> None:
+    """After a stream ends: flag a pause for approval, or save the final results."""
+    # Check if the graph is paused/interrupted
+    graph_state = await _get_graph_state(config)
+    if graph_state.next and "wait_for_approval" in graph_state.next:
+        # We hit the interrupt hook. Update MongoDB so the UI knows we are waiting.
+        logger.info("Pipeline paused for user approval on run %s", run_id)
+        await update_mongo_status_async(run_id, "AWAITING_APPROVAL", "Pending User Confirmation")
+        return
+
+    drop_run_token(run_id)  # finished — nothing left to resume
+    # If it finished normally without interruption, save final results
+    if final_state and "results" in final_state:
+        ci_status = final_state["results"].get("ci_cd_status", "FAILED")
+        await update_mongo_status_async(run_id, ci_status, "Completed", final_state["results"])
+    else:
+        await update_mongo_status_async(run_id, "FAILED", "Agent completed without results")
+
+
+def _is_resumable_failure(run: dict, graph_state) -> bool:
+    """A FAILED run whose checkpoint still has pending nodes crashed mid-graph.
+
+    The checkpointer saved every completed node (clone, deps, generated tests,
+    fixes…), so resuming re-runs only the node that raised.
+    """
+    return run.get("status") == "FAILED" and bool(graph_state.next)
 
 
 async def run_agent_pipeline(payload: InvokeRequest):
     """Run the full agent pipeline in a background task."""
     run_id = payload.run_id
+    slot_held = False
 
     try:
-        update_mongo_status(run_id, "RUNNING", "Starting agent...")
+        await _acquire_run_slot(run_id)
+        slot_held = True
+        await update_mongo_status_async(run_id, "RUNNING", "Starting agent...")
 
         # Build initial state
         initial_state = {
             "run_id": run_id,
             "github_url": payload.github_url,
             "commit_message": payload.commit_message,
-            "github_token": payload.github_token,
             "auto_commit": payload.auto_commit,
             "branch_name": "",
             "repo_local_path": "",
@@ -179,6 +491,7 @@ async def run_agent_pipeline(payload: InvokeRequest):
             "iteration": 1,
             "ci_cd_timeline": [],
             "ci_cd_status": "PENDING",
+            "ci_cd_cache": {},
             "start_time": time.time(),
             "end_time": 0.0,
             "current_step": "Initializing...",
@@ -192,111 +505,73 @@ async def run_agent_pipeline(payload: InvokeRequest):
             "config_fix_changed": False,
             "tests_generated": False,
             "no_diff_counts": {},
+            "file_content_hashes": {},
             "effective_repo_url": "",
             "forked_from": "",
         }
 
         # Configuration for thread ID matching tracking state in memory
+        set_run_token(run_id, payload.github_token)  # never part of checkpointed state
         config = {"configurable": {"thread_id": run_id}}
 
         # Execute the graph
-        # Currently astream runs blocking synchronous nodes in an async generator.
-        # But wait, python's list comprehension over a generator works fine, but astream is async.
-        last_log_count = 0
-        final_state = None
-        
-        async for state in agent_graph.astream(initial_state, config):
-            for node_name, node_state in state.items():
-                # LangGraph emits interrupt tuples (not dicts) at interrupt_before nodes.
-                # Skip these safely; the interrupt is handled below via get_state().
-                if not isinstance(node_state, dict):
-                    continue
-                current_step = node_state.get("current_step", "Processing...")
-                all_logs = node_state.get("logs", [])
-                new_logs = all_logs[last_log_count:]
-                last_log_count = len(all_logs)
-                update_mongo_status(run_id, "RUNNING", current_step, logs=new_logs if new_logs else None)
-                final_state = node_state
-
-        # Check if the graph is paused/interrupted
-        graph_state = agent_graph.get_state(config)
-        if graph_state.next and "wait_for_approval" in graph_state.next:
-            # We hit the interrupt hook. Update MongoDB so the UI knows we are waiting.
-            print(f"[agent] Pipeline paused for user approval on run {run_id}")
-            update_mongo_status(run_id, "AWAITING_APPROVAL", "Pending User Confirmation")
-            return
-
-        # If it finished normally without interruption, save final results
-        if final_state and "results" in final_state:
-            ci_status = final_state["results"].get("ci_cd_status", "FAILED")
-            update_mongo_status(run_id, ci_status, "Completed", final_state["results"])
-        else:
-            update_mongo_status(run_id, "FAILED", "Agent completed without results")
+        final_state = await _stream_graph(run_id, initial_state, config)
+        await _record_outcome(run_id, config, final_state)
 
     except asyncio.CancelledError:
-        print(f"[agent] Pipeline {run_id} was manually canceled.")
+        logger.info("Pipeline %s was manually canceled.", run_id)
         # We don't need to update mongo status here, the /api/stop handler does it immediately
         # to ensure the UI feels responsive.
         raise
     except Exception as e:
-        print(f"[agent] Pipeline error: {e}")
-        update_mongo_status(run_id, "FAILED", f"Error: {str(e)[:200]}")
+        logger.error("Pipeline %s error: %s", run_id, e)
+        await update_mongo_status_async(run_id, "FAILED", f"Error: {str(e)[:200]}")
     finally:
-        # Clean up the task reference when done (or canceled)
-        active_runs.pop(run_id, None)
+        if slot_held:
+            _run_slots.release()
 
 
 async def resume_agent_pipeline(run_id: str, approve: bool):
-    """Resume a paused agent pipeline in the background."""
+    """Resume a paused (or crashed) agent pipeline from its checkpoint in the background."""
+    slot_held = False
     try:
         config = {"configurable": {"thread_id": run_id}}
-        graph_state = agent_graph.get_state(config)
+        graph_state = await _get_graph_state(config)
         
         if not graph_state.next:
-            print(f"[agent] Cannot resume {run_id}: no pending tasks.")
+            logger.warning("Cannot resume %s: no pending tasks.", run_id)
             return
 
         if not approve:
             # If user rejected the commit, we need to bypass 'wait_for_approval' and 'commit_and_push'
             # and head straight to 'finalize'. The cleanest way in LangGraph is to inject 
             # node state dynamically. BUT, we can also just update state to say "user aborted"
-            update_mongo_status(run_id, "REJECTED", "Commit Aborted by User")
+            drop_run_token(run_id)
+            await update_mongo_status_async(run_id, "REJECTED", "Commit Aborted by User")
             return
 
-        update_mongo_status(run_id, "RUNNING", "Resuming agent for commit...", logs=["User approved commit... resuming."])
+        await _acquire_run_slot(run_id)
+        slot_held = True
 
-        last_log_count = len(graph_state.values.get("logs", []))
-        final_state = None
+        if "wait_for_approval" in graph_state.next:
+            await update_mongo_status_async(run_id, "RUNNING", "Resuming agent for commit...", logs=["User approved commit... resuming."])
+        else:
+            await update_mongo_status_async(run_id, "RUNNING", f"Resuming from checkpoint ({graph_state.next[0]})...",
+                                logs=[f"Retrying from last checkpoint — re-running {graph_state.next[0]}"])
 
         # Resume the graph by passing None instead of initial_state
-        async for state in agent_graph.astream(None, config):
-            for node_name, node_state in state.items():
-                # Skip interrupt tuples emitted by LangGraph at breakpoints
-                if not isinstance(node_state, dict):
-                    continue
-                current_step = node_state.get("current_step", "Processing...")
-                all_logs = node_state.get("logs", [])
-                new_logs = all_logs[last_log_count:]
-                last_log_count = len(all_logs)
-                update_mongo_status(run_id, "RUNNING", current_step, logs=new_logs if new_logs else None)
-                final_state = node_state
-        
-        # Save final results
-        if final_state and "results" in final_state:
-            ci_status = final_state["results"].get("ci_cd_status", "FAILED")
-            update_mongo_status(run_id, ci_status, "Completed", final_state["results"])
-        else:
-            update_mongo_status(run_id, "FAILED", "Agent completed without results")
-            
+        final_state = await _stream_graph(run_id, None, config)
+        await _record_outcome(run_id, config, final_state)
+
     except asyncio.CancelledError:
-        print(f"[agent] Resume Pipeline {run_id} was manually canceled.")
+        logger.info("Resume Pipeline %s was manually canceled.", run_id)
         raise
     except Exception as e:
-        print(f"[agent] Pipeline resume error: {e}")
-        update_mongo_status(run_id, "FAILED", f"Error on resume: {str(e)[:200]}")
+        logger.error("Pipeline %s resume error: %s", run_id, e)
+        await update_mongo_status_async(run_id, "FAILED", f"Error on resume: {str(e)[:200]}")
     finally:
-        # Clean up the task reference when done (or canceled)
-        active_runs.pop(run_id, None)
+        if slot_held:
+            _run_slots.release()
 
 # ─── API Endpoints ───
 
@@ -308,9 +583,10 @@ async def run_agent(request: RunAgentRequest):
     Creates a run record, launches the agent pipeline, returns runId.
     """
     # Validation
-    if not GH_PATTERN.match(request.github_url):
+    if not _is_valid_github_url(request.github_url):
         raise HTTPException(status_code=400, detail="Invalid GitHub URL format.")
 
+    db = await asyncio.to_thread(get_db)
     if db is None:
         raise HTTPException(
             status_code=503, 
@@ -319,7 +595,7 @@ async def run_agent(request: RunAgentRequest):
 
     # Create run record
     run_id = str(uuid.uuid4())
-    db.runresults.insert_one({
+    await asyncio.to_thread(db.runresults.insert_one, {
         "runId": run_id,
         "status": "RUNNING",
         "currentStep": "Initializing...",
@@ -335,8 +611,7 @@ async def run_agent(request: RunAgentRequest):
         github_token=request.github_token,
         auto_commit=request.auto_commit,
     )
-    task = asyncio.create_task(run_agent_pipeline(invoke_payload))
-    active_runs[run_id] = task
+    _track_run(run_id, run_agent_pipeline(invoke_payload))
 
     return {"runId": run_id, "status": "RUNNING"}
 
@@ -345,36 +620,49 @@ async def run_agent(request: RunAgentRequest):
 async def resume_agent(run_id: str, request: ResumeRequest):
     """
     POST /api/resume/{run_id}
-    Body: { approve: true|false }
-    Resumes a paused agent pipeline (or aborts it).
+    Body: { approve: true|false, github_token?: str } — the token only when this
+    worker did not start the run (tokens are never checkpointed).
+    Resumes a paused agent pipeline (or aborts it). A run that FAILED mid-graph
+    resumes from its last checkpoint instead of starting over.
     """
+    db = await asyncio.to_thread(get_db)
     if db is None:
         raise HTTPException(status_code=503, detail="MongoDB is not connected.")
 
-    run = db.runresults.find_one({"runId": run_id}, {"_id": 0})
+    run = await asyncio.to_thread(db.runresults.find_one, {"runId": run_id}, {"_id": 0, "status": 1})
     if not run:
         raise HTTPException(status_code=404, detail="Run not found.")
 
-    if run["status"] != "AWAITING_APPROVAL":
-        raise HTTPException(status_code=400, detail="This run is not awaiting approval.")
+    if run["status"] != "AWAITING_APPROVAL" and not _is_resumable_failure(
+        run, await _get_graph_state({"configurable": {"thread_id": run_id}})
+    ):
+        raise HTTPException(status_code=400, detail="This run is not awaiting approval or resumable.")
+
+    if request.github_token:
+        set_run_token(run_id, request.github_token)
 
     # Launch resumption in background task and track it
-    task = asyncio.create_task(resume_agent_pipeline(run_id, request.approve))
-    if request.approve:
-        active_runs[run_id] = task
+    _track_run(run_id, resume_agent_pipeline(run_id, request.approve))
 
     new_status = "RUNNING" if request.approve else "REJECTED"
     if not request.approve:
-        db.runresults.update_one({"runId": run_id}, {"$set": {"status": "REJECTED", "currentStep": "Aborted by User"}})
+        await asyncio.to_thread(
+            db.runresults.update_one, {"runId": run_id}, {"$set": {"status": "REJECTED", "currentStep": "Aborted by User"}}
+        )
 
     return {"runId": run_id, "status": new_status, "message": "Resume signal processed."}
 
+# How long /api/stop waits for a cancelled pipeline to finish unwinding
+STOP_WAIT_TIMEOUT = 2.0
+
+
 @app.post("/api/stop/{run_id}")
 async def stop_agent(run_id: str):
     """
     POST /api/stop/{run_id}
     Forcefully cancels the running agent task if it exists.
     """
+    db = await asyncio.to_thread(get_db)
     if db is None:
         raise HTTPException(status_code=503, detail="MongoDB is not connected.")
 
@@ -384,35 +672,69 @@ async def stop_agent(run_id: str):
     if task and not task.done():
         task.cancel()
         cancelled = True
-        print(f"[agent] Sent cancellation signal to run_id: {run_id}")
+        logger.info("Sent cancellation signal to run_id: %s", run_id)
     else:
-        print(f"[agent] Warning: No active task found for {run_id} to cancel (might be already finished or paused).")
-
-    # 2. Update DB status immediately so UI reacts instantly
-    db.runresults.update_one(
-        {"runId": run_id}, 
-        {"$set": {"status": "ABORTED", "currentStep": "Manually stopped by User"}}
-    )
-    
-    # 3. Cleanup tracking
-    active_runs.pop(run_id, None)
-
+        logger.warning("No active task found for %s to cancel (might be already finished or paused).", run_id)
+    drop_run_token(run_id)
+
+    # 2. Update DB status immediately so UI reacts instantly — while the task
+    # unwinds, so confirming the cancellation costs no extra round-trip
+    pending = [update_mongo_status_async(run_id, "ABORTED", "Manually stopped by User")]
+    if cancelled:
+        pending.append(asyncio.wait([task], timeout=STOP_WAIT_TIMEOUT))
+    update_result, *_ = await asyncio.gather(*pending, return_exceptions=True)
+    if isinstance(update_result, Exception):
+        raise update_result
+    # The task leaves active_runs through its done callback once the cancellation lands
+
+    if not cancelled:
+        message = "Agent marked as aborted (no active task)."
+    elif task.done():
+        message = "Agent strictly aborted."
+    else:
+        message = "Agent marked as aborted (still shutting down)."
     return {
         "runId": run_id, 
         "status": "ABORTED", 
-        "message": "Agent strictly aborted." if cancelled else "Agent marked as aborted (no active task)."
+        "message": message,
     }
 
+# Most log lines one status poll returns; a client further behind catches up over
+# the next polls
+STATUS_LOG_PAGE = 1000
+
+
+def _find_status(db, run_id: str, since: int):
+    """Status fields plus logs[since:since + STATUS_LOG_PAGE] and the total log count.
+
+    The slice happens in MongoDB, so a poll only transfers lines the client
+    has not seen yet.
+    """
+    logs = {"$ifNull": ["$logs", []]}
+    pipeline = [
+        {"$match": {"runId": run_id}},
+        {"$limit": 1},
+        {"$project": {
+            "_id": 0, "runId": 1, "status": 1, "currentStep": 1,
+            "logs": {"$slice": [logs, since, STATUS_LOG_PAGE]},
+            "logsTotal": {"$size": logs},
+        }},
+    ]
+    return next(db.runresults.aggregate(pipeline), None)
+
+
 @app.get("/api/status/{run_id}")
-async def get_status(run_id: str):
+async def get_status(run_id: str, since: int = Query(0, ge=0)):
     """
-    GET /api/status/:runId
-    Returns current run status + activity logs from MongoDB.
+    GET /api/status/:runId?since=N
+    Returns current run status + activity logs from MongoDB — only the lines
+    from index `since` on (next poll: since + len(logs)), plus `logsTotal`.
     """
+    db = await asyncio.to_thread(get_db)
     if db is None:
         raise HTTPException(status_code=503, detail="MongoDB is not connected.")
 
-    run = db.runresults.find_one({"runId": run_id}, {"_id": 0})
+    run = await asyncio.to_thread(_find_status, db, run_id, since)
     if not run:
         raise HTTPException(status_code=404, detail="Run not found.")
 
@@ -420,7 +742,8 @@ async def get_status(run_id: str):
         "runId": run["runId"],
         "status": run["status"],
         "currentStep": run.get("currentStep", ""),
-        "logs": run.get("logs", []),
+        "logs": run["logs"],
+        "logsTotal": run["logsTotal"],
     }
 
 
@@ -430,10 +753,11 @@ async def get_results(run_id: str):
     GET /api/results/:runId
     Returns full results when the run is complete.
     """
+    db = await asyncio.to_thread(get_db)
     if db is None:
         raise HTTPException(status_code=503, detail="MongoDB is not connected.")
 
-    run = db.runresults.find_one({"runId": run_id}, {"_id": 0})
+    run = await asyncio.to_thread(db.runresults.find_one, {"runId": run_id}, {"_id": 0, "runId": 1, "status": 1, "results": 1})
     if not run:
         raise HTTPException(status_code=404, detail="Run not found.")
 
@@ -443,6 +767,46 @@ async def get_results(run_id: str):
     return run.get("results") or {"runId": run["runId"], "status": run["status"]}
 
 
+# Shared secret of the repo's GitHub webhook (workflow_run events). Unset = the
+# endpoint is disabled and CI monitoring relies on polling alone.
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+
+
+@app.post("/webhook/github")
+async def github_webhook(request: Request):
+    """
+    POST /webhook/github
+    Receives GitHub `workflow_run` events and wakes the CI/CD poll waiting on
+    that branch, so completion is seen without waiting for the next poll tick.
+    """
+    if not GITHUB_WEBHOOK_SECRET:
+        raise HTTPException(status_code=404, detail="GitHub webhook is not configured.")
+
+    body = await request.body()
+    expected = "sha256=" + hmac.new(GITHUB_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    signature = request.headers.get("X-Hub-Signature-256", "")
+    # Compared as bytes: compare_digest raises TypeError on non-ASCII str input
+    if not hmac.compare_digest(expected.encode(), signature.encode("utf-8", "surrogateescape")):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature.")
+
+    event = request.headers.get("X-GitHub-Event", "")
+    if event != "workflow_run":
+        return {"received": event, "handled": False}  # e.g. the initial "ping"
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        # e.g. a delivery configured as application/x-www-form-urlencoded
+        raise HTTPException(status_code=400, detail="Webhook body must be a JSON object (content type application/json).")
+    if payload.get("action") != "completed":
+        return {"received": event, "handled": False}
+
+    from tools.github_api_tools import notify_workflow_run
+    return {"received": event, "handled": notify_workflow_run(payload)}
+
+
 @app.get("/")
 async def root():
     return {"service": "HEALOPS CI/CD Healing Agent", "status": "ok", "version": "2.0.0"}
@@ -459,5 +823,19 @@ handler = Mangum(app, lifespan="off")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop + httptools (both from uvicorn[standard]) are selected by name, with
+    # asyncio/h11 when one is missing (e.g. uvloop has no Windows build). One worker
+    # on purpose: active_runs, the run slots and a MemorySaver checkpointer are per-process.
+    try:
+        import uvloop  # noqa: F401
+        loop_impl = "uvloop"
+    except ImportError:
+        loop_impl = "asyncio"
+    try:
+        import httptools  # noqa: F401
+        http_impl = "httptools"
+    except ImportError:
+        http_impl = "h11"
+    logger.info("Serving with loop=%s http=%s", loop_impl, http_impl)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop=loop_impl, http=http_impl)
 
@@ -11,6 +11,7 @@ class FixEntry(BaseModel):
     line_number: int = Field(..., description="Line number where the bug was detected (0 for generated/config)")
     commit_message: str = Field(..., description="Git commit message for this fix")
     status: str = Field(default="Fixed", description="Fix status: Fixed | Failed | Generated")
+    attempts: int = Field(default=1, description="Failed attempts on this file (repeated Failed entries are compacted into the latest)")
 
 
 class CICDEntry(BaseModel):
@@ -28,14 +29,20 @@ class ScoreBreakdown(BaseModel):
     efficiency_penalty: int = Field(default=0, description="-2 per commit over 20")
     final: int = Field(default=100, description="Final computed score")
 
-    def calculate(self, time_taken_seconds: float, commit_count: int) -> "ScoreBreakdown":
-        """Recalculate score based on time and commits."""
-        self.base = 100
-        self.speed_bonus = 10 if time_taken_seconds < 300 else 0
-        extra_commits = max(0, commit_count - 20)
-        self.efficiency_penalty = -(extra_commits * 2)
-        self.final = self.base + self.speed_bonus + self.efficiency_penalty
-        return self
+    @staticmethod
+    def compute(time_taken_seconds: float, commit_count: int) -> "ScoreBreakdown":
+        """Score for a run's time and commits — builds the breakdown in one step.
+
+        The values are computed here, so model_construct skips re-validating them.
+        """
+        speed_bonus = 10 if time_taken_seconds < 300 else 0
+        efficiency_penalty = -2 * max(0, commit_count - 20)
+        return ScoreBreakdown.model_construct(
+            base=100,
+            speed_bonus=speed_bonus,
+            efficiency_penalty=efficiency_penalty,
+            final=100 + speed_bonus + efficiency_penalty,
+        )
 
 
 class AgentResults(BaseModel):
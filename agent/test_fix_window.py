@@ -0,0 +1,80 @@
+"""Offline checks for the windowed fix splice — the LLM is replaced by a stub.
+
+Run with `python -m pytest -q test_fix_window.py` from the agent/ directory.
+"""
+import logging
+import os
+import re
+
+import pytest
+
+os.environ.setdefault("OPENROUTER_API_KEY", "offline")
+
+import tools.openrouter_tools as ot
+
+# 100-line file whose bug sits on the last line
+FILE = "".join(f"x{i} = {i}\n" for i in range(1, 100)) + "total = x1 - x2  # BUG\n"
+FIXED = FILE.replace("x1 - x2  # BUG", "x1 + x2")
+
+_SECTION_RE = re.compile(
+    r"(?:Code Window|Code Region) \(lines \d+-\d+\):\n(.*?)\n\nOutput the FIXED"
+    r"|Complete File Content:\n(.*?)\n\nOutput the COMPLETE",
+    re.DOTALL,
+)
+
+
+class _Reply:
+    def __init__(self, content):
+        self.content = content
+
+
+class _StubLLM:
+    """Echoes the code it was shown with the bug fixed, like a well-behaved model."""
+
+    def _answer(self, messages):
+        m = _SECTION_RE.search(messages[-1].content)
+        code = m.group(1) if m.group(1) is not None else m.group(2)
+        return code.replace("x1 - x2  # BUG", "x1 + x2")
+
+    def invoke(self, messages, **kwargs):
+        return _Reply(self._answer(messages))
+
+    def stream(self, messages, **kwargs):
+        yield _Reply(self._answer(messages))
+
+
+@pytest.fixture(autouse=True)
+def _offline(monkeypatch):
+    """Stub the LLM and keep the prompt/response dumps out of the cwd."""
+    quiet = logging.getLogger("healops.test.quiet")
+    quiet.disabled = True
+    monkeypatch.setattr(ot, "get_llm", lambda *args, **kwargs: _StubLLM())
+    monkeypatch.setattr(ot, "_prompt_log", quiet)
+    monkeypatch.setattr(ot, "_raw_log", quiet)
+
+
+def test_targeted_fix_line_past_end_of_file():
+    for line_number in (131, 200):
+        assert ot.generate_targeted_fix(FILE, "err", "LOGIC", line_number) == FIXED
+
+
+def test_one_step_fix_line_past_end_of_file():
+    # Falls back to the whole file instead of splicing an empty window at EOF
+    for line_number in (131, 200):
+        assert ot.generate_one_step_fix(FILE, "err", "LOGIC", line_number).strip() == FIXED.strip()
+
+
+def test_one_step_fix_rejects_mis_sized_window(monkeypatch):
+    whole_file = _StubLLM()
+    whole_file._answer = lambda messages: FIXED  # the whole file echoed for a 61-line window
+    monkeypatch.setattr(ot, "get_llm", lambda *args, **kwargs: whole_file)
+    assert ot.generate_one_step_fix(FILE, "err", "LOGIC", 50) == FILE
+
+
+def test_fix_line_in_range():
+    assert ot.generate_targeted_fix(FILE, "err", "LOGIC", 100) == FIXED
+    assert ot.generate_one_step_fix(FILE, "err", "LOGIC", 100) == FIXED
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
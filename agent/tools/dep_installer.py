@@ -1,34 +1,84 @@
 """Dependency installer — auto-detect and install project dependencies before testing."""
 
 import os
+import shutil
 import subprocess
 import sys
+import tomllib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Sequence
 
 
-def install_dependencies(repo_path: str) -> dict:
+def _pip_install_cmd(*args: str) -> list[str]:
+    """Install command for the agent's interpreter: uv when on PATH (much faster
+    resolver), else pip preferring wheels and skipping .pyc compilation.
+
+    Both keep their default download/wheel cache, so repeat runs reuse it.
+    """
+    uv = shutil.which("uv")
+    if uv:
+        return [uv, "pip", "install", "--python", sys.executable, "-q", *args]
+    return [sys.executable, "-m", "pip", "install", "-q", "--disable-pip-version-check",
+            "--prefer-binary", "--no-compile", *args]
+
+
+def install_dependencies(repo_path: str, extra_packages: Sequence[str] = ()) -> dict:
     """
     Auto-detect and install project dependencies.
     Supports: requirements.txt, setup.py, pyproject.toml (Python)
               package.json (Node.js)
+    extra_packages (e.g. test deps) are installed in the same pip run as pytest.
     Returns: { 'installed': bool, 'framework': str, 'message': str }
+
+    pip and npm touch different tools and directories, so the Python and
+    Node.js installs run side by side; pip commands stay strictly sequential.
     """
-    results = []
+    has_node = os.path.exists(os.path.join(repo_path, "package.json"))
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        node_future = pool.submit(_install_node, repo_path) if has_node else None
+        results = _install_python(repo_path, ensure_pytest=has_node, extra_packages=extra_packages)
+        if node_future is not None:
+            results += node_future.result()
+
+    if not results:
+        return {
+            "installed": False,
+            "framework": "none",
+            "message": "No dependency file found (requirements.txt, setup.py, pyproject.toml, package.json)",
+        }
+
+    installed = all(ok for _, ok, _ in results)
+    frameworks = ", ".join(f for f, _, _ in results)
+    messages = "; ".join(f"{f}: {m}" for f, _, m in results)
+
+    return {
+        "installed": installed,
+        "framework": frameworks,
+        "message": messages if not installed else f"Installed from {frameworks}",
+    }
+
 
-    # ── Python dependencies ──
+def _install_python(
+    repo_path: str, ensure_pytest: bool, extra_packages: Sequence[str] = (),
+) -> list[tuple[str, bool, str]]:
+    """Install Python deps, then make sure pytest (plus extra_packages) exists —
+    whenever any dependency file was found (ensure_pytest covers a package.json-only
+    repo) or extra packages were asked for."""
+    results = []
     req_txt = os.path.join(repo_path, "requirements.txt")
     setup_py = os.path.join(repo_path, "setup.py")
     pyproject = os.path.join(repo_path, "pyproject.toml")
 
     if os.path.exists(req_txt):
         ok, msg = _run_install(
-            [sys.executable, "-m", "pip", "install", "-r", "requirements.txt", "-q", "--disable-pip-version-check"],
+            _pip_install_cmd("-r", "requirements.txt"),
             repo_path,
         )
         results.append(("requirements.txt", ok, msg))
 
     elif os.path.exists(setup_py):
         ok, msg = _run_install(
-            [sys.executable, "-m", "pip", "install", "-e", ".", "-q", "--disable-pip-version-check"],
+            _pip_install_cmd("-e", "."),
             repo_path,
         )
         results.append(("setup.py", ok, msg))
@@ -42,52 +92,40 @@ def install_dependencies(repo_path: str) -> dict:
             results.append(("pyproject.toml (poetry)", ok, msg))
         else:
             ok, msg = _run_install(
-                [sys.executable, "-m", "pip", "install", "-e", ".", "-q", "--disable-pip-version-check"],
+                _pip_install_cmd("-e", "."),
                 repo_path,
             )
             results.append(("pyproject.toml", ok, msg))
 
-    # ── Node.js dependencies ──
-    pkg_json = os.path.join(repo_path, "package.json")
-    if os.path.exists(pkg_json):
-        # On Windows, subprocess cannot find 'npm' without the .cmd extension
-        npm_exe = "npm.cmd" if sys.platform == "win32" else "npm"
-        # Prefer npm ci for reproducible installs, fall back to npm install
-        lock_file = os.path.join(repo_path, "package-lock.json")
-        cmd = [npm_exe, "ci", "--silent"] if os.path.exists(lock_file) else [npm_exe, "install", "--silent"]
-        ok, msg = _run_install(cmd, repo_path)
-        results.append(("package.json", ok, msg))
+    if results or ensure_pytest or extra_packages:
+        # Ensure pytest exists for Python projects
+        _run_install(_pip_install_cmd("pytest", *extra_packages), repo_path)
+    return results
 
-    if not results:
-        return {
-            "installed": False,
-            "framework": "none",
-            "message": "No dependency file found (requirements.txt, setup.py, pyproject.toml, package.json)",
-        }
 
-    installed = all(ok for _, ok, _ in results)
-    frameworks = ", ".join(f for f, _, _ in results)
-    messages = "; ".join(f"{f}: {m}" for f, _, m in results)
-
-    # Ensure pytest exists for Python projects
-    _run_install(
-        [sys.executable, "-m", "pip", "install", "pytest", "-q"],
-        repo_path,
-    )
-
-    return {
-        "installed": installed,
-        "framework": frameworks,
-        "message": messages if not installed else f"Installed from {frameworks}",
-    }
+def _install_node(repo_path: str) -> list[tuple[str, bool, str]]:
+    """npm ci (or npm install without a lockfile) for a package.json repo."""
+    # On Windows, subprocess cannot find 'npm' without the .cmd extension
+    npm_exe = "npm.cmd" if sys.platform == "win32" else "npm"
+    # Prefer npm ci for reproducible installs, fall back to npm install
+    lock_file = os.path.join(repo_path, "package-lock.json")
+    cmd = [npm_exe, "ci", "--silent"] if os.path.exists(lock_file) else [npm_exe, "install", "--silent"]
+    ok, msg = _run_install(cmd, repo_path)
+    return [("package.json", ok, msg)]
 
 
 def _is_poetry_project(pyproject_path: str) -> bool:
-    """Check if a pyproject.toml is a Poetry project."""
+    """Check if a pyproject.toml is a Poetry project (has a [tool.poetry] table)."""
     try:
-        with open(pyproject_path, "r", encoding="utf-8") as f:
-            content = f.read()
-        return "[tool.poetry]" in content
+        with open(pyproject_path, "rb") as f:
+            return "poetry" in tomllib.load(f).get("tool", {})
+    except tomllib.TOMLDecodeError:
+        # Malformed TOML — fall back to looking for the section header
+        try:
+            with open(pyproject_path, "r", encoding="utf-8") as f:
+                return "[tool.poetry]" in f.read()
+        except Exception:
+            return False
     except Exception:
         return False
 
@@ -111,3 +149,4 @@ def _run_install(cmd: list[str], cwd: str) -> tuple[bool, str]:
         return False, "Timed out after 120s"
     except Exception as e:
         return False, str(e)[:200]
+
@@ -1,7 +1,13 @@
 """Git operations using GitPython — clone, branch, commit, push, cleanup."""
 
 import os
+import re
+import secrets
 import shutil
+import stat
+import subprocess
+import sys
+import threading
 
 # Prevent GitPython from crashing on import when git binary is not in PATH.
 # Required for Vercel/Lambda environments where git is not pre-installed.
@@ -17,18 +23,34 @@ except ImportError:
     print("[git_tools] GitPython not available — git operations will be skipped")
 
 
-def clone_repo(github_url: str, dest_path: str, github_token: str = "") -> git.Repo:
+# Credentials embedded in an HTTPS remote URL — scrubbed from error messages
+_URL_CREDENTIALS = re.compile(r"(https://)[^/@\s]+@")
+
+
+def clone_repo(github_url: str, dest_path: str, github_token: str = "") -> None:
     """
     Clone a GitHub repository into dest_path.
     If github_token is provided, it injects the token into the HTTPS URL.
+
+    Shallow partial clone of the default branch only: the agent never reads
+    history, it only commits on top of HEAD and pushes a new branch.
+    Runs `git clone` directly — GitPython's clone_from would also build a Repo
+    object (more git calls) that no caller uses; later steps open their own.
     """
     clone_url = github_url
     if github_token and github_url.startswith("https://"):
         clone_url = github_url.replace("https://", f"https://{github_token}@")
-        
-    repo = git.Repo.clone_from(clone_url, dest_path)
+
+    result = subprocess.run(
+        ["git", "clone", "--depth=1", "--single-branch", "--filter=blob:none", "--", clone_url, dest_path],
+        capture_output=True,
+        text=True,
+        errors="replace",
+    )
+    if result.returncode != 0:
+        stderr = _URL_CREDENTIALS.sub(r"\1***@", result.stderr.strip())
+        raise RuntimeError(f"git clone failed: {stderr}")
     print(f"[git_tools] Cloned {github_url} -> {dest_path}")
-    return repo
 
 
 def create_branch_and_checkout(repo_path: str, branch_name: str) -> None:
@@ -47,8 +69,10 @@ def commit_and_push(repo_path: str, branch_name: str, commit_message: str) -> bo
     repo = git.Repo(repo_path)
     repo.git.add("--all")
 
-    # Check if there are changes to commit
-    if repo.is_dirty() or repo.untracked_files:
+    # Check if there are changes to commit — `add --all` staged everything, so an
+    # exit-code-only `diff --cached --quiet` is enough (no status/untracked listing)
+    staged_status, _, _ = repo.git.diff("--cached", "--quiet", with_extended_output=True, with_exceptions=False)
+    if staged_status != 0:
         repo.index.commit(f"[AI-AGENT] {commit_message}")
 
         # Push - explicitly propagate failures so caller can handle them
@@ -65,9 +89,11 @@ def commit_and_push(repo_path: str, branch_name: str, commit_message: str) -> bo
 
 
 def cleanup_repo(repo_path: str) -> bool:
-    """Delete the cloned repository directory after work is done."""
-    import stat
-    import threading
+    """Delete the cloned repository directory after work is done.
+
+    The rmtree runs on a daemon thread, so finalize_node returns without waiting
+    on tens of thousands of unlinks; returns True once cleanup is scheduled.
+    """
 
     def _on_rm_error(func, path, exc_info):
         """Handle read-only .git files on Windows."""
@@ -87,23 +113,45 @@ def cleanup_repo(repo_path: str) -> bool:
                     del repo
                 except Exception:
                     pass
-                shutil.rmtree(repo_path, onerror=_on_rm_error)
+                _fast_rmtree(repo_path, _on_rm_error)
                 print(f"[git_tools] Cleaned up local repo: {repo_path}")
             else:
                 print(f"[git_tools] Repo path not found (already cleaned): {repo_path}")
         except Exception as e:
             print(f"[git_tools] Cleanup failed for {repo_path}: {e}")
 
-    threading.Thread(target=_do_cleanup, daemon=True).start()
+    threading.Thread(target=_do_cleanup, name=f"cleanup:{os.path.basename(os.path.dirname(repo_path))}", daemon=True).start()
     return True
 
 
+def _fast_rmtree(path: str, onerror) -> None:
+    """Delete a directory tree with the OS-native tool (rm -rf / rd /s /q).
+
+    Much faster than shutil.rmtree on large clones (node_modules, .git packs);
+    falls back to shutil.rmtree with `onerror` if the tool fails or leaves
+    anything behind (e.g. read-only or locked files on Windows).
+    """
+    if sys.platform == "win32":
+        cmd = ["cmd", "/c", "rd", "/s", "/q", path]
+    else:
+        cmd = ["rm", "-rf", "--", path]
+    try:
+        subprocess.run(cmd, check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        pass
+    if os.path.exists(path):
+        shutil.rmtree(path, onerror=onerror)
+
+
+# Characters dropped from a commit message when turning it into a branch slug
+_BRANCH_SANITIZE = re.compile(r'[^a-zA-Z0-9\s]')
+
+
 def generate_branch_name(commit_message: str) -> str:
-    import re
-    import uuid
+    """healops/<slug of commit message>-<6 hex chars>, unique per run."""
     # Create a safe branch name from the commit message
-    clean_msg = re.sub(r'[^a-zA-Z0-9\s]', '', commit_message).strip().replace(" ", "-").lower()
+    clean_msg = _BRANCH_SANITIZE.sub('', commit_message).strip().replace(" ", "-").lower()
     # Keep it reasonably short
     short_msg = clean_msg[:30] if clean_msg else "auto"
-    uid = str(uuid.uuid4())[:6]
+    uid = secrets.token_hex(3)
     return f"healops/{short_msg}-{uid}"
@@ -1,20 +1,231 @@
 """GitHub API tools using PyGithub — workflow monitoring and status checks."""
 
+import asyncio
+import hashlib
+import itertools
+import json
 import os
+import tempfile
+import threading
 import time
+from collections import OrderedDict
+from datetime import datetime
+from email.utils import format_datetime
+from typing import Iterable, Iterator, Optional
+
+import httpx
 from github import Github
-from typing import Optional
 
-# Cache repos known to lack GitHub Actions — avoids repeated 20s polls
-_NO_WORKFLOW_REPOS: set[str] = set()
+GITHUB_API_URL = "https://api.github.com"
+
+# Cache repos known to lack GitHub Actions — avoids repeated 90s polls.
+# github_url → time cached, oldest first; persisted to a JSON file so a cold start
+# (serverless) or a run resumed after a restart does not probe again. Keyed on the
+# repo, not the branch: every run pushes a fresh branch cut from the default one,
+# so its .github/workflows is the default branch's.
+NO_WORKFLOW_CACHE_TTL = 86400  # seconds
+NO_WORKFLOW_CACHE_MAX = 10_000
+NO_WORKFLOW_CACHE_FILE = os.path.join(
+    os.getenv("HEALOPS_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "healops"), "no_workflow.json",
+)
+_NO_WORKFLOW_REPOS: Optional[dict[str, float]] = None  # loaded from disk on first use
+_no_workflow_lock = threading.Lock()
+
+# Write-access lookups: (github_url, token digest) → (checked_at, has_push). Saves the
+# HTTPS round-trip when the same user re-runs the agent on the same repo.
+_ACCESS_CACHE: OrderedDict[tuple[str, str], tuple[float, bool]] = OrderedDict()
+ACCESS_CACHE_TTL = 300  # seconds
+ACCESS_CACHE_MAX = 1024
+
+# Repository objects: (token digest, "owner/repo") → (fetched_at, Repository), same
+# TTL. The write-access probe and a following fork share one GET /repos/{owner}/{repo}.
+# Each holds its token's authenticated requester, so the map stays small and a
+# run's entries are released with its client (release_github_token).
+_REPO_CACHE: OrderedDict[tuple[str, str], tuple[float, object]] = OrderedDict()
+REPO_CACHE_MAX = 64
+
+# Authenticated PyGithub clients: token digest → Github, oldest first. Each keeps its
+# own HTTP session warm for the run; finalize releases it so no token outlives its run.
+_GITHUB_CLIENTS: OrderedDict[str, Github] = OrderedDict()
+GITHUB_CLIENTS_MAX = 32
+
+_github_cache_lock = threading.Lock()
+
+# Transient gateway errors worth retrying (with 0.3s, 0.6s, 1.2s back-off)
+RETRY_STATUSES = {502, 503, 504}
+MAX_RETRIES = 3
+
+# Long-lived event loop + pooled client for CI polling. asyncio.run() builds and
+# tears down a loop per cicd_monitor_node call, so a client bound to it could never
+# be reused; polls submitted to this loop keep TLS/HTTP2 connections warm instead.
+_poll_loop: Optional[asyncio.AbstractEventLoop] = None
+_poll_client: Optional[httpx.AsyncClient] = None
+_poll_lock = threading.Lock()
+
+# Optional webhook-driven completion: /webhook/github forwards workflow_run events
+# here, and a poll waiting on that branch wakes at once instead of at its next
+# tick. Keyed "owner/repo:branch" (lower-cased); each waiter remembers the loop
+# it waits on, and only that loop touches its entries.
+_webhook_waiters: dict[str, tuple[asyncio.AbstractEventLoop, asyncio.Event]] = {}
+_webhook_runs: dict[str, dict] = {}
+
+
+def default_poll_schedule() -> Iterator[float]:
+    """Adaptive back-off: 3s, 4.8s, 7.7s, 12.3s, 19.7s, then every 30s."""
+    return (min(3 * 1.6 ** i, 30) for i in itertools.count())
+
+
+def parse_poll_schedule(spec: str) -> Optional[Iterator[float]]:
+    """Parse a comma-separated list of seconds (e.g. "3,5,8,13,20,30").
+
+    The last value repeats once the list is exhausted.
+    Returns None when the spec is empty or malformed.
+    """
+    try:
+        delays = [float(part) for part in spec.split(",") if part.strip()]
+    except ValueError:
+        return None
+    if not delays or any(d <= 0 for d in delays):
+        return None
+    return itertools.chain(delays, itertools.repeat(delays[-1]))
+
+
+def _shared_poll_client() -> tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]:
+    """Start (once) the background polling loop and its pooled AsyncClient."""
+    global _poll_loop, _poll_client
+    with _poll_lock:
+        if _poll_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="github-poll", daemon=True).start()
+
+            async def _make_client() -> httpx.AsyncClient:
+                return httpx.AsyncClient(
+                    # retries= covers connection failures; 5xx retries are in _get_with_retries
+                    transport=httpx.AsyncHTTPTransport(
+                        http2=True,
+                        retries=MAX_RETRIES,
+                        limits=httpx.Limits(max_connections=10, max_keepalive_connections=4),
+                    ),
+                    timeout=10,
+                )
+
+            _poll_client = asyncio.run_coroutine_threadsafe(_make_client(), loop).result()
+            _poll_loop = loop
+        return _poll_loop, _poll_client
+
+
+def _webhook_key(full_name: str, branch_name: str) -> str:
+    return f"{full_name}:{branch_name}".lower()
+
+
+def notify_workflow_run(payload: dict) -> bool:
+    """Hand a `workflow_run` webhook payload to the poll waiting on its branch.
+
+    Thread-safe (called from the API server's loop). Returns False when no
+    poll is waiting on that branch.
+    """
+    latest = payload.get("workflow_run") or {}
+    full_name = (payload.get("repository") or {}).get("full_name", "")
+    if not latest.get("id") or not full_name:
+        return False
+    key = _webhook_key(full_name, latest.get("head_branch") or "")
+    run = {
+        "id": latest["id"],
+        "status": latest.get("status"),
+        "conclusion": latest.get("conclusion"),
+        "url": latest.get("html_url", ""),
+        "updated_at": latest.get("updated_at", ""),
+    }
+
+    entry = _webhook_waiters.get(key)
+    if entry is None:
+        return False
+    loop, waiter = entry
+
+    def _deliver() -> None:
+        if _webhook_waiters.get(key) is entry:  # the poll may have finished meanwhile
+            _webhook_runs[key] = run
+            waiter.set()
+
+    loop.call_soon_threadsafe(_deliver)
+    return True
+
+
+async def _sleep_or_webhook(waiter: asyncio.Event, delay: float) -> None:
+    """Sleep for `delay`, returning early if a webhook event arrives for this poll."""
+    try:
+        await asyncio.wait_for(waiter.wait(), delay)
+    except asyncio.TimeoutError:
+        pass
+    waiter.clear()
+
+
+async def _get_with_retries(client: httpx.AsyncClient, url: str, **kwargs) -> httpx.Response:
+    """GET that retries transient 502/503/504 responses with exponential back-off."""
+    for attempt in range(MAX_RETRIES + 1):
+        resp = await client.get(url, **kwargs)
+        if resp.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            return resp
+        await asyncio.sleep(0.3 * 2 ** attempt)
+    return resp
+
+
+def _token_digest(token: str) -> str:
+    """Cache keys use a digest, so the maps never hold a token as a key."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _ttl_put(cache: OrderedDict, key, value, max_entries: int) -> None:
+    """Insert (now, value) and evict expired entries and any beyond max_entries.
+
+    Entries are kept in insertion order, so the expired ones are always at the
+    front. Caller holds _github_cache_lock.
+    """
+    now = time.monotonic()
+    cache.pop(key, None)
+    cache[key] = (now, value)
+    while cache and (len(cache) > max_entries or now - next(iter(cache.values()))[0] >= ACCESS_CACHE_TTL):
+        cache.popitem(last=False)
 
 
 def get_github_client(github_token: str = "") -> Github:
-    """Create an authenticated GitHub client."""
+    """Return the authenticated GitHub client for this token (one per token, reused)."""
     token = github_token or os.getenv("GITHUB_TOKEN")
     if not token:
         raise ValueError("GitHub token is not provided or set in environment variables")
-    return Github(token)
+    digest = _token_digest(token)
+    with _github_cache_lock:
+        client = _GITHUB_CLIENTS.get(digest)
+        if client is None:
+            # Each client keeps its own HTTP session, so reuse keeps connections warm
+            client = _GITHUB_CLIENTS[digest] = Github(token)
+            while len(_GITHUB_CLIENTS) > GITHUB_CLIENTS_MAX:
+                _GITHUB_CLIENTS.popitem(last=False)
+    return client
+
+
+def release_github_token(github_token: str) -> None:
+    """Drop the client and Repository objects authenticated with github_token (end of run)."""
+    if not github_token:
+        return
+    digest = _token_digest(github_token)
+    with _github_cache_lock:
+        _GITHUB_CLIENTS.pop(digest, None)
+        for key in [k for k in _REPO_CACHE if k[0] == digest]:
+            del _REPO_CACHE[key]
+
+
+def _get_repo(github_token: str, owner: str, repo_name: str):
+    """gh.get_repo with a per-token TTL cache (see _REPO_CACHE)."""
+    key = (_token_digest(github_token), f"{owner}/{repo_name}")
+    with _github_cache_lock:
+        cached = _REPO_CACHE.get(key)
+    if cached and time.monotonic() - cached[0] < ACCESS_CACHE_TTL:
+        return cached[1]
+    repo = get_github_client(github_token).get_repo(key[1])
+    with _github_cache_lock:
+        _ttl_put(_REPO_CACHE, key, repo, REPO_CACHE_MAX)
+    return repo
 
 
 def extract_owner_repo(github_url: str) -> tuple[str, str]:
@@ -30,16 +241,25 @@ def check_write_access(github_url: str, github_token: str) -> bool:
     Returns False if they are a collaborator without push rights or if the repo
     belongs to a different user.
     """
+    key = (github_url, _token_digest(github_token))
+    with _github_cache_lock:
+        cached = _ACCESS_CACHE.get(key)
+    if cached and time.monotonic() - cached[0] < ACCESS_CACHE_TTL:
+        return cached[1]
+
     try:
-        gh = get_github_client(github_token)
         owner, repo_name = extract_owner_repo(github_url)
-        repo = gh.get_repo(f"{owner}/{repo_name}")
+        repo = _get_repo(github_token, owner, repo_name)
         # PyGithub exposes permissions when authenticated
         perms = repo.permissions
-        return bool(perms and perms.push)
+        has_push = bool(perms and perms.push)
     except Exception as e:
+        # Not cached — a transient API error should not stick for the TTL
         print(f"[github_api_tools] Could not verify write access: {e}")
         return False
+    with _github_cache_lock:
+        _ttl_put(_ACCESS_CACHE, key, has_push, ACCESS_CACHE_MAX)
+    return has_push
 
 
 def fork_repo(github_url: str, github_token: str) -> str:
@@ -48,9 +268,8 @@ def fork_repo(github_url: str, github_token: str) -> str:
     Returns the HTTPS clone URL of the fork (with token injected).
     If the fork already exists, returns the existing fork URL.
     """
-    gh = get_github_client(github_token)
     owner, repo_name = extract_owner_repo(github_url)
-    source_repo = gh.get_repo(f"{owner}/{repo_name}")
+    source_repo = _get_repo(github_token, owner, repo_name)
 
     # Fork (GitHub returns existing fork if it already exists)
     fork = source_repo.create_fork()
@@ -64,80 +283,311 @@ def fork_repo(github_url: str, github_token: str) -> str:
     return fork_clone_url, fork.html_url
 
 
-def get_latest_workflow_run(github_url: str, branch_name: str, github_token: str = "") -> Optional[dict]:
+def _api_headers(github_token: str = "") -> dict:
+    """Headers for raw GitHub REST calls."""
+    headers = {
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
+    token = github_token or os.getenv("GITHUB_TOKEN")
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
+
+
+def _http_date(iso_timestamp: str) -> str:
+    """Convert GitHub's ISO 8601 timestamp into an HTTP-date header value."""
+    try:
+        return format_datetime(datetime.fromisoformat(iso_timestamp.replace("Z", "+00:00")), usegmt=True)
+    except (ValueError, TypeError):
+        return ""
+
+
+def _runs_request_headers(github_token: str, cache: Optional[dict]) -> dict:
+    """API headers plus If-None-Match / If-Modified-Since when a previous run is cached."""
+    headers = _api_headers(github_token)
+    cached_run = (cache or {}).get("run")
+    if cached_run:
+        if cache.get("etag"):
+            headers["If-None-Match"] = cache["etag"]
+        since = cache.get("last_modified") or _http_date(cached_run.get("updated_at", ""))
+        if since:
+            headers["If-Modified-Since"] = since
+    return headers
+
+
+def _parse_latest_run(resp: httpx.Response, cache: Optional[dict]) -> Optional[dict]:
+    """Turn a /actions/runs response into our run dict, honouring 304s and the cache."""
+    cached_run = (cache or {}).get("run")
+    if cache is not None:
+        # GitHub's X-Poll-Interval: the fewest seconds it wants between polls
+        try:
+            cache["poll_interval"] = float(resp.headers.get("X-Poll-Interval", 0))
+        except ValueError:
+            cache["poll_interval"] = 0.0
+    if resp.status_code == 304 and cached_run:
+        return cached_run
+    resp.raise_for_status()
+
+    runs = resp.json().get("workflow_runs", [])
+    if not runs:
+        return None
+
+    latest = runs[0]
+    run = {
+        "id": latest["id"],
+        "status": latest["status"],          # queued, in_progress, completed
+        "conclusion": latest["conclusion"],  # success, failure, null
+        "url": latest["html_url"],
+        "updated_at": latest.get("updated_at", ""),
+    }
+    if cache is not None:
+        cache["run_id"] = run["id"]
+        cache["updated_at"] = run["updated_at"]
+        cache["last_modified"] = resp.headers.get("Last-Modified", "")
+        cache["etag"] = resp.headers.get("ETag", "")
+        cache["run"] = run
+    return run
+
+
+def get_latest_workflow_run(
+    github_url: str,
+    branch_name: str,
+    github_token: str = "",
+    cache: Optional[dict] = None,
+) -> Optional[dict]:
     """
     Fetch the latest GitHub Actions workflow run for a given branch.
-    Returns: { 'id': int, 'status': str, 'conclusion': str, 'url': str } or None
+    Returns: { 'id': int, 'status': str, 'conclusion': str, 'url': str, 'updated_at': str } or None
+
+    If `cache` is given, the last observed run is stored in it and replayed on
+    the next call via If-Modified-Since — an unchanged run comes back as a 304,
+    which does not count against the GitHub rate limit.
     """
     try:
-        gh = get_github_client(github_token)
         owner, repo_name = extract_owner_repo(github_url)
-        repo = gh.get_repo(f"{owner}/{repo_name}")
-
-        # Get workflow runs for the branch
-        runs = repo.get_workflow_runs(branch=branch_name)
+        resp = httpx.get(
+            f"{GITHUB_API_URL}/repos/{owner}/{repo_name}/actions/runs",
+            params={"branch": branch_name, "per_page": 1},
+            headers=_runs_request_headers(github_token, cache),
+            timeout=10,
+        )
+        return _parse_latest_run(resp, cache)
+    except Exception as e:
+        print(f"[github_api_tools] Error fetching workflow run for {github_url} on branch {branch_name}: {e}")
+        return None
 
-        if runs.totalCount == 0:
-            return None
 
-        latest = runs[0]
-        return {
-            "id": latest.id,
-            "status": latest.status,           # queued, in_progress, completed
-            "conclusion": latest.conclusion,    # success, failure, null
-            "url": latest.html_url,
-        }
+async def _fetch_latest_run_async(
+    client: httpx.AsyncClient,
+    owner: str,
+    repo_name: str,
+    branch_name: str,
+    github_token: str,
+    cache: Optional[dict],
+) -> Optional[dict]:
+    """Async twin of get_latest_workflow_run on a shared client."""
+    try:
+        resp = await _get_with_retries(
+            client,
+            f"{GITHUB_API_URL}/repos/{owner}/{repo_name}/actions/runs",
+            params={"branch": branch_name, "per_page": 1},
+            headers=_runs_request_headers(github_token, cache),
+        )
+        return _parse_latest_run(resp, cache)
     except Exception as e:
-        print(f"[github_api_tools] Error fetching workflow run for {github_url} on branch {branch_name}: {e}")
+        print(f"[github_api_tools] Error fetching workflow run for {owner}/{repo_name} on branch {branch_name}: {e}")
         return None
 
 
-def poll_workflow_status(
+async def _fetch_run_jobs_async(
+    client: httpx.AsyncClient,
+    owner: str,
+    repo_name: str,
+    run_id: Optional[int],
+    github_token: str,
+) -> list[dict]:
+    """List the jobs (check runs) of a workflow run. Empty list if unknown/failed."""
+    if not run_id:
+        return []
+    try:
+        resp = await _get_with_retries(
+            client,
+            f"{GITHUB_API_URL}/repos/{owner}/{repo_name}/actions/runs/{run_id}/jobs",
+            params={"per_page": 100},
+            headers=_api_headers(github_token),
+        )
+        resp.raise_for_status()
+        return [
+            {"name": job["name"], "status": job["status"], "conclusion": job["conclusion"]}
+            for job in resp.json().get("jobs", [])
+        ]
+    except Exception as e:
+        print(f"[github_api_tools] Error fetching jobs for run {run_id}: {e}")
+        return []
+
+
+def _no_workflow_repos() -> dict[str, float]:
+    """The no-workflow cache, loaded (minus expired entries) on first use. Caller holds the lock."""
+    global _NO_WORKFLOW_REPOS
+    if _NO_WORKFLOW_REPOS is None:
+        try:
+            with open(NO_WORKFLOW_CACHE_FILE, "r", encoding="utf-8") as f:
+                loaded = json.load(f)
+        except (OSError, ValueError):
+            loaded = {}
+        cutoff = time.time() - NO_WORKFLOW_CACHE_TTL
+        entries = loaded.items() if isinstance(loaded, dict) else ()
+        _NO_WORKFLOW_REPOS = dict(sorted(
+            ((k, float(v)) for k, v in entries if isinstance(v, (int, float)) and v > cutoff),
+            key=lambda item: item[1],
+        ))
+    return _NO_WORKFLOW_REPOS
+
+
+def _is_no_workflow_repo(repo_key: str) -> bool:
+    with _no_workflow_lock:
+        cached_at = _no_workflow_repos().get(repo_key)
+    return cached_at is not None and time.time() - cached_at < NO_WORKFLOW_CACHE_TTL
+
+
+def _mark_no_workflow_repo(repo_key: str) -> None:
+    """Remember repo_key as having no workflows and write the cache back (best-effort)."""
+    with _no_workflow_lock:
+        repos = _no_workflow_repos()
+        repos.pop(repo_key, None)
+        repos[repo_key] = time.time()
+        while len(repos) > NO_WORKFLOW_CACHE_MAX:
+            del repos[next(iter(repos))]
+        snapshot = dict(repos)
+    try:
+        os.makedirs(os.path.dirname(NO_WORKFLOW_CACHE_FILE), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(NO_WORKFLOW_CACHE_FILE), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, NO_WORKFLOW_CACHE_FILE)
+    except OSError as e:
+        print(f"[github_api_tools] Could not persist no-workflow cache: {e}")
+
+
+async def poll_workflow_status_async(
     github_url: str,
     branch_name: str,
     github_token: str = "",
     timeout: int = 300,
-    poll_interval: int = 15,
+    poll_schedule: Optional[Iterable[float]] = None,
+    cache: Optional[dict] = None,
+    client: Optional[httpx.AsyncClient] = None,
 ) -> dict:
     """
     Poll GitHub Actions until the workflow completes or times out.
-    Returns: { 'status': 'PASSED' | 'FAILED' | 'TIMEOUT', 'details': dict | None }
+
+    Each tick fetches the latest run on the branch and the jobs of the last
+    known run concurrently over one pooled client, so a failing job is seen
+    before the whole workflow finishes.
+
+    `poll_schedule` yields the delay (seconds) before each subsequent poll;
+    defaults to an adaptive back-off so fast CI is seen within seconds and
+    slow CI costs fewer API calls — stretched to GitHub's X-Poll-Interval when
+    it sends one. `cache` holds the last observed run.
+    Returns: { 'status': 'PASSED' | 'FAILED' | 'TIMEOUT' | 'SKIPPED', 'details': dict | None }
     """
+    # Fast path: if we already know this repo has no workflows, skip immediately
+    repo_key = github_url  # workflows come from the default branch every fix branch is cut from
+    if _is_no_workflow_repo(repo_key):
+        print(f"[github_api_tools] Known no-workflow repo — skipping CI/CD poll")
+        return {"status": "SKIPPED", "details": None}
+
+    if client is None:
+        async with httpx.AsyncClient(http2=True, timeout=10) as own_client:
+            return await poll_workflow_status_async(
+                github_url, branch_name, github_token, timeout, poll_schedule, cache, own_client,
+            )
+
+    owner, repo_name = extract_owner_repo(github_url)
+    delays = iter(poll_schedule if poll_schedule is not None else default_poll_schedule())
     start = time.time()
     no_workflow_count = 0
     # Increase max attempts to wait up to 90 seconds for a workflow to appear after a push
     max_no_workflow_attempts = 6
 
-    # Fast path: if we already know this repo has no workflows, skip immediately
-    repo_key = f"{github_url}:{branch_name}"
-    if repo_key in _NO_WORKFLOW_REPOS:
-        print(f"[github_api_tools] Known no-workflow repo — skipping CI/CD poll")
-        return {"status": "SKIPPED", "details": None}
+    hook_key = _webhook_key(f"{owner}/{repo_name}", branch_name)
+    waiter = asyncio.Event()
+    _webhook_waiters[hook_key] = (asyncio.get_running_loop(), waiter)
+    try:
+        while time.time() - start < timeout:
+            known_run_id = (cache or {}).get("run_id")
+            hooked = _webhook_runs.pop(hook_key, None)
+            if hooked and hooked["id"] == known_run_id and hooked["status"] == "completed":
+                # The run this poll is tracking reported completion — no API call needed
+                print(f"[github_api_tools] Workflow {hooked['id']} completed (webhook)")
+                if cache is not None:
+                    cache["run"] = hooked
+                return {"status": "PASSED" if hooked["conclusion"] == "success" else "FAILED", "details": hooked}
+
+            run, jobs = await asyncio.gather(
+                _fetch_latest_run_async(client, owner, repo_name, branch_name, github_token, cache),
+                _fetch_run_jobs_async(client, owner, repo_name, known_run_id, github_token),
+            )
+            # Never poll sooner than GitHub's X-Poll-Interval hint asks
+            delay = max(next(delays), (cache or {}).get("poll_interval", 0.0))
+            delay = min(delay, max(0.0, timeout - (time.time() - start)))
 
-    while time.time() - start < timeout:
-        run = get_latest_workflow_run(github_url, branch_name, github_token)
-
-        if run is None:
-            no_workflow_count += 1
-            if no_workflow_count >= max_no_workflow_attempts:
-                _NO_WORKFLOW_REPOS.add(repo_key)
-                print(f"[github_api_tools] No workflow found after {no_workflow_count} attempts ({no_workflow_count * poll_interval}s) — caching as no-workflow repo")
-                return {"status": "SKIPPED", "details": None}
-            print(f"[github_api_tools] No workflow found yet (attempt {no_workflow_count}/{max_no_workflow_attempts}), waiting...")
-            time.sleep(poll_interval)
-            continue
-
-        # Reset counter once a workflow is found
-        no_workflow_count = 0
-
-        if run["status"] == "completed":
-            if run["conclusion"] == "success":
-                return {"status": "PASSED", "details": run}
-            else:
+            if run is None:
+                no_workflow_count += 1
+                if no_workflow_count >= max_no_workflow_attempts:
+                    await asyncio.to_thread(_mark_no_workflow_repo, repo_key)
+                    print(f"[github_api_tools] No workflow found after {no_workflow_count} attempts ({time.time() - start:.0f}s) — caching as no-workflow repo")
+                    return {"status": "SKIPPED", "details": None}
+                print(f"[github_api_tools] No workflow found yet (attempt {no_workflow_count}/{max_no_workflow_attempts}), waiting...")
+                await _sleep_or_webhook(waiter, delay)
+                continue
+
+            # Reset counter once a workflow is found
+            no_workflow_count = 0
+
+            # Jobs belong to the run seen on the previous tick — only trust them for the same run
+            if known_run_id == run["id"]:
+                run = run | {"jobs": jobs}
+
+            if run["status"] == "completed":
+                if run["conclusion"] == "success":
+                    return {"status": "PASSED", "details": run}
+                else:
+                    return {"status": "FAILED", "details": run}
+
+            # A failed job already decides the outcome — no need to wait for the rest
+            if any(job["conclusion"] == "failure" for job in run.get("jobs", [])):
+                print(f"[github_api_tools] Workflow {run['id']} has a failed job — reporting FAILED early")
                 return {"status": "FAILED", "details": run}
 
-        # Still in progress
-        print(f"[github_api_tools] Workflow {run['id']} status: {run['status']}, waiting...")
-        time.sleep(poll_interval)
+            # Still in progress
+            print(f"[github_api_tools] Workflow {run['id']} status: {run['status']}, waiting {delay:.1f}s...")
+            await _sleep_or_webhook(waiter, delay)
+    finally:
+        if _webhook_waiters.get(hook_key, (None, None))[1] is waiter:
+            del _webhook_waiters[hook_key]
+            _webhook_runs.pop(hook_key, None)
 
     return {"status": "TIMEOUT", "details": None}
+
+
+def poll_workflow_status(
+    github_url: str,
+    branch_name: str,
+    github_token: str = "",
+    timeout: int = 300,
+    poll_schedule: Optional[Iterable[float]] = None,
+    cache: Optional[dict] = None,
+) -> dict:
+    """Blocking wrapper around poll_workflow_status_async.
+
+    Runs on the shared background loop so the pooled client (and its open
+    connections) carries over between cicd_monitor_node iterations.
+    """
+    loop, client = _shared_poll_client()
+    future = asyncio.run_coroutine_threadsafe(
+        poll_workflow_status_async(github_url, branch_name, github_token, timeout, poll_schedule, cache, client),
+        loop,
+    )
+    return future.result()
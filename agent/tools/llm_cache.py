@@ -0,0 +1,105 @@
+"""Content-hash cache for LLM responses — identical inputs skip the API round-trip."""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Bump whenever a cached prompt's format changes — old entries stop matching
+PROMPT_VERSION = "v4"
+
+# In-process LRU layer in front of the on-disk cache, capped by total characters so a
+# long-running server does not keep every fixed/generated file of every run
+MEMORY_CACHE_MAX_CHARS = 32 * 1024 * 1024
+_MEMORY_CACHE: OrderedDict[str, str] = OrderedDict()
+_memory_chars = 0
+_memory_lock = threading.Lock()
+
+# Per-run lookup stats, drained by take_stats(): run_id → [hits, keys missed]
+_STATS: dict[str, list] = {}
+_stats_lock = threading.Lock()
+
+
+def cache_key(kind: str, **fields) -> str:
+    """Deterministic SHA-256 key over the call kind, prompt version and all inputs."""
+    payload = json.dumps({"kind": kind, "version": PROMPT_VERSION, **fields}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8", errors="replace")).hexdigest()
+
+
+def _cache_dir(run_id: str) -> str:
+    """On-disk cache lives next to the run's clone: /tmp/<run_id>/llm_cache/."""
+    return os.path.join("/tmp", run_id or "healops", "llm_cache")
+
+
+def _remember(key: str, value: str) -> None:
+    """Put value in the memory layer, evicting least-recently-used entries past the cap."""
+    global _memory_chars
+    with _memory_lock:
+        old = _MEMORY_CACHE.pop(key, None)
+        if old is not None:
+            _memory_chars -= len(old)
+        _MEMORY_CACHE[key] = value
+        _memory_chars += len(value)
+        while _memory_chars > MEMORY_CACHE_MAX_CHARS and len(_MEMORY_CACHE) > 1:
+            _, evicted = _MEMORY_CACHE.popitem(last=False)
+            _memory_chars -= len(evicted)
+
+
+def get_cached(key: str, run_id: str = "") -> Optional[str]:
+    """Return the cached response for key, or None on a miss."""
+    with _memory_lock:
+        value = _MEMORY_CACHE.get(key)
+        if value is not None:
+            _MEMORY_CACHE.move_to_end(key)
+    if value is None:
+        try:
+            with open(os.path.join(_cache_dir(run_id), f"{key}.txt"), "r", encoding="utf-8") as f:
+                value = f.read()
+            _remember(key, value)
+        except OSError:
+            pass
+    with _stats_lock:
+        stats = _STATS.setdefault(run_id, [0, set()])
+        if value is None:
+            stats[1].add(key)  # a key looked up twice (batch, then per-file) is one miss
+        else:
+            stats[0] += 1
+    return value
+
+
+def take_stats(run_id: str = "") -> tuple[int, int]:
+    """(hits, misses) for run_id since the last call, then reset."""
+    with _stats_lock:
+        hits, missed = _STATS.pop(run_id, (0, ()))
+    return hits, len(missed)
+
+
+def save_cached(key: str, value: str, run_id: str = "") -> None:
+    """Store a response in memory and atomically on disk (best-effort)."""
+    _remember(key, value)
+    cache_dir = _cache_dir(run_id)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(value)
+        os.replace(tmp_path, os.path.join(cache_dir, f"{key}.txt"))
+    except OSError as e:
+        print(f"[llm_cache] Could not persist cache entry: {e}")
+
+
+def drop_run(run_id: str) -> None:
+    """Forget a finished run: delete its on-disk cache and pending stats.
+
+    The memory layer is shared across runs (keys are content hashes) and bounded
+    by MEMORY_CACHE_MAX_CHARS, so it is left alone.
+    """
+    if not run_id:
+        return  # the shared /tmp/healops fallback cache is not any one run's
+    with _stats_lock:
+        _STATS.pop(run_id, None)
+    shutil.rmtree(_cache_dir(run_id), ignore_errors=True)
@@ -1,7 +1,14 @@
 """AI fix generation via Google Gemini API."""
 
+import asyncio
+import functools
+import json
+import logging
 import os
+import random
 import re
+import threading
+import time
 from langchain_core.messages import HumanMessage, SystemMessage
 
 # Primary model — strong code reasoning, best fix quality
@@ -19,13 +26,119 @@ CRITICAL RULES:
 4. Return ONLY the raw checked-out code.
 5. NO markdown formatting, NO explanations, NO ``` fences."""
 
+# Static fix instructions shared by every single-file fix prompt. Kept byte-identical
+# and ahead of all per-call fields (file, line, error, code) so the provider's prefix
+# cache can reuse it across files and iterations — never interpolate into it.
+FIX_RULES = """You are an expert software engineer fixing a specific bug.
+
+PROCESS:
+1. First LOCATE the defect: the reported line is a hint — the root cause may be nearby.
+2. Then REPAIR it with the minimal change that resolves the error.
+
+RULES:
+- Fix ONLY the specific issue described below. Do NOT refactor or change unrelated code.
+- Preserve structure, imports, comments, indentation, and blank lines exactly.
+- Make sure your fix actually RESOLVES the error shown below.
+- Return ONLY raw code — no explanations, no markdown, no code fences."""
+
+FIX_PROMPT_PREFIX = f"{SYSTEM_PROMPT}\n\n{FIX_RULES}"
+
+# Sent as the system turn ahead of each per-call HumanMessage — built once, reused
+_FIX_SYSTEM_MESSAGE = SystemMessage(content=FIX_PROMPT_PREFIX)
+_BATCH_SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT)
+
+# Appended after the per-call fields when a previous fix for the same file failed
+RETRY_CONTEXT = """IMPORTANT — RETRY CONTEXT:
+A previous AI-generated fix for this SAME file was already applied, but the error PERSISTS.
+The previous fix was INSUFFICIENT. You MUST take a DIFFERENT approach this time.
+Look deeper at the root cause — maybe a missing dependency, wrong function signature,
+or an incorrect import path. Do NOT repeat the same fix."""
+
+# Cooldown after HTTP 429 / 5xx: min(2**n + U(0,1), RATE_LIMIT_MAX_WAIT) seconds, where n
+# counts consecutive throttled calls. Fix calls made during the cooldown raise
+# RateLimited immediately instead of hammering a throttled endpoint.
+RATE_LIMIT_MAX_WAIT = 60.0
+_next_allowed_ts = 0.0
+_consecutive_throttles = 0
+_rate_lock = threading.Lock()
+
+
+class RateLimited(Exception):
+    """The provider is throttling us — retry after `wait` seconds; not the model's fault."""
+
+    def __init__(self, wait: float):
+        super().__init__(f"LLM provider rate-limited — retry in {wait:.1f}s")
+        self.wait = wait
+
+
+def _is_throttled(e: Exception) -> bool:
+    """True for HTTP 429 / 5xx errors from the provider client."""
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    text = str(e).lower()
+    return "429" in text or "rate limit" in text
+
+
+def _check_cooldown() -> None:
+    """Raise RateLimited while a previous throttle's cooldown is still running."""
+    wait = _next_allowed_ts - time.time()
+    if wait > 0:
+        raise RateLimited(wait)
+
+
+def _note_throttled() -> RateLimited:
+    """Start (or extend) the cooldown with jittered exponential back-off."""
+    global _next_allowed_ts, _consecutive_throttles
+    with _rate_lock:
+        wait = min(2 ** _consecutive_throttles + random.random(), RATE_LIMIT_MAX_WAIT)
+        _consecutive_throttles += 1
+        _next_allowed_ts = max(_next_allowed_ts, time.time() + wait)
+    print(f"[openrouter_tools] Provider throttled — cooling down for {wait:.1f}s")
+    return RateLimited(wait)
+
+
+def _note_success() -> None:
+    """A call went through — the next throttle starts back-off from the beginning."""
+    global _consecutive_throttles
+    _consecutive_throttles = 0
+
+
+def _debug_file_logger(name: str, filename: str) -> logging.Logger:
+    """Append-only dump file for LLM prompts/responses.
+
+    One handler keeps the file open (created on first write) instead of an
+    open/close per call, and its lock stops concurrent calls interleaving.
+    """
+    logger = logging.getLogger(f"healops.llm.{name}")
+    if not logger.handlers:
+        handler = logging.FileHandler(os.path.join(os.getcwd(), filename), encoding="utf-8", delay=True)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+    return logger
+
+
+_prompt_log = _debug_file_logger("prompts", "llm_debug_prompt.txt")
+_raw_log = _debug_file_logger("raw", "llm_debug_raw.txt")
+
 
 def get_llm(model_name: str = MODEL, temperature: float = 0.1):
     """Create an OpenRouter Chat Model."""
     api_key = os.getenv("OPENROUTER_API_KEY")
     if not api_key:
         raise ValueError("OPENROUTER_API_KEY environment variable is not set")
-    
+    return _chat_model(api_key, model_name, temperature)
+
+
+@functools.lru_cache(maxsize=16)
+def _chat_model(api_key: str, model_name: str, temperature: float):
+    """One chat model per (key, model, temperature), shared by every node and run.
+
+    Each model owns an httpx connection pool, so reusing it keeps TLS/HTTP
+    connections to the provider warm instead of handshaking on every call.
+    """
     from langchain_mistralai import ChatMistralAI
     return ChatMistralAI(
         api_key=api_key,
@@ -50,28 +163,53 @@ def _strip_code_fences(text: str) -> str:
     return text
 
 
-def generate_fix(file_content: str, error_output: str, bug_type: str, line_number: int, is_retry: bool = False) -> str:
+_NEWLINE = re.compile("\n")
+
+
+def _line_offsets(text: str) -> list[int]:
+    """Start offset of every line in text, plus len(text) as the end sentinel.
+
+    Line i (0-based) is text[offsets[i]:offsets[i + 1]] and the file has
+    len(offsets) - 1 lines — region slicing without splitting the whole file.
+    """
+    offsets = [0]
+    offsets.extend(m.end() for m in _NEWLINE.finditer(text))
+    if offsets[-1] != len(text):
+        offsets.append(len(text))
+    return offsets
+
+
+def _complete(llm, messages: list, stream: bool) -> str:
+    """Response text for messages — streamed chunk by chunk, or one buffered invoke.
+
+    Streaming receives tokens as the provider generates them instead of holding
+    an idle connection until the whole (up to 8192-token) answer is ready.
+    """
+    if not stream:
+        return llm.invoke(messages).content
+    buf = []
+    for chunk in llm.stream(messages):
+        buf.append(chunk.content)
+    return "".join(buf)
+
+
+def generate_fix(
+    file_content: str,
+    error_output: str,
+    bug_type: str,
+    line_number: int,
+    is_retry: bool = False,
+    stream: bool = True,
+) -> str:
     """
     Send the failing file content + error to Gemini.
     Returns the complete fixed file content (raw code only).
+    stream=False waits for the whole response in one call instead of streaming it.
     """
-    retry_context = ""
-    if is_retry:
-        retry_context = """\n\nIMPORTANT — RETRY CONTEXT:
-A previous AI-generated fix for this SAME file was already applied, but the error PERSISTS.
-The previous fix was INSUFFICIENT. You MUST take a DIFFERENT approach this time.
-Look deeper at the root cause — maybe a missing dependency, wrong function signature,
-or an incorrect import path. Do NOT repeat the same fix."""
-
-    prompt = f"""You are an expert software engineer fixing a specific bug.
+    retry_context = f"\n{RETRY_CONTEXT}\n" if is_retry else ""
 
-RULES:
-- Fix ONLY the specific issue described below. Do NOT refactor or change unrelated code.
-- Preserve the entire file structure, imports, comments, and formatting.
-- Return ONLY the complete fixed file content — no explanations, no markdown, no code fences.
-- Make sure your fix actually RESOLVES the error shown below.
+    prompt = f"""TASK: output the complete fixed file.
 {retry_context}
-
 Bug Type: {bug_type}
 Approximate Line: {line_number}
 
@@ -83,19 +221,18 @@ Complete File Content:
 
 Output the COMPLETE fixed file content now (raw code only, no ``` fences):"""
 
+    _check_cooldown()
     for attempt_model in (MODEL, FALLBACK_MODEL):
         try:
-            with open(os.path.join(os.getcwd(), "llm_debug_prompt.txt"), "a", encoding="utf-8") as f:
-                f.write(f"\n=== GENERATE_FIX PROMPT ===\n{prompt}\n")
+            _prompt_log.debug("\n=== GENERATE_FIX PROMPT ===\n%s", prompt)
                 
             llm = get_llm(model_name=attempt_model, temperature=0.1)
-            merged_prompt = f"{SYSTEM_PROMPT}\n\n{prompt}"
-            response = llm.invoke([HumanMessage(content=merged_prompt)])
+            content = _complete(llm, [_FIX_SYSTEM_MESSAGE, HumanMessage(content=prompt)], stream)
+            _note_success()
             
-            with open(os.path.join(os.getcwd(), "llm_debug_raw.txt"), "a", encoding="utf-8") as f:
-                f.write(f"\n[RAW LLM RESPONSE - FIX]: {repr(response.content)}\n")
+            _raw_log.debug("\n[RAW LLM RESPONSE - FIX]: %r", content)
                 
-            fixed_code = _strip_code_fences(response.content)
+            fixed_code = _strip_code_fences(content)
             
             if attempt_model != MODEL:
                 print(f"[openrouter_tools] Using fallback model {attempt_model}")
@@ -106,17 +243,123 @@ Output the COMPLETE fixed file content now (raw code only, no ``` fences):"""
                 
             return fixed_code
         except Exception as e:
+            if _is_throttled(e):
+                raise _note_throttled() from e
             print(f"[openrouter_tools] generate_fix failed with {attempt_model}: {e}")
             if attempt_model == FALLBACK_MODEL:
                 return file_content  # give up, return original
 
 
-def analyze_error(error_output: str, file_content: str) -> dict:
+# Lines of context on each side of the failing line in windowed (masked) fix prompts
+FOCUS_CONTEXT_LINES = 30
+
+# Line-count drift allowed between a window and its fixed version (at least; half
+# the window for larger ones) before the answer is rejected instead of spliced
+WINDOW_LINE_SLACK = 10
+
+
+def generate_one_step_fix(
+    file_content: str,
+    error_output: str,
+    bug_type: str,
+    line_number: int,
+    fix_instruction: str = "",
+    is_retry: bool = False,
+    stream: bool = True,
+) -> str:
     """
-    Use AI to analyze an error and identify the bug type and location.
-    Returns: { 'bug_type': str, 'line_number': int, 'description': str, 'fix_instruction': str }
+    Localize AND repair in a single call — replaces the targeted-patch → full-file
+    fallback pair, so a hard case costs one round-trip instead of two.
+
+    When the failing line is known, only a ±FOCUS_CONTEXT_LINES window is sent and
+    the patched window is spliced back; the whole file is sent only when the line is
+    unknown, the file fits in the window anyway, or on a retry (the root cause may
+    then lie outside the window, e.g. an import).
+    Returns the complete fixed file content (original content on failure).
+    stream=False waits for the whole response in one call instead of streaming it.
     """
-    prompt = f"""Analyze this test failure and identify the ROOT CAUSE (not secondary/cascading errors).
+    retry_context = f"\n{RETRY_CONTEXT}\n" if is_retry else ""
+    instruction_ctx = f"FIX HINT: {fix_instruction}\n" if fix_instruction else ""
+
+    offsets = _line_offsets(file_content)
+    total = len(offsets) - 1
+    # Clamped on both sides — model-reported lines can point past the end of the file
+    start = min(max(0, line_number - 1 - FOCUS_CONTEXT_LINES), total)
+    end = max(start, min(total, line_number + FOCUS_CONTEXT_LINES))
+    # A line outside the file is as good as unknown — send the whole file then
+    windowed = 0 < line_number <= total and not is_retry and (end - start) < total
+
+    if windowed:
+        code_section = f"""Code Window (lines {start + 1}-{end}):
+{file_content[offsets[start]:offsets[end]]}
+
+Output the FIXED window now (raw code only, every line of the window, unchanged except for the fix):"""
+        task = (f"TASK: output only the fixed window. Only lines {start + 1}-{end} of the {total}-line file are shown; "
+                f"the {start} line(s) above and {total - end} line(s) below are omitted and stay unchanged.")
+    else:
+        code_section = f"""Complete File Content:
+{file_content}
+
+Output the COMPLETE fixed file content now (raw code only, no ``` fences):"""
+        task = "TASK: output the complete fixed file."
+
+    prompt = f"""{task}
+{retry_context}{instruction_ctx}
+Bug Type: {bug_type}
+Approximate Line: {line_number}
+
+Error Output (truncated):
+{error_output[:3000]}
+
+{code_section}"""
+
+    _check_cooldown()
+    for attempt_model in (MODEL, FALLBACK_MODEL):
+        try:
+            _prompt_log.debug("\n=== GENERATE_ONE_STEP_FIX PROMPT ===\n%s", prompt)
+
+            llm = get_llm(model_name=attempt_model, temperature=0.1)
+            content = _complete(llm, [_FIX_SYSTEM_MESSAGE, HumanMessage(content=prompt)], stream)
+            _note_success()
+
+            _raw_log.debug("\n[RAW LLM RESPONSE - ONE_STEP]: %r", content)
+
+            fixed_code = _strip_code_fences(content)
+
+            if attempt_model != MODEL:
+                print(f"[openrouter_tools] Using fallback model {attempt_model}")
+
+            # Sanity check: if empty, return original
+            if not fixed_code.strip():
+                return file_content
+
+            if not windowed:
+                return fixed_code
+
+            # Splice the fixed window back into the original file
+            # A "fixed window" far longer or shorter than the one sent is not a patch of
+            # it (truncated, or the whole file echoed back) — splicing it would corrupt the file
+            fixed_count = fixed_code.count("\n") + (not fixed_code.endswith("\n"))
+            if abs(fixed_count - (end - start)) > max(WINDOW_LINE_SLACK, (end - start) // 2):
+                print(f"[openrouter_tools] Fixed window has {fixed_count} lines for a "
+                      f"{end - start}-line window — discarding it")
+                return file_content
+
+            # Keep the window's own line ending (_strip_code_fences drops it)
+            if not fixed_code.endswith("\n") and file_content[offsets[start]:offsets[end]].endswith("\n"):
+                fixed_code += "\n"
+            return file_content[:offsets[start]] + fixed_code + file_content[offsets[end]:]
+        except Exception as e:
+            if _is_throttled(e):
+                raise _note_throttled() from e
+            print(f"[openrouter_tools] generate_one_step_fix failed with {attempt_model}: {e}")
+            if attempt_model == FALLBACK_MODEL:
+                return file_content
+
+
+def _analysis_prompt(error_output: str, file_content: str) -> str:
+    """Build the root-cause analysis prompt shared by analyze_error and analyze_error_async."""
+    return f"""Analyze this test failure and identify the ROOT CAUSE (not secondary/cascading errors).
 Focus on the FIRST error in the traceback. Identify the line in the SOURCE code (not the test file).
 
 Error Output:
@@ -131,38 +374,163 @@ LINE_NUMBER: <integer — the line in the source code causing the error>
 DESCRIPTION: <one-line root cause description>
 FIX_INSTRUCTION: <one-line instruction for how to fix this specific issue>"""
 
+
+def _parse_analysis(text: str) -> dict:
+    """Parse the BUG_TYPE / LINE_NUMBER / DESCRIPTION / FIX_INSTRUCTION response."""
+    result = {"bug_type": "LOGIC", "line_number": 1, "description": "Unknown error", "fix_instruction": ""}
+    for line in text.split("\n"):
+        line = line.strip()
+        if line.startswith("BUG_TYPE:"):
+            try:
+                result["bug_type"] = line.split(":", 1)[1].strip()
+            except IndexError: pass
+        elif line.startswith("LINE_NUMBER:"):
+            try:
+                result["line_number"] = int(line.split(":", 1)[1].strip())
+            except (ValueError, IndexError):
+                pass
+        elif line.startswith("DESCRIPTION:"):
+            try:
+                result["description"] = line.split(":", 1)[1].strip()
+            except IndexError: pass
+        elif line.startswith("FIX_INSTRUCTION:"):
+            try:
+                result["fix_instruction"] = line.split(":", 1)[1].strip()
+            except IndexError: pass
+    return result
+
+
+def _coerce_analysis(entry: dict) -> dict:
+    """Normalize a JSON analysis object from the model to the analyze_error keys/types."""
+    try:
+        line_number = int(entry.get("line_number", 1))
+    except (TypeError, ValueError):
+        line_number = 1
+    return {
+        "bug_type": str(entry.get("bug_type", "LOGIC")),
+        "line_number": line_number,
+        "description": str(entry.get("description", "Unknown error")),
+        "fix_instruction": str(entry.get("fix_instruction", "")),
+    }
+
+
+def analyze_error(error_output: str, file_content: str) -> dict:
+    """
+    Use AI to analyze an error and identify the bug type and location.
+    Returns: { 'bug_type': str, 'line_number': int, 'description': str, 'fix_instruction': str }
+    """
+    prompt = _analysis_prompt(error_output, file_content)
+
     try:
         llm = get_llm(model_name=MODEL, temperature=0.1)
         response = llm.invoke([HumanMessage(content=prompt)])
-        text = response.content.strip()
-
-        result = {"bug_type": "LOGIC", "line_number": 1, "description": "Unknown error", "fix_instruction": ""}
-        for line in text.split("\n"):
-            line = line.strip()
-            if line.startswith("BUG_TYPE:"):
-                try:
-                    result["bug_type"] = line.split(":", 1)[1].strip()
-                except IndexError: pass
-            elif line.startswith("LINE_NUMBER:"):
-                try:
-                    result["line_number"] = int(line.split(":", 1)[1].strip())
-                except (ValueError, IndexError):
-                    pass
-            elif line.startswith("DESCRIPTION:"):
-                try:
-                    result["description"] = line.split(":", 1)[1].strip()
-                except IndexError: pass
-            elif line.startswith("FIX_INSTRUCTION:"):
-                try:
-                    result["fix_instruction"] = line.split(":", 1)[1].strip()
-                except IndexError: pass
-
-        return result
+        return _parse_analysis(response.content.strip())
+    except Exception as e:
+        print(f"[openrouter_tools] Error analyzing error: {e}")
+        return {"bug_type": "LOGIC", "line_number": 1, "description": str(e), "fix_instruction": ""}
+
+
+async def analyze_error_async(error_output: str, file_content: str) -> dict:
+    """Async variant of analyze_error — lets callers analyze several failures concurrently."""
+    prompt = _analysis_prompt(error_output, file_content)
+
+    try:
+        llm = get_llm(model_name=MODEL, temperature=0.1)
+        # Sync invoke on a worker thread: the shared model's async client would stay
+        # bound to the event loop of whichever asyncio.run() first used it
+        response = await asyncio.to_thread(llm.invoke, [HumanMessage(content=prompt)])
+        return _parse_analysis(response.content.strip())
     except Exception as e:
         print(f"[openrouter_tools] Error analyzing error: {e}")
         return {"bug_type": "LOGIC", "line_number": 1, "description": str(e), "fix_instruction": ""}
 
 
+def analyze_and_fix(file_content: str, error_output: str, is_retry: bool = False) -> tuple[dict, str]:
+    """
+    Diagnose AND fix a failure in one round-trip instead of analyze_error followed
+    by a fix call that re-sends the same file and error.
+    The model answers with a one-line JSON analysis header, a `---` line, then the
+    complete fixed file.
+    Returns (analysis, fixed_content): analysis has the analyze_error keys;
+    fixed_content is "" when no usable fix came back (callers fix separately then).
+    If the request fails, falls back to a plain analyze_error call.
+    """
+    retry_context = f"\n{RETRY_CONTEXT}\n" if is_retry else ""
+
+    prompt = f"""TASK: diagnose the failure, then output the complete fixed file.
+{retry_context}
+Identify the ROOT CAUSE (not secondary/cascading errors): focus on the FIRST error in the
+traceback and the line in the SOURCE code (not the test file).
+
+Error Output (truncated):
+{error_output[:2000]}
+
+Complete File Content:
+{file_content}
+
+Respond in EXACTLY this format — the header and the --- line are the only non-code output allowed:
+Line 1: {{"bug_type": "<one of: LINTING, SYNTAX, LOGIC, TYPE_ERROR, IMPORT, INDENTATION>", "line_number": <integer>, "description": "<one-line root cause>", "fix_instruction": "<one-line fix instruction>"}}
+Line 2: ---
+Then the COMPLETE fixed file content (raw code only, no ``` fences)."""
+
+    try:
+        _check_cooldown()
+        _prompt_log.debug("\n=== ANALYZE_AND_FIX PROMPT ===\n%s", prompt)
+
+        llm = get_llm(model_name=MODEL, temperature=0.1)
+        content = _complete(llm, [_FIX_SYSTEM_MESSAGE, HumanMessage(content=prompt)], stream=True)
+        _note_success()
+
+        _raw_log.debug("\n[RAW LLM RESPONSE - ANALYZE_AND_FIX]: %r", content)
+    except Exception as e:
+        if _is_throttled(e):
+            _note_throttled()
+        print(f"[openrouter_tools] analyze_and_fix failed, analyzing only: {e}")
+        return analyze_error(error_output, file_content), ""
+
+    header, sep, body = content.strip().partition("\n---\n")
+    try:
+        analysis = _coerce_analysis(json.loads(_strip_code_fences(header)))
+    except (ValueError, AttributeError):
+        analysis = _parse_analysis(header)
+    return analysis, _strip_code_fences(body) if sep else ""
+
+
+def analyze_errors_batch(items: list[dict]) -> list:
+    """
+    Analyze several failures in a single request instead of one call per failure.
+    items: [{ 'file': str, 'error': str, 'content': str }, ...]
+    Returns a list aligned with items — an analysis dict (same keys as analyze_error)
+    or None for any entry the model did not answer, so callers can fall back per item.
+    """
+    payload = [
+        {"id": i, "file": item["file"], "error": item["error"][:2000], "content": item["content"][:8000]}
+        for i, item in enumerate(items)
+    ]
+    prompt = f"""Analyze each of these test failures and identify the ROOT CAUSE (not secondary/cascading errors).
+For each one, focus on the FIRST error in the traceback and identify the line in the SOURCE code (not the test file).
+
+Failures (JSON):
+{json.dumps(payload)}
+
+Respond with ONLY a JSON object of this shape (no markdown, no extra text):
+{{"analyses": [{{"id": <id from input>, "bug_type": "<one of: LINTING, SYNTAX, LOGIC, TYPE_ERROR, IMPORT, INDENTATION>", "line_number": <integer>, "description": "<one-line root cause>", "fix_instruction": "<one-line fix instruction>"}}]}}"""
+
+    results = [None] * len(items)
+    try:
+        llm = get_llm(model_name=MODEL, temperature=0.1).bind(response_format={"type": "json_object"})
+        response = llm.invoke([HumanMessage(content=prompt)])
+        data = json.loads(_strip_code_fences(response.content))
+        for entry in data.get("analyses", []):
+            idx = entry.get("id")
+            if not isinstance(idx, int) or not 0 <= idx < len(items):
+                continue
+            results[idx] = _coerce_analysis(entry)
+    except Exception as e:
+        print(f"[openrouter_tools] Batch analysis failed, falling back to per-failure calls: {e}")
+    return results
+
+
 def generate_targeted_fix(
     file_content: str,
     error_output: str,
@@ -170,33 +538,28 @@ def generate_targeted_fix(
     line_number: int,
     fix_instruction: str = "",
     context_lines: int = 10,
+    stream: bool = True,
 ) -> str:
     """
     Fix only the region around the failing line (±context_lines).
     Returns the complete file with the targeted patch applied.
     Falls back to original content on failure.
+    stream=False waits for the whole response in one call instead of streaming it.
     """
-    lines = file_content.splitlines(keepends=True)
-    total = len(lines)
-
-    # Calculate region bounds
-    start = max(0, line_number - 1 - context_lines)
-    end = min(total, line_number + context_lines)
-    region = "".join(lines[start:end])
+    offsets = _line_offsets(file_content)
+    total = len(offsets) - 1
 
-    instruction_ctx = ""
-    if fix_instruction:
-        instruction_ctx = f"\nFIX HINT: {fix_instruction}"
+    # Calculate region bounds around the failing line, pulled into the file — the
+    # model-reported line can point past its end (e.g. a line of the test file)
+    focus = min(max(line_number, 1), total)
+    start = max(0, focus - 1 - context_lines)
+    end = min(total, focus + context_lines)
+    region = file_content[offsets[start]:offsets[end]]
 
-    prompt = f"""You are an expert software engineer. Fix ONLY the bug in the code region below.
+    instruction_ctx = f"FIX HINT: {fix_instruction}\n" if fix_instruction else ""
 
-RULES:
-- Fix ONLY the specific issue described. Do NOT refactor or change unrelated code.
-- Preserve exact formatting, indentation, comments, and blank lines.
-- Return ONLY the fixed region (raw code only, no ``` fences, no explanations).
-- The region starts at line {start + 1} of the original file.
+    prompt = f"""TASK: output only the fixed region. It starts at line {start + 1} of the original file.
 {instruction_ctx}
-
 Bug Type: {bug_type}
 Failing Line: {line_number}
 
@@ -208,47 +571,124 @@ Code Region (lines {start + 1}-{end}):
 
 Output the FIXED region now (raw code only, same number of surrounding lines where unchanged):"""
 
+    _check_cooldown()
     for attempt_model in (MODEL, FALLBACK_MODEL):
         try:
-            with open(os.path.join(os.getcwd(), "llm_debug_prompt.txt"), "a", encoding="utf-8") as f:
-                f.write(f"\n=== GENERATE_TARGETED_FIX PROMPT ===\n{prompt}\n")
+            _prompt_log.debug("\n=== GENERATE_TARGETED_FIX PROMPT ===\n%s", prompt)
                 
             llm = get_llm(model_name=attempt_model, temperature=0.1)
-            merged_prompt = f"{SYSTEM_PROMPT}\n\n{prompt}"
-            response = llm.invoke([HumanMessage(content=merged_prompt)])
+            content = _complete(llm, [_FIX_SYSTEM_MESSAGE, HumanMessage(content=prompt)], stream)
+            _note_success()
             
-            with open(os.path.join(os.getcwd(), "llm_debug_raw.txt"), "a", encoding="utf-8") as f:
-                f.write(f"\n[RAW LLM RESPONSE - TARGETED]: {repr(response.content)}\n")
+            _raw_log.debug("\n[RAW LLM RESPONSE - TARGETED]: %r", content)
                 
-            fixed_region = _strip_code_fences(response.content)
+            fixed_region = _strip_code_fences(content)
 
             if not fixed_region.strip():
                 return file_content
 
             # Splice the fixed region back into the original file
-            fixed_lines = fixed_region.splitlines(keepends=True)
             # Ensure last line has newline
-            if fixed_lines and not fixed_lines[-1].endswith("\n"):
-                fixed_lines[-1] += "\n"
+            if not fixed_region.endswith("\n"):
+                fixed_region += "\n"
 
-            result_lines = lines[:start] + fixed_lines + lines[end:]
-            return "".join(result_lines)
+            return file_content[:offsets[start]] + fixed_region + file_content[offsets[end]:]
         except Exception as e:
+            if _is_throttled(e):
+                raise _note_throttled() from e
             print(f"[openrouter_tools] generate_targeted_fix failed with {attempt_model}: {e}")
             if attempt_model == FALLBACK_MODEL:
                 return file_content
 
 
-def generate_tests(
-    source_code: str,
-    file_path: str,
-    framework: str = "pytest",
-    is_django: bool = False,
-    settings_module: str = "",
-) -> str:
+def _unclosed_brackets(text: str) -> int:
+    """Opening minus closing brackets — rough, but a file cut off mid-block stays above zero."""
+    return sum(map(text.count, "([{")) - sum(map(text.count, ")]}"))
+
+
+def _looks_truncated(original: str, patched: str) -> bool:
+    """A whole-file answer that lost a large tail, or stops with a block left open, was cut off."""
+    original_lines = original.count("\n") + 1
+    lost = original_lines - (patched.count("\n") + 1)
+    if lost > max(WINDOW_LINE_SLACK, original_lines // 4):
+        return True
+    return _unclosed_brackets(patched) > max(_unclosed_brackets(original), 0)
+
+
+def generate_batch_fixes(batch: list[dict]) -> list:
     """
-    Generate a complete test file for the given source code using Gemini.
+    Fix several files in ONE request instead of one round-trip per file.
+    batch: [{ 'file', 'content', 'error_output', 'bug_type', 'line', 'fix_instruction', 'is_retry' }, ...]
+    Returns a list aligned with batch — the complete fixed file content, or None for
+    any entry the model skipped, answered invalidly or returned cut off (callers
+    fall back per file).
     """
+    payload = [
+        {
+            "id": i,
+            "file": item["file"],
+            "bug_type": item["bug_type"],
+            "line": item["line"],
+            "fix_hint": item.get("fix_instruction", ""),
+            "retry": bool(item.get("is_retry")),
+            "error_output": item["error_output"][:2000],
+            "content": item["content"],
+        }
+        for i, item in enumerate(batch)
+    ]
+    retry_context = (
+        f"\n{RETRY_CONTEXT}\n(This applies only to the entries marked \"retry\": true.)\n"
+        if any(entry["retry"] for entry in payload) else ""
+    )
+    prompt = f"""You are an expert software engineer fixing several independent bugs, one per file.
+
+RULES:
+- For each entry, fix ONLY the specific issue described. Do NOT refactor or change unrelated code.
+- Preserve each file's structure, imports, comments, and formatting.
+- Make sure each fix actually RESOLVES the error shown for that file.
+{retry_context}
+Files to fix (JSON):
+{json.dumps(payload)}
+
+Respond with ONLY a JSON object of this shape (no markdown, no extra text):
+{{"fixes": [{{"id": <id from input>, "file": "<file>", "patched_content": "<COMPLETE fixed file content>"}}]}}"""
+
+    results = [None] * len(batch)
+    _check_cooldown()
+    for attempt_model in (MODEL, FALLBACK_MODEL):
+        try:
+            _prompt_log.debug("\n=== GENERATE_BATCH_FIXES PROMPT ===\n%s", prompt)
+
+            llm = get_llm(model_name=attempt_model, temperature=0.1).bind(response_format={"type": "json_object"})
+            response = llm.invoke([_BATCH_SYSTEM_MESSAGE, HumanMessage(content=prompt)])
+            _note_success()
+
+            _raw_log.debug("\n[RAW LLM RESPONSE - BATCH]: %r", response.content)
+
+            if getattr(response, "response_metadata", {}).get("finish_reason") == "length":
+                print("[openrouter_tools] Batch response hit the token limit — falling back per file")
+                return results
+
+            data = json.loads(_strip_code_fences(response.content))
+            for entry in data.get("fixes", []):
+                idx = entry.get("id")
+                content = entry.get("patched_content")
+                if not (isinstance(idx, int) and 0 <= idx < len(batch) and isinstance(content, str) and content.strip()):
+                    continue
+                if _looks_truncated(batch[idx]["content"], content):
+                    print(f"[openrouter_tools] Batched fix for {batch[idx]['file']} looks cut off — discarding it")
+                    continue
+                results[idx] = content
+            return results
+        except Exception as e:
+            if _is_throttled(e):
+                raise _note_throttled() from e
+            print(f"[openrouter_tools] generate_batch_fixes failed with {attempt_model}: {e}")
+    return results
+
+
+def _test_style_instructions(framework: str, is_django: bool) -> str:
+    """Framework-specific rules shared by the single-file and batched test prompts."""
     if is_django:
         style_instructions = f"""\
 Use Django's test framework:
@@ -276,6 +716,20 @@ For Jest:
   - Use beforeEach/afterEach for setup/teardown
   - Use jest.fn() for mocks where needed (avoid mocking the whole module)
 Do NOT use Python syntax. Do NOT use unittest constructs. Pure JavaScript only."""
+    return style_instructions
+
+
+def generate_tests(
+    source_code: str,
+    file_path: str,
+    framework: str = "pytest",
+    is_django: bool = False,
+    settings_module: str = "",
+) -> str:
+    """
+    Generate a complete test file for the given source code using Gemini.
+    """
+    style_instructions = _test_style_instructions(framework, is_django)
 
     prompt = f"""\
 You are an expert software test engineer. Your task is to generate a COMPLETE, RUNNABLE test file for the source code shown below.
@@ -299,15 +753,86 @@ SOURCE CODE:
 
 Generate the complete test file now (raw code only, no ``` fences):"""
 
+    _check_cooldown()
     for attempt_model in (MODEL, FALLBACK_MODEL):
         try:
             llm = get_llm(model_name=attempt_model, temperature=0.1)
             response = llm.invoke([HumanMessage(content=prompt)])
+            _note_success()
             raw = response.content or ""
             if attempt_model != MODEL:
                 print(f"[openrouter_tools] generate_tests using fallback model {attempt_model}")
             return _strip_code_fences(raw)
         except Exception as e:
+            if _is_throttled(e):
+                raise _note_throttled() from e
             print(f"[openrouter_tools] generate_tests failed with {attempt_model}: {e}")
             if attempt_model == FALLBACK_MODEL:
                 return ""  # give up
+
+
+# <TEST path="...">...</TEST> blocks in a batched test-generation response
+_TEST_BLOCK_RE = re.compile(r'<TEST path="([^"]+)">\n?(.*?)</TEST>', re.DOTALL)
+
+
+def generate_tests_batch(
+    files: list[dict],
+    framework: str = "pytest",
+    is_django: bool = False,
+    settings_module: str = "",
+    context: str = "",
+) -> list:
+    """
+    Generate test files for several source files in ONE request.
+    files: [{ 'file_path', 'source_code' }, ...] — all sharing one framework.
+    context: optional project context (e.g. README) sent once for the whole batch.
+    Returns a list aligned with files — the test file content, or None for any
+    file missing from the response (callers fall back to generate_tests).
+    """
+    style_instructions = _test_style_instructions(framework, is_django)
+    file_blocks = "\n\n".join(
+        f'<FILE path="{item["file_path"]}">\n{item["source_code"][:4000]}\n</FILE>' for item in files
+    )
+    context_block = f"PROJECT CONTEXT (README):\n{context}\n\n" if context else ""
+
+    prompt = f"""\
+You are an expert software test engineer. Your task is to generate one COMPLETE, RUNNABLE test file for EACH source file below.
+
+FRAMEWORK RULES:
+{style_instructions}
+
+STRICT RULES:
+1. Generate REAL tests with REAL assertions — no placeholders like "assert True" or "pass".
+2. Test the actual public functions/classes/views visible in each source file.
+3. Cover at minimum: happy path, one edge case, and one failure/invalid-input case per function.
+4. Do NOT modify the source code. Do NOT mock the entire module under test.
+5. If a function has side effects (DB writes, file I/O), use setUp/tearDown or fixtures to isolate them.
+6. Every test function name must start with test_.
+7. Respond with one block per source file, exactly in this form and nothing else:
+<TEST path="<path of the source file>">
+<complete test file content, raw code, no ``` fences>
+</TEST>
+
+{context_block}SOURCE FILES:
+{file_blocks}
+
+Generate the test blocks now:"""
+
+    results = [None] * len(files)
+    index_by_path = {item["file_path"]: i for i, item in enumerate(files)}
+    _check_cooldown()
+    for attempt_model in (MODEL, FALLBACK_MODEL):
+        try:
+            llm = get_llm(model_name=attempt_model, temperature=0.1)
+            response = llm.invoke([HumanMessage(content=prompt)])
+            _note_success()
+            for path, body in _TEST_BLOCK_RE.findall(response.content or ""):
+                idx = index_by_path.get(path.strip())
+                if idx is not None and body.strip():
+                    results[idx] = _strip_code_fences(body)
+            return results
+        except Exception as e:
+            if _is_throttled(e):
+                raise _note_throttled() from e
+            print(f"[openrouter_tools] generate_tests_batch failed with {attempt_model}: {e}")
+    return results
@@ -0,0 +1,30 @@
+"""Per-run GitHub tokens, kept in process memory and out of graph state.
+
+Graph state is checkpointed to MongoDB, and LangGraph also copies string values
+from config["configurable"] into checkpoint metadata. So the user's PAT lives
+here, keyed by run_id: main.py registers it when a run starts (or is resumed
+with a token) and drops it once the run can no longer resume.
+"""
+
+import threading
+
+_TOKENS: dict[str, str] = {}
+_lock = threading.Lock()
+
+
+def set_run_token(run_id: str, github_token: str) -> None:
+    """Register the token a run authenticates with."""
+    with _lock:
+        _TOKENS[run_id] = github_token
+
+
+def get_run_token(run_id: str) -> str:
+    """The run's token, or "" if this process never saw one (e.g. resumed elsewhere)."""
+    with _lock:
+        return _TOKENS.get(run_id, "")
+
+
+def drop_run_token(run_id: str) -> None:
+    """Forget the run's token — called once the run has finished or been aborted."""
+    with _lock:
+        _TOKENS.pop(run_id, None)
@@ -1,52 +1,120 @@
 """Test runner tools — detect and execute test suites using subprocess."""
 
+import json
 import subprocess
 import os
 import sys
-from typing import Optional
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
 
+# Directories never worth descending into when looking for source/test files
+SKIP_DIRS = frozenset(("node_modules", ".git", "__pycache__", ".venv", "venv", ".tox", "dist", "build"))
 
-def detect_test_framework(repo_path: str) -> Optional[str]:
+# Root-level files that on their own mark a repo as pytest
+PYTEST_MARKERS = frozenset(("pytest.ini", "setup.cfg"))
+
+# Every root file detection branches on, stat'ed together when there is no scan to reuse
+_ROOT_MARKERS = (*sorted(PYTEST_MARKERS), "package.json")
+
+# package.json path → (mtime_ns, size, framework); detection runs several times per run.
+# Paths are per-run clones, so the map is an LRU capped at PKG_FRAMEWORK_CACHE_MAX.
+PKG_FRAMEWORK_CACHE_MAX = 256
+_PKG_FRAMEWORK_CACHE: OrderedDict[str, tuple[int, int, Optional[str]]] = OrderedDict()
+_pkg_framework_lock = threading.Lock()
+
+# Characters of each output stream kept while a suite runs — the tail, where the
+# summary is. Bounds memory on very verbose runs; the runner node keeps far less.
+MAX_CAPTURED_CHARS = 256 * 1024
+
+# Extensions collected by scan_repo — everything detection and discovery look at
+_SCANNED_EXTS = (".py", ".js", ".ts", ".jsx", ".tsx")
+
+
+@dataclass(slots=True)
+class RepoScan:
+    """Result of one walk over a repo, shared by framework detection and test discovery."""
+    root_files: set[str] = field(default_factory=set)                     # file names at the repo root
+    files_by_ext: dict[str, list[str]] = field(default_factory=dict)      # ext → absolute paths
+
+
+def _iter_repo_files(repo_path: str) -> Iterator[tuple[bool, os.DirEntry]]:
+    """Lazily yield (at_root, entry) for every file, skipping SKIP_DIRS.
+
+    os.scandir walk in os.walk's top-down order: file vs. directory comes from
+    the cached DirEntry type and paths from entry.path, so no per-entry stat()
+    or path join. Being a generator, callers can stop at the first match.
+    """
+    stack = [repo_path]
+    while stack:
+        current = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir():
+                # like os.walk, never descend into symlinked directories
+                if entry.name not in SKIP_DIRS and not entry.is_symlink():
+                    subdirs.append(entry.path)
+                continue
+            yield current is repo_path, entry
+        stack.extend(reversed(subdirs))
+
+
+def scan_repo(repo_path: str) -> RepoScan:
+    """Walk the repo once, bucketing files by extension (skipping SKIP_DIRS)."""
+    scan = RepoScan(files_by_ext={ext: [] for ext in _SCANNED_EXTS})
+    for at_root, entry in _iter_repo_files(repo_path):
+        if at_root:
+            scan.root_files.add(entry.name)
+        bucket = scan.files_by_ext.get(os.path.splitext(entry.name)[1])
+        if bucket is not None:
+            bucket.append(entry.path)
+    return scan
+
+
+def _is_pytest_file(name: str) -> bool:
+    return name.startswith("test_") or name.endswith("_test.py")
+
+
+def detect_test_framework(repo_path: str, scan: Optional[RepoScan] = None) -> Optional[str]:
     """
     Auto-detect the test framework by scanning for config files and test directories.
     Returns: 'pytest' | 'jest' | 'vitest' | 'mocha' | None
 
     Returns None when no strong signal exists — callers must NOT default to pytest.
+    Pass a RepoScan to reuse an existing walk instead of walking the tree again.
     """
-    # Check for Python tests (pytest)
-    if (
-        os.path.exists(os.path.join(repo_path, "pytest.ini"))
-        or os.path.exists(os.path.join(repo_path, "setup.cfg"))
-        or any(
-            os.path.basename(f).startswith("test_") or f.endswith("_test.py")
-            for f in _walk_files(repo_path, ".py")
-        )
-    ):
-        return "pytest"
+    if scan is None:
+        # No walk to reuse: stat the root markers concurrently (one round-trip of
+        # latency on network filesystems), then stop the walk at the first test
+        # file instead of listing the whole tree
+        with ThreadPoolExecutor(max_workers=len(_ROOT_MARKERS)) as ex:
+            found = dict(zip(_ROOT_MARKERS, ex.map(
+                os.path.isfile, (os.path.join(repo_path, m) for m in _ROOT_MARKERS),
+            )))
+        if any(found[m] for m in PYTEST_MARKERS) or any(
+            entry.name.endswith(".py") and _is_pytest_file(entry.name)
+            for _, entry in _iter_repo_files(repo_path)
+        ):
+            return "pytest"
+        has_package_json = found["package.json"]
+    else:
+        # Check for Python tests (pytest)
+        if not PYTEST_MARKERS.isdisjoint(scan.root_files) or any(
+            _is_pytest_file(os.path.basename(f)) for f in scan.files_by_ext[".py"]
+        ):
+            return "pytest"
+        has_package_json = "package.json" in scan.root_files
 
     # Check for JS frameworks (Jest / Vitest / Mocha) via package.json
-    pkg_json = os.path.join(repo_path, "package.json")
-    if os.path.exists(pkg_json):
-        try:
-            import json
-            with open(pkg_json, "r", encoding="utf-8") as f:
-                pkg = json.load(f)
-        except (json.JSONDecodeError, OSError):
-            # Malformed or unreadable package.json — can't detect framework
-            return None
-
-        deps = {**pkg.get("dependencies", {}), **pkg.get("devDependencies", {})}
-        test_script = pkg.get("scripts", {}).get("test", "")
-
-        # Vitest (check before Jest — vitest repos sometimes also have jest as transitive dep)
-        if "vitest" in deps or "vitest" in test_script:
-            return "vitest"
-
-        if "jest" in deps or "jest" in test_script:
-            return "jest"
-
-        if "mocha" in deps:
-            return "mocha"
+    if has_package_json:
+        return detect_js_test_framework(repo_path)
 
     return None
 
@@ -58,37 +126,58 @@ def detect_js_test_framework(repo_path: str) -> Optional[str]:
     Used by test_generator_agent to gate JS test generation.
     """
     pkg_json = os.path.join(repo_path, "package.json")
-    if not os.path.exists(pkg_json):
+    try:
+        st = os.stat(pkg_json)
+    except OSError:
         return None
 
+    with _pkg_framework_lock:
+        cached = _PKG_FRAMEWORK_CACHE.get(pkg_json)
+        if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+            _PKG_FRAMEWORK_CACHE.move_to_end(pkg_json)
+            return cached[2]
+
     try:
-        import json
         with open(pkg_json, "r", encoding="utf-8") as f:
             pkg = json.load(f)
     except (json.JSONDecodeError, OSError):
+        # Malformed or unreadable package.json — can't detect framework
         return None
 
-    deps = {**pkg.get("dependencies", {}), **pkg.get("devDependencies", {})}
+    deps = pkg.get("dependencies", {}) | pkg.get("devDependencies", {})
     test_script = pkg.get("scripts", {}).get("test", "")
 
+    # Vitest (check before Jest — vitest repos sometimes also have jest as transitive dep)
     if "vitest" in deps or "vitest" in test_script:
-        return "vitest"
-    if "jest" in deps or "jest" in test_script:
-        return "jest"
-    if "mocha" in deps:
-        return "mocha"
-    return None
+        framework = "vitest"
+    elif "jest" in deps or "jest" in test_script:
+        framework = "jest"
+    elif "mocha" in deps:
+        framework = "mocha"
+    else:
+        framework = None
+    with _pkg_framework_lock:
+        _PKG_FRAMEWORK_CACHE.pop(pkg_json, None)
+        _PKG_FRAMEWORK_CACHE[pkg_json] = (st.st_mtime_ns, st.st_size, framework)
+        while len(_PKG_FRAMEWORK_CACHE) > PKG_FRAMEWORK_CACHE_MAX:
+            _PKG_FRAMEWORK_CACHE.popitem(last=False)
+    return framework
 
 
-def discover_test_files(repo_path: str, framework: str) -> list[str]:
+def discover_test_files(repo_path: str, framework: str, scan: Optional[RepoScan] = None) -> list[str]:
     """Discover test files based on the framework conventions.
 
     Returns an empty list for unknown/unsupported frameworks.
+    Pass a RepoScan to reuse an existing walk instead of walking the tree again.
     """
     test_files = []
+    if framework not in ("pytest", "jest", "vitest", "mocha"):
+        return test_files
+    if scan is None:
+        scan = scan_repo(repo_path)
 
     if framework == "pytest":
-        for f in _walk_files(repo_path, ".py"):
+        for f in scan.files_by_ext[".py"]:
             basename = os.path.basename(f)
             # Matches: test_*.py  *_test.py  tests.py (Django default)
             if (
@@ -100,7 +189,7 @@ def discover_test_files(repo_path: str, framework: str) -> list[str]:
 
     elif framework in ("jest", "vitest", "mocha"):
         for ext in (".js", ".ts", ".jsx", ".tsx"):
-            for f in _walk_files(repo_path, ext):
+            for f in scan.files_by_ext[ext]:
                 basename = os.path.basename(f)
                 if ".test." in basename or ".spec." in basename or "/__tests__/" in f.replace("\\", "/"):
                     test_files.append(os.path.relpath(f, repo_path))
@@ -109,12 +198,26 @@ def discover_test_files(repo_path: str, framework: str) -> list[str]:
     return test_files
 
 
+def _drain_tail(stream, tail: deque, max_chars: int = MAX_CAPTURED_CHARS) -> None:
+    """Read stream line by line as it is produced, keeping only its last ~max_chars characters."""
+    size = 0
+    with stream:
+        for line in stream:
+            tail.append(line)
+            size += len(line)
+            while size > max_chars and len(tail) > 1:
+                size -= len(tail.popleft())
+
+
 def run_tests(repo_path: str, framework: str) -> dict:
     """
     Run the test suite and capture output.
     Returns: { 'returncode': int, 'stdout': str, 'stderr': str, 'passed': bool }
 
-    For unknown/unsupported frameworks, returns a structured error without crashing.
+    stdout/stderr are streamed while the suite runs and only their last
+    MAX_CAPTURED_CHARS characters are kept, so a huge verbose run cannot
+    balloon memory. For unknown/unsupported frameworks, returns a structured
+    error without crashing.
     """
     # Use sys.executable to ensure we run in the correct venv
     # On Windows, npx needs the .cmd extension for subprocess to find it
@@ -141,19 +244,37 @@ def run_tests(repo_path: str, framework: str) -> dict:
         env = os.environ.copy()
         env["PYTHONPATH"] = repo_path
 
-        result = subprocess.run(
+        proc = subprocess.Popen(
             cmd,
             cwd=repo_path,
             env=env,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
-            timeout=300,  # 5 minute timeout
+            errors="replace",
         )
+        stdout_tail, stderr_tail = deque(), deque()
+        readers = [
+            threading.Thread(target=_drain_tail, args=(proc.stdout, stdout_tail), daemon=True),
+            threading.Thread(target=_drain_tail, args=(proc.stderr, stderr_tail), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        try:
+            returncode = proc.wait(timeout=300)  # 5 minute timeout
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            for reader in readers:
+                # a grandchild still holding the pipes must not hang us past the kill
+                reader.join(timeout=5)
         return {
-            "returncode": result.returncode,
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "passed": result.returncode == 0,
+            "returncode": returncode,
+            "stdout": "".join(stdout_tail),
+            "stderr": "".join(stderr_tail),
+            "passed": returncode == 0,
         }
     except subprocess.TimeoutExpired:
         return {
@@ -169,18 +290,3 @@ def run_tests(repo_path: str, framework: str) -> dict:
             "stderr": str(e),
             "passed": False,
         }
-
-
-def _walk_files(root: str, extension: str) -> list[str]:
-    """Walk a directory tree and return files matching the extension."""
-    matches = []
-    for dirpath, dirnames, filenames in os.walk(root):
-        # Skip common non-source directories
-        dirnames[:] = [
-            d for d in dirnames
-            if d not in ("node_modules", ".git", "__pycache__", ".venv", "venv", ".tox", "dist", "build")
-        ]
-        for f in filenames:
-            if f.endswith(extension):
-                matches.append(os.path.join(dirpath, f))
-    return matches
@@ -20,10 +20,10 @@ export async function runAgent(payload) {
 }
 
 /**
- * GET /api/status/:runId
+ * GET /api/status/:runId?since=N — logs holds only the lines from index N on
  */
-export async function getStatus(runId) {
-    const { data } = await api.get(`/status/${runId}`);
+export async function getStatus(runId, since = 0) {
+    const { data } = await api.get(`/status/${runId}`, { params: { since } });
     return data;
 }
 
@@ -38,9 +38,16 @@ const useAgentStore = create((set, get) => ({
             if (!runId) return;
 
             try {
-                const statusRes = await getStatus(runId);
+                // Only fetch log lines we don't have yet; slicing to `since` keeps
+                // the append idempotent if two polls overlap
+                const since = get().logs.length;
+                const statusRes = await getStatus(runId, since);
                 const newStatus = statusRes.status;
-                set({ status: newStatus, currentStep: statusRes.currentStep, logs: statusRes.logs || [] });
+                set({
+                    status: newStatus,
+                    currentStep: statusRes.currentStep,
+                    logs: [...get().logs.slice(0, since), ...(statusRes.logs || [])],
+                });
 
                 if (TERMINAL_STATUSES.has(newStatus)) {
                     // Attempt to fetch full results (may or may not exist)